@@ -0,0 +1,105 @@
+"""
+Рассылка через лимитер исходящих сообщений против заглушки Bot API с флуд-контролем
+
+Запуск:
+    python -m benchmarks.broadcast_test --chats 300 --interactive 30
+    python -m benchmarks.broadcast_test --no-limit   # без лимитера, для сравнения
+
+Заглушка отвечает 429 (retry_after) при превышении глобального темпа и темпа
+в чат. Одновременно с массовой рассылкой идут интерактивные ответы: у них
+приоритет выше, и их задержка не должна расти вместе с очередью рассылки.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.environ.setdefault("BOT_TOKEN", "42:BROADCAST")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+from benchmarks.load_test import percentile
+
+async def run(chats: int, messages_per_chat: int, interactive: int, limited: bool,
+              global_rate: float, chat_rate: float) -> dict:
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.exceptions import TelegramRetryAfter
+    from benchmarks.fake_bot_api import FakeBotAPI
+    from core.sender import OutboundRateLimiter, bulk_sending
+
+    api = FakeBotAPI(flood_global_rate=global_rate, flood_chat_rate=chat_rate)
+    await api.start()
+    bot = Bot(token=os.environ["BOT_TOKEN"],
+              session=AiohttpSession(api=TelegramAPIServer.from_base(api.base_url)))
+    limiter = OutboundRateLimiter()
+    if limited:
+        bot.session.middleware(limiter)
+
+    bulk_latency: List[float] = []
+    interactive_latency: List[float] = []
+    failed = 0
+
+    async def send(chat_id: int, latencies: List[float]):
+        nonlocal failed
+        started = time.monotonic()
+        try:
+            await bot.send_message(chat_id, "⏰ Напоминание")
+            latencies.append(time.monotonic() - started)
+        except TelegramRetryAfter:
+            failed += 1
+
+    async def bulk(chat_id: int):
+        with bulk_sending():
+            for _ in range(messages_per_chat):
+                await send(chat_id, bulk_latency)
+
+    async def interactive_user(index: int):
+        # Ответы пользователям равномерно на фоне рассылки
+        await asyncio.sleep(index * 0.2)
+        await send(1_000_000 + index, interactive_latency)
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(bulk(chat_id) for chat_id in range(1, chats + 1)),
+        *(interactive_user(index) for index in range(interactive)),
+    )
+    elapsed = time.perf_counter() - started
+
+    await bot.session.close()
+    await api.stop()
+
+    delivered = len(bulk_latency) + len(interactive_latency)
+    return {
+        "limited": limited,
+        "messages": chats * messages_per_chat + interactive,
+        "delivered": delivered,
+        "failed": failed,
+        "flood_429": api.flood_errors,
+        "elapsed_s": round(elapsed, 2),
+        "delivered_per_s": round(delivered / elapsed, 1) if elapsed else 0.0,
+        "bulk_ms": {f"p{pct}": round(percentile(bulk_latency, pct) * 1000, 1) for pct in (50, 95, 99)},
+        "interactive_ms": {f"p{pct}": round(percentile(interactive_latency, pct) * 1000, 1) for pct in (50, 95, 99)},
+        "limiter": limiter.stats() if limited else None,
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест лимитера исходящих сообщений")
+    parser.add_argument("--chats", type=int, default=300, help="Число чатов в рассылке")
+    parser.add_argument("--per-chat", type=int, default=2, help="Сообщений рассылки в каждый чат")
+    parser.add_argument("--interactive", type=int, default=30, help="Интерактивных ответов на фоне рассылки")
+    parser.add_argument("--flood-global", type=float, default=30, help="Глобальный лимит заглушки, сообщений/с")
+    parser.add_argument("--flood-chat", type=float, default=3, help="Лимит заглушки на чат, сообщений/с")
+    parser.add_argument("--no-limit", action="store_true", help="Отправлять без лимитера")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(run(args.chats, args.per_chat, args.interactive, not args.no_limit,
+                             args.flood_global, args.flood_chat))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
@@ -0,0 +1,236 @@
+"""
+Локальная заглушка Telegram Bot API для нагрузочных тестов
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Dict, List, Optional
+
+from aiohttp import web
+
+# Методы, ответ на которые считается ответом бота пользователю
+REPLY_METHODS = {"sendMessage", "editMessageText", "editMessageReplyMarkup"}
+
+class FakeBotAPI:
+    """aiohttp-сервер: отдает апдейты (getUpdates или webhook) и записывает исходящие вызовы бота"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 flood_global_rate: Optional[float] = None, flood_chat_rate: Optional[float] = None):
+        self.host = host
+        self.port = port
+        # Имитация флуд-контроля Telegram: 429 при превышении темпа (None - выключено)
+        self.flood_global_rate = flood_global_rate
+        self.flood_chat_rate = flood_chat_rate
+        self._sent_global: deque = deque()
+        self._sent_by_chat: Dict[int, deque] = {}
+        self.flood_errors = 0
+
+        # Режим webhook: после setWebhook апдейты отправляются POST-запросом боту
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self.webhook_retries = 0
+        self._client = None
+        self._deliveries: set = set()
+        self._updates: deque = deque()
+        self._updates_ready = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+
+        # Время выдачи апдейта боту: update_id -> monotonic
+        self.delivered_at: Dict[int, float] = {}
+        self.calls = Counter()
+        # Подписчик на ответы бота: (method, params, timestamp)
+        self.on_reply: Optional[Callable[[str, Dict[str, Any], float], None]] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    # --- Управление ---
+
+    async def start(self):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # port=0 - свободный порт, выбранный ОС
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._deliveries:
+            await asyncio.gather(*self._deliveries, return_exceptions=True)
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    # --- Генерация апдейтов ---
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def _chat(self, user_id: int) -> dict:
+        return {"id": user_id, "type": "private", "first_name": f"User{user_id}"}
+
+    def push_message(self, user_id: int, text: str) -> int:
+        """Поставить в очередь текстовое сообщение от пользователя"""
+        update_id = next(self._update_ids)
+        self._push({
+            "update_id": update_id,
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": self._chat(user_id),
+                "from": self._user(user_id),
+                "text": text,
+            },
+        })
+        return update_id
+
+    def push_callback(self, user_id: int, data: str, message_id: int = 1) -> int:
+        """Поставить в очередь нажатие inline-кнопки"""
+        update_id = next(self._update_ids)
+        self._push({
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": self._chat(user_id),
+                    "text": "…",
+                },
+            },
+        })
+        return update_id
+
+    def _push(self, update: dict):
+        if self.webhook_url:
+            task = asyncio.create_task(self._deliver_webhook(update))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+            return
+        self._updates.append(update)
+        self._updates_ready.set()
+
+    async def _deliver_webhook(self, update: dict):
+        """Как Telegram: повторять доставку, пока бот не ответит 2xx"""
+        from aiohttp import ClientSession
+
+        if self._client is None:
+            self._client = ClientSession()
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret} if self.webhook_secret else {}
+        self.delivered_at.setdefault(update["update_id"], time.monotonic())
+        while True:
+            async with self._client.post(self.webhook_url, json=update, headers=headers) as response:
+                if response.status < 300:
+                    return
+            self.webhook_retries += 1
+            await asyncio.sleep(0.1)
+
+    # --- Bot API ---
+
+    async def _read_params(self, request: web.Request) -> Dict[str, Any]:
+        if request.content_type == "application/json":
+            return await request.json()
+        form = await request.post()
+        params = {}
+        for key, value in form.items():
+            if isinstance(value, str) and value[:1] in "{[":
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            params[key] = value
+        return params
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await self._read_params(request)
+        self.calls[method] += 1
+
+        if method == "getUpdates":
+            result = await self._get_updates(params)
+        elif method == "setWebhook":
+            self.webhook_url = params.get("url")
+            self.webhook_secret = params.get("secret_token")
+            result = True
+        elif method == "deleteWebhook":
+            self.webhook_url = None
+            result = True
+        elif method == "getMe":
+            result = {"id": 42, "is_bot": True, "first_name": "Milana", "username": "milana_test_bot"}
+        elif method in REPLY_METHODS:
+            chat_id = int(params.get("chat_id", 0))
+            retry_after = self._flood_check(chat_id)
+            if retry_after:
+                self.flood_errors += 1
+                return web.json_response({
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                })
+            result = {
+                "message_id": int(params.get("message_id") or next(self._message_ids)),
+                "date": int(time.time()),
+                "chat": self._chat(chat_id),
+                "text": params.get("text", ""),
+            }
+            if self.on_reply is not None:
+                self.on_reply(method, params, time.monotonic())
+        else:
+            # answerCallbackQuery, deleteWebhook, setWebhook и прочие
+            result = True
+
+        return web.json_response({"ok": True, "result": result})
+
+    def _flood_check(self, chat_id: int) -> int:
+        """Скользящее окно в 1 с: retry_after, если темп превышен, иначе 0"""
+        now = time.monotonic()
+        windows = []
+        if self.flood_global_rate:
+            windows.append((self._sent_global, self.flood_global_rate))
+        if self.flood_chat_rate:
+            windows.append((self._sent_by_chat.setdefault(chat_id, deque()), self.flood_chat_rate))
+
+        for window, rate in windows:
+            while window and window[0] <= now - 1:
+                window.popleft()
+            if len(window) >= rate:
+                return 1
+        for window, _ in windows:
+            window.append(now)
+        return 0
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[dict]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+
+        # Подтвержденные апдейты (id < offset) удаляем
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+
+        if not self._updates and timeout:
+            self._updates_ready.clear()
+            try:
+                await asyncio.wait_for(self._updates_ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+
+        batch = list(itertools.islice(self._updates, limit))
+        now = time.monotonic()
+        for update in batch:
+            self.delivered_at.setdefault(update["update_id"], now)
+        return batch
@@ -0,0 +1,90 @@
+"""
+Микробенчмарк клавиатур: сборка заново на каждый ответ против готовых экземпляров
+
+Запуск:
+    python -m benchmarks.keyboards_bench --calls 20000
+
+Для каждой клавиатуры из utils/keyboards.py сравнивается сборка с нуля
+(``_build_*`` или функция без lru_cache) и то, что теперь отдают
+``get_*``: время на вызов и память, которую держит один результат
+(объекты разметки, кнопок и строк callback_data).
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+def measure(factory: Callable[[], object], calls: int) -> Dict[str, float]:
+    """мкс на вызов и байт, удерживаемых одним результатом"""
+    factory()  # прогрев
+
+    started = time.perf_counter()
+    for _ in range(calls):
+        factory()
+    elapsed = time.perf_counter() - started
+
+    # Результаты держим в списке, иначе память освободится сразу после вызова
+    sample = min(calls, 2000)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    results = [factory() for _ in range(sample)]
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del results
+
+    return {"us_per_call": round(elapsed / calls * 1e6, 2), "bytes_per_call": round(retained / sample)}
+
+def run(calls: int, habits: int) -> dict:
+    from utils import keyboards
+
+    habit_rows = [(habit_id, f"Привычка {habit_id}", habit_id % 30) for habit_id in range(1, habits + 1)]
+    habit_key = tuple(habit_rows)
+    settings = {"notifications": True, "notification_time": "09:00", "timezone": "Europe/Moscow"}
+    settings_key = (True, "09:00", "Europe/Moscow")
+
+    cases = {
+        "main_menu": (keyboards._build_main_menu, keyboards.get_main_menu),
+        "frequency": (keyboards._build_frequency_keyboard, keyboards.get_frequency_keyboard),
+        "cancel": (keyboards._build_cancel_keyboard, keyboards.get_cancel_keyboard),
+        "zodiac_signs": (keyboards._build_zodiac_signs, keyboards.get_zodiac_signs),
+        "news_categories": (keyboards._build_news_categories, keyboards.get_news_categories),
+        "habits_menu": (lambda: keyboards._habits_menu.__wrapped__(habit_key),
+                        lambda: keyboards.get_habits_menu(habit_rows)),
+        "habit_confirmation": (lambda: keyboards.get_habit_confirmation.__wrapped__(7, "Спорт"),
+                               lambda: keyboards.get_habit_confirmation(7, "Спорт")),
+        "settings_menu": (lambda: keyboards._settings_menu.__wrapped__(*settings_key),
+                          lambda: keyboards.get_settings_menu(settings)),
+    }
+
+    report = {}
+    for name, (rebuild, cached) in cases.items():
+        report[name] = {"rebuild": measure(rebuild, calls), "cached": measure(cached, calls)}
+
+    # Типичный апдейт отвечает одной клавиатурой: усредняем по всем
+    count = len(report)
+    report["per_update_avg"] = {
+        mode: {
+            key: round(sum(case[mode][key] for case in report.values()) / count, 2)
+            for key in ("us_per_call", "bytes_per_call")
+        }
+        for mode in ("rebuild", "cached")
+    }
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Микробенчмарк сборки клавиатур")
+    parser.add_argument("--calls", type=int, default=20000, help="Вызовов на клавиатуру")
+    parser.add_argument("--habits", type=int, default=5, help="Привычек в меню трекера")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(json.dumps(run(args.calls, args.habits), ensure_ascii=False, indent=2))
@@ -0,0 +1,278 @@
+"""
+Нагрузочный тест бота против локальной заглушки Bot API
+
+Запуск:
+    python -m benchmarks.load_test --users 2000 --rounds 3
+    python -m benchmarks.load_test --mode both   # polling и webhook для сравнения
+
+Бот поднимается в этом же процессе (тот же диспетчер, что и в main.py) на
+временной SQLite-базе. Каждый виртуальный пользователь проходит сценарий
+/start -> "📊 Трекер привычек" -> создание привычки через HabitStates ->
+отметка выполнения, следующий шаг отправляется только после ответа бота.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def find_callbacks(params: dict, payload_class: type) -> List[str]:
+    """callback_data всех inline-кнопок ответа с payload'ом типа payload_class"""
+    from utils.callbacks import decode_callback
+
+    markup = params.get("reply_markup") or {}
+    rows = markup.get("inline_keyboard", []) if isinstance(markup, dict) else []
+    return [
+        button["callback_data"]
+        for row in rows for button in row
+        if isinstance(decode_callback(button.get("callback_data")), payload_class)
+    ]
+
+class ScenarioAborted(Exception):
+    """Бот не ответил вовремя: дальнейшие шаги сценария потеряли смысл"""
+
+class LoadTest:
+    """Сценарии пользователей, сбор задержек и числа SQL-запросов"""
+
+    def __init__(self, users: int, rounds: int, reply_timeout: float, concurrency: int, mode: str = "polling"):
+        self.users = users
+        self.mode = mode
+        self.rounds = rounds
+        self.reply_timeout = reply_timeout
+        self.concurrency = concurrency
+
+        self.api = None
+        self.latencies: List[float] = []
+        self.end_to_end: List[float] = []
+        self.timeouts = 0
+        self.queries = 0
+        self._waiters: Dict[int, asyncio.Future] = {}
+
+    # --- Окружение ---
+
+    def _prepare_environment(self, workdir: str):
+        """Временная БД: main.py жестко задает data/milana.db относительно cwd"""
+        os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+        os.chdir(workdir)
+        sys.path.insert(0, REPO_ROOT)
+        os.environ.setdefault("BOT_TOKEN", "42:LOADTEST")
+        os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///data/milana.db")
+
+    async def _create_schema(self):
+        import models
+        from core.database import engine
+
+        async with engine.begin() as conn:
+            await conn.run_sync(models.Base.metadata.create_all)
+
+    def _count_queries(self):
+        from sqlalchemy import event
+        from core.database import engine, read_engine
+
+        def before_cursor_execute(*args):
+            self.queries += 1
+
+        for target in (engine, read_engine):
+            event.listen(target.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+    def _on_reply(self, method: str, params: dict, timestamp: float):
+        waiter = self._waiters.pop(int(params.get("chat_id", 0)), None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result((params, timestamp))
+
+    # --- Сценарий пользователя ---
+
+    async def _step(self, user_id: int, push) -> dict:
+        """Отправить апдейт и дождаться ответа бота в этот чат"""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[user_id] = waiter
+        pushed_at = time.monotonic()
+        update_id = push()
+        try:
+            params, replied_at = await asyncio.wait_for(waiter, self.reply_timeout)
+        except asyncio.TimeoutError:
+            self._waiters.pop(user_id, None)
+            self.timeouts += 1
+            raise ScenarioAborted(user_id)
+
+        self.latencies.append(replied_at - self.api.delivered_at.get(update_id, pushed_at))
+        self.end_to_end.append(replied_at - pushed_at)
+        return params
+
+    async def _run_user(self, user_id: int, slots: asyncio.Semaphore):
+        async with slots:
+            try:
+                await self._scenario(user_id)
+            except ScenarioAborted:
+                pass
+
+    async def _scenario(self, user_id: int):
+        from utils.callbacks import HabitComplete
+
+        api = self.api
+        message = lambda text: self._step(user_id, lambda: api.push_message(user_id, text))
+        callback = lambda data: self._step(user_id, lambda: api.push_callback(user_id, data))
+
+        await message("/start")
+        await message("📊 Трекер привычек")
+
+        # Создание привычки: все шаги HabitStates
+        await callback("habit_add")
+        await message(f"Привычка {user_id}")
+        await message("Для здоровья")
+        await message("📅 Каждый день")
+        await message("1")
+        await message("30")
+        await callback("confirm_habit")
+
+        for _ in range(self.rounds):
+            reply = await message("📊 Трекер привычек")
+            targets = find_callbacks(reply, HabitComplete)
+            if targets:
+                await callback(targets[0])
+
+    # --- Запуск ---
+
+    async def run(self, workdir: str) -> dict:
+        self._prepare_environment(workdir)
+
+        from aiogram import Bot
+        from aiogram.client.bot import DefaultBotProperties
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+        from benchmarks.fake_bot_api import FakeBotAPI
+        from core.database import dispose_engines
+        from core.metrics import metrics
+        from core.webhook import WebhookServer
+        from core.writer import db_writer
+        import main as bot_main
+
+        # main.py включает INFO-логи на каждый апдейт - в замерах они только шумят
+        logging.getLogger().setLevel(logging.WARNING)
+        await self._create_schema()
+        self._count_queries()
+
+        self.api = FakeBotAPI()
+        self.api.on_reply = self._on_reply
+        await self.api.start()
+
+        bot = Bot(
+            token=os.environ["BOT_TOKEN"],
+            session=AiohttpSession(api=TelegramAPIServer.from_base(self.api.base_url)),
+            default=DefaultBotProperties(parse_mode="HTML"),
+        )
+        dp = bot_main.build_dispatcher()
+        db_writer.start()
+        if self.mode == "webhook":
+            webhook = WebhookServer(dp, bot)
+            port = await webhook.start("127.0.0.1", 0)
+            await bot.set_webhook(f"http://127.0.0.1:{port}{webhook.path}")
+        else:
+            polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=1))
+
+        # Одновременно активны не больше concurrency пользователей
+        slots = asyncio.Semaphore(self.concurrency)
+        started = time.perf_counter()
+        await asyncio.gather(*(self._run_user(user_id, slots) for user_id in range(1, self.users + 1)))
+        elapsed = time.perf_counter() - started
+
+        if self.mode == "webhook":
+            await webhook.stop()
+        else:
+            await dp.stop_polling()
+            await polling
+        await bot.session.close()
+        await db_writer.stop()
+        await self.api.stop()
+        await dispose_engines()
+
+        updates = len(self.latencies) + self.timeouts
+        return {
+            "mode": self.mode,
+            "users": self.users,
+            "concurrency": self.concurrency,
+            "updates": updates,
+            "timeouts": self.timeouts,
+            "elapsed_s": round(elapsed, 3),
+            "updates_per_s": round(updates / elapsed, 1) if elapsed else 0.0,
+            "latency_ms": {
+                f"p{pct}": round(percentile(self.latencies, pct) * 1000, 2) for pct in (50, 95, 99)
+            },
+            "end_to_end_ms": {
+                f"p{pct}": round(percentile(self.end_to_end, pct) * 1000, 2) for pct in (50, 95, 99)
+            },
+            "db_queries_per_update": round(self.queries / updates, 2) if updates else 0.0,
+            "bot_api_calls": dict(self.api.calls),
+            # Серверная сторона: гистограммы из MetricsMiddleware
+            "handlers": {
+                name: {"count": count, "p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "queries": round(queries, 2)}
+                for name, count, p50, p95, p99, queries in metrics.top_handlers(limit=50)
+            },
+            "n_plus_one_updates": metrics.n_plus_one_total,
+        }
+
+def print_report(report: dict):
+    print("📊 Результаты нагрузочного теста")
+    print(f"   Режим:               {report['mode']}")
+    print(f"   Пользователи:        {report['users']} (одновременно: {report['concurrency']})")
+    print(f"   Апдейты:             {report['updates']} (таймаутов: {report['timeouts']})")
+    print(f"   Время:               {report['elapsed_s']} с")
+    print(f"   Пропускная способн.: {report['updates_per_s']} апдейтов/с")
+    latency = report["latency_ms"]
+    print(f"   Задержка обработки:  p50={latency['p50']} мс  p95={latency['p95']} мс  p99={latency['p99']} мс")
+    e2e = report["end_to_end_ms"]
+    print(f"   Сквозная задержка:   p50={e2e['p50']} мс  p95={e2e['p95']} мс  p99={e2e['p99']} мс")
+    print(f"   SQL на апдейт:       {report['db_queries_per_update']}")
+    print(f"   Вызовы Bot API:      {report['bot_api_calls']}")
+    print(f"   Подозрений на N+1:   {report['n_plus_one_updates']}")
+    print("   Обработчики (p50 / p95 / p99 мс, SQL на апдейт):")
+    for name, row in report["handlers"].items():
+        print(f"     {name:<24} ×{row['count']:<6} {row['p50_ms']:g} / {row['p95_ms']:g} / {row['p99_ms']:g}, {row['queries']}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест Milana AI")
+    parser.add_argument("--users", type=int, default=1000, help="Число виртуальных пользователей")
+    parser.add_argument("--rounds", type=int, default=3, help="Сколько раз каждый открывает список и отмечает привычку")
+    parser.add_argument("--concurrency", type=int, default=100, help="Сколько пользователей активны одновременно")
+    parser.add_argument("--reply-timeout", type=float, default=30.0, help="Таймаут ожидания ответа бота, с")
+    parser.add_argument("--mode", choices=["polling", "webhook", "both"], default="polling",
+                        help="Как бот получает апдейты; both - два прогона подряд для сравнения")
+    parser.add_argument("--json", action="store_true", help="Вывести отчет в JSON")
+    return parser.parse_args()
+
+def run_mode(args, mode: str) -> dict:
+    with tempfile.TemporaryDirectory(prefix="milana-load-") as workdir:
+        return asyncio.run(LoadTest(args.users, args.rounds, args.reply_timeout, args.concurrency, mode).run(workdir))
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.mode == "both":
+        # Второй прогон в отдельном процессе: движки БД и метрики - глобальные объекты модулей
+        import subprocess
+        reports = [run_mode(args, "polling")]
+        command = [sys.executable, "-m", "benchmarks.load_test", "--mode", "webhook", "--json",
+                   "--users", str(args.users), "--rounds", str(args.rounds),
+                   "--concurrency", str(args.concurrency), "--reply-timeout", str(args.reply_timeout)]
+        output = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout
+        reports.append(json.loads(output[output.index("{"):]))
+    else:
+        reports = [run_mode(args, args.mode)]
+
+    if args.json:
+        print(json.dumps(reports if len(reports) > 1 else reports[0], ensure_ascii=False, indent=2))
+    else:
+        for report in reports:
+            print_report(report)
@@ -10,6 +10,85 @@ class Settings(BaseSettings):
     OPENROUTER_MODEL: str = "google/gemma-2-9b-it:free"
     ADMIN_IDS: List[int] = Field(default_factory=list)
     
+    # Профиль SQLite (применяется к каждому соединению)
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_CACHE_SIZE_KB: int = 16384  # cache_size в KiB (передается как отрицательное число)
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    
+    # Пулы соединений: запись и отдельный пул только для чтения
+    DB_WRITE_POOL_SIZE: int = 1
+    DB_READ_POOL_SIZE: int = 4
+    DB_POOL_TIMEOUT: int = 30
+    
+    # Единственный писатель: окно группового коммита и размер пачки
+    DB_WRITER_BATCH_WINDOW_MS: int = 5
+    DB_WRITER_MAX_BATCH: int = 200
+    DB_WRITER_QUEUE_SIZE: int = 10000
+    
+    # Кэш идентичности пользователей (telegram_id -> снимок users)
+    USER_CACHE_SIZE: int = 50000
+    USER_CACHE_TTL: int = 300
+    
+    # Список привычек: привычек на странице
+    HABITS_PAGE_SIZE: int = 10
+    
+    # Рейтинг по XP: топ в памяти, строк в ответе, соседей сверху и снизу, пересборка из БД
+    LEADERBOARD_TOP_K: int = 100
+    LEADERBOARD_SHOW: int = 10
+    LEADERBOARD_NEIGHBORS: int = 2
+    LEADERBOARD_REFRESH_SECONDS: int = 900
+    
+    # Апдейты одного пользователя по очереди: шардов блокировок и ожидание, с
+    USER_LOCKS_ENABLED: bool = True
+    USER_LOCK_SHARDS: int = 1024
+    USER_LOCK_TIMEOUT: float = 30.0
+    
+    # Метрики: локальный эндпоинт /metrics (0 - выключен) и порог SQL-запросов на апдейт для N+1
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 0
+    PERF_QUERY_THRESHOLD: int = 10
+    
+    # Напоминания о привычках: планировщик в процессе бота
+    REMINDERS_ENABLED: bool = True
+    REMINDER_SEND_CONCURRENCY: int = 20
+    
+    # Ночной сброс прерванных стриков (час по местному времени пользователя)
+    STREAK_ROLLOVER_ENABLED: bool = True
+    STREAK_ROLLOVER_HOUR: int = 4
+    
+    # Предгенерация гороскопов: все знаки на завтра за LEAD_MINUTES до полуночи
+    HOROSCOPE_PREGEN_ENABLED: bool = True
+    HOROSCOPE_PREGEN_LEAD_MINUTES: int = 30
+    HOROSCOPE_PREGEN_CONCURRENCY: int = 3
+    HOROSCOPE_PREGEN_RETRIES: int = 4
+    HOROSCOPE_PREGEN_BACKOFF_SECONDS: float = 5.0
+    
+    # Флуд-лимиты Telegram для исходящих сообщений
+    SEND_RATE_LIMIT_ENABLED: bool = True
+    SEND_GLOBAL_RATE: float = 30.0  # сообщений в секунду на бота
+    SEND_CHAT_RATE: float = 1.0  # сообщений в секунду в один чат
+    SEND_CHAT_BURST: int = 3  # короткий всплеск в чате без ожидания
+    SEND_MAX_RETRIES: int = 3  # повторов после RetryAfter
+    
+    # Хранилище FSM: sqlite (переживает рестарт) или memory
+    FSM_STORAGE: str = "sqlite"
+    FSM_TTL: int = 24 * 3600  # брошенный диалог истекает через сутки
+    FSM_FLUSH_INTERVAL_MS: int = 50  # изменения за это окно - одна запись
+    FSM_CACHE_SIZE: int = 50000
+    
+    # Режим получения апдейтов: polling (разработка) или webhook
+    BOT_MODE: str = "polling"
+    WEBHOOK_URL: str = ""  # публичный адрес, например https://bot.example.com
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    WEBHOOK_SECRET: str = ""
+    WEBHOOK_MAX_CONNECTIONS: int = 40  # параллельных доставок со стороны Telegram
+    WEBHOOK_CONCURRENCY: int = 64  # апдейтов в обработке одновременно
+    WEBHOOK_BACKLOG: int = 1000  # очередь, сверх которой отвечаем 503
+    
     class Config:
         env_file = ".env"
 
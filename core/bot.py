@@ -1,19 +1,42 @@
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.bot import DefaultBotProperties
 from config import get_settings
+from core.middleware import DbSessionMiddleware, MetricsMiddleware, UserLockMiddleware
+from core.sender import outbound_limiter
+from core.fsm_storage import create_fsm_storage
+from utils.callbacks import CallbackPayloadMiddleware
 
 def create_bot() -> Bot:
     settings = get_settings()
-    return Bot(
+    bot = Bot(
         token=settings.BOT_TOKEN,
         default=DefaultBotProperties(parse_mode="HTML")
     )
+    # Флуд-лимиты Telegram (см. core/sender.py)
+    bot.session.middleware(outbound_limiter)
+    return bot
 
-def create_dispatcher(bot: Bot) -> Dispatcher:
-    storage = MemoryStorage()
-    dp = Dispatcher(bot=bot, storage=storage)
+def create_dispatcher() -> Dispatcher:
+    """Диспетчер со всеми middleware, без обработчиков"""
+    dp = Dispatcher(storage=create_fsm_storage())
     
-    # НЕ регистрируем обработчики здесь - делаем это в main.py
+    # Метрики регистрируются первыми, чтобы в замер попали сессия и COMMIT
+    dp.message.middleware(MetricsMiddleware())
+    dp.callback_query.middleware(MetricsMiddleware())
+    
+    # Одна сессия БД на апдейт (см. core/middleware.py)
+    dp.message.middleware(DbSessionMiddleware())
+    dp.callback_query.middleware(DbSessionMiddleware())
+    
+    # Апдейты одного пользователя - по очереди (шардированные блокировки, см. core/user_locks.py)
+    if get_settings().USER_LOCKS_ENABLED:
+        user_lock = UserLockMiddleware()
+        dp.message.outer_middleware(user_lock)
+        dp.callback_query.outer_middleware(user_lock)
+    
+    # callback_data разбирается один раз до фильтров (outer), обработчики получают payload
+    dp.callback_query.outer_middleware(CallbackPayloadMiddleware())
+    
+    # НЕ регистрируем обработчики здесь - делаем это в main.py (build_dispatcher)
     
     return dp
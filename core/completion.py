@@ -0,0 +1,80 @@
+"""
+Отметка выполнения привычки: вставка лога и стрик двумя запросами без гонок
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import Date, DateTime, and_, case, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.scheduler import mark_habit_changed
+from models.habit import Habit
+from models.habit_log_new import HabitLog
+
+DONE = "done"
+ALREADY_DONE = "already_done"
+NOT_FOUND = "not_found"
+
+@dataclass(frozen=True)
+class Completion:
+    status: str
+    name: Optional[str] = None
+    streak: int = 0
+    frequency: Optional[str] = None
+    goal: int = 1
+
+def log_insert(dialect_name: str, user_id: int, habit_id: int, day: date, completed_at: datetime):
+    """INSERT ... SELECT из habits: лог появляется, только если привычка принадлежит пользователю
+
+    Повтор за тот же день упирается в uq_habit_date и молча пропускается,
+    RETURNING тогда пуст.
+    """
+    insert = postgresql_insert if dialect_name == "postgresql" else sqlite_insert
+    owned = select(
+        Habit.id, Habit.user_id, literal(day, Date), literal(completed_at, DateTime)
+    ).where(and_(Habit.id == habit_id, Habit.user_id == user_id))
+    return (
+        insert(HabitLog)
+        .from_select(["habit_id", "user_id", "date", "completed_at"], owned)
+        .on_conflict_do_nothing(index_elements=["habit_id", "date"])
+        .returning(HabitLog.id)
+    )
+
+def streak_update(habit_id: int, day: date):
+    """Стрик +1, если вчера выполнена; иначе начинается заново. Значения - из RETURNING"""
+    return (
+        update(Habit)
+        .where(Habit.id == habit_id)
+        .values(
+            streak_current=case(
+                (Habit.last_completed_date == day, Habit.streak_current),
+                (Habit.last_completed_date == day - timedelta(days=1), func.coalesce(Habit.streak_current, 0) + 1),
+                else_=1,
+            ),
+            last_completed_date=day,
+        )
+        .returning(Habit.name, Habit.streak_current, Habit.frequency, Habit.goal)
+        .execution_options(synchronize_session=False)
+    )
+
+async def apply_completion(db: AsyncSession, user_id: int, habit_id: int, day: date) -> Completion:
+    """Два запроса на отметку; повторное нажатие - вставка без строк и один SELECT для ответа"""
+    inserted = (await db.execute(
+        log_insert(db.bind.dialect.name, user_id, habit_id, day, datetime.now())
+    )).scalar_one_or_none()
+
+    if inserted is None:
+        row = (await db.execute(
+            select(Habit.name, Habit.streak_current).where(and_(Habit.id == habit_id, Habit.user_id == user_id))
+        )).one_or_none()
+        if row is None:
+            return Completion(NOT_FOUND)
+        return Completion(ALREADY_DONE, row.name, row.streak_current or 0)
+
+    row = (await db.execute(streak_update(habit_id, day))).one()
+    # last_completed_date изменился мимо flush: напоминание на сегодня больше не нужно
+    mark_habit_changed(db, habit_id)
+    return Completion(DONE, row.name, row.streak_current, row.frequency, row.goal or 1)
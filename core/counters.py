@@ -0,0 +1,67 @@
+"""
+Счетчики пользователя: атомарный UPDATE ... RETURNING вместо чтения и записи объекта
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import case, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.user_cache import mark_user_changed
+from models.user import User, level_expression, level_for
+
+@dataclass(frozen=True)
+class XpResult:
+    """Значения после начисления, прочитанные из того же UPDATE"""
+    xp: int
+    level: int
+    total_habits_completed: int
+    leveled_up: bool
+
+async def add_xp(db: AsyncSession, user_id: int, amount: int, completions: int = 1) -> Optional[XpResult]:
+    """Начислить XP одним UPDATE: параллельные начисления не теряются, уровень считает БД"""
+    new_xp = func.coalesce(User.xp, 0) + amount
+    row = (await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(
+            xp=new_xp,
+            level=level_expression(new_xp),
+            total_habits_completed=func.coalesce(User.total_habits_completed, 0) + completions,
+        )
+        .returning(User.telegram_id, User.xp, User.level, User.total_habits_completed)
+        .execution_options(synchronize_session=False)
+    )).one_or_none()
+    if row is None:
+        return None
+
+    mark_user_changed(db, row.telegram_id)
+    return XpResult(
+        xp=row.xp,
+        level=row.level,
+        total_habits_completed=row.total_habits_completed,
+        leveled_up=row.level > level_for(row.xp - amount),
+    )
+
+async def increment_ai_usage(db: AsyncSession, user_id: int, today: Optional[date] = None) -> Optional[int]:
+    """+1 AI-запрос с дневным сбросом внутри UPDATE. Возвращает запросы за сегодня"""
+    today = today or date.today()
+    row = (await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(
+            daily_ai_requests=case(
+                (User.last_ai_request_date == today, func.coalesce(User.daily_ai_requests, 0) + 1), else_=1
+            ),
+            total_ai_requests=func.coalesce(User.total_ai_requests, 0) + 1,
+            last_ai_request_date=today,
+        )
+        .returning(User.telegram_id, User.daily_ai_requests)
+        .execution_options(synchronize_session=False)
+    )).one_or_none()
+    if row is None:
+        return None
+
+    mark_user_changed(db, row.telegram_id)
+    return row.daily_ai_requests
@@ -0,0 +1,147 @@
+"""
+Дневные итоги пользователей: инкрементальное обновление и пересборка по habit_logs
+"""
+import logging
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional, Tuple
+
+from sqlalchemy import Select, and_, func, literal, or_, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from models.daily_user_stats import DailyUserStats
+from models.habit import Habit
+from models.habit_log_new import HabitLog
+
+logger = logging.getLogger(__name__)
+
+# XP за одну отметку выполнения
+HABIT_COMPLETION_XP = 10
+
+def _insert_for(dialect_name: str):
+    return postgresql_insert if dialect_name == "postgresql" else sqlite_insert
+
+def _active_habits(user_id, on_day=None):
+    """Скалярный подзапрос: активные привычки пользователя (созданные не позже on_day)"""
+    conditions = [Habit.user_id == user_id, Habit.is_active == True]
+    if on_day is not None:
+        conditions.append(or_(Habit.created_at.is_(None), Habit.created_at <= on_day))
+    return select(func.count()).select_from(Habit).where(and_(*conditions)).scalar_subquery()
+
+async def record_completion(db: AsyncSession, user_id: int, day: date, xp: int = HABIT_COMPLETION_XP):
+    """+1 выполнение за день одним upsert (в транзакции вставки HabitLog)"""
+    insert = _insert_for(db.bind.dialect.name)
+    statement = insert(DailyUserStats).values(
+        user_id=user_id, date=day, completions=1, active_habits=_active_habits(user_id), xp_gained=xp,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[DailyUserStats.user_id, DailyUserStats.date],
+        set_={
+            "completions": DailyUserStats.completions + 1,
+            "xp_gained": DailyUserStats.xp_gained + statement.excluded.xp_gained,
+            "active_habits": statement.excluded.active_habits,
+        },
+    )
+    await db.execute(statement)
+
+@dataclass(frozen=True)
+class PeriodSummary:
+    """Итоги пользователя за период"""
+    days: int
+    completions: int
+    xp_gained: int
+    active_days: int
+    best_day: Optional[Tuple[date, int]]
+    completion_rate: float
+
+def range_query(user_id: int, start: date, end: date) -> Select:
+    """Строки пользователя за [start, end] по первичному ключу - не больше одной на день"""
+    return select(
+        DailyUserStats.date, DailyUserStats.completions, DailyUserStats.active_habits, DailyUserStats.xp_gained
+    ).where(and_(DailyUserStats.user_id == user_id, DailyUserStats.date.between(start, end))).order_by(
+        DailyUserStats.date
+    )
+
+async def load_range(db: AsyncSession, user_id: int, start: date, end: date) -> list:
+    return (await db.execute(range_query(user_id, start, end))).all()
+
+def summarize(rows: list, start: date, end: date) -> PeriodSummary:
+    """Итоги за [start, end] по строкам load_range (можно загрузить период шире)"""
+    rows = [row for row in rows if start <= row.date <= end]
+    days = (end - start).days + 1
+    completions = sum(row.completions for row in rows)
+    best = max(rows, key=lambda row: row.completions, default=None)
+    # Дни без строки - ноль выполнений при последнем известном числе привычек
+    planned = days * (rows[-1].active_habits if rows else 0)
+    return PeriodSummary(
+        days=days,
+        completions=completions,
+        xp_gained=sum(row.xp_gained for row in rows),
+        active_days=len(rows),
+        best_day=(best.date, best.completions) if best else None,
+        completion_rate=min(completions / planned, 1.0) if planned else 0.0,
+    )
+
+async def platform_summary(db: AsyncSession, start: date, end: date) -> dict:
+    """Итоги по всем пользователям за период (индекс idx_daily_user_stats_date)"""
+    row = (await db.execute(
+        select(
+            func.coalesce(func.sum(DailyUserStats.completions), 0).label("completions"),
+            func.count(func.distinct(DailyUserStats.user_id)).label("users"),
+            func.coalesce(func.sum(DailyUserStats.xp_gained), 0).label("xp_gained"),
+        ).where(DailyUserStats.date.between(start, end))
+    )).one()
+    return {"completions": row.completions, "users": row.users, "xp_gained": row.xp_gained}
+
+async def backfill_daily_stats(engine: AsyncEngine, chunk_users: int = 1000) -> dict:
+    """Пересобрать daily_user_stats по habit_logs кусками по chunk_users пользователей
+
+    Каждый кусок - один INSERT ... SELECT ... GROUP BY по индексу
+    idx_habit_logs_user_date и своя транзакция. Строки перезаписываются, так
+    что команду можно прервать и запустить снова. Число активных привычек за
+    прошлые дни восстанавливается приближенно: активные сейчас и созданные
+    не позже этого дня. XP - по HABIT_COMPLETION_XP за отметку.
+    """
+    started = time.perf_counter()
+    async with engine.connect() as conn:
+        low, high = (await conn.execute(select(func.min(HabitLog.user_id), func.max(HabitLog.user_id)))).one()
+
+    chunks = 0
+    rows_total = 0
+    if low is not None:
+        for chunk_low in range(low, high + 1, chunk_users):
+            chunk_high = chunk_low + chunk_users - 1
+            grouped = (
+                select(
+                    HabitLog.user_id,
+                    HabitLog.date,
+                    func.count().label("completions"),
+                    _active_habits(HabitLog.user_id, HabitLog.date).label("active_habits"),
+                    (func.count() * literal(HABIT_COMPLETION_XP)).label("xp_gained"),
+                )
+                .where(HabitLog.user_id.between(chunk_low, chunk_high))
+                .group_by(HabitLog.user_id, HabitLog.date)
+            )
+            async with engine.begin() as conn:
+                insert = _insert_for(conn.dialect.name)
+                statement = insert(DailyUserStats).from_select(
+                    ["user_id", "date", "completions", "active_habits", "xp_gained"], grouped
+                )
+                statement = statement.on_conflict_do_update(
+                    index_elements=[DailyUserStats.user_id, DailyUserStats.date],
+                    set_={
+                        "completions": statement.excluded.completions,
+                        "active_habits": statement.excluded.active_habits,
+                        "xp_gained": statement.excluded.xp_gained,
+                    },
+                )
+                result = await conn.execute(statement)
+                rows_total += result.rowcount or 0
+            chunks += 1
+
+    summary = {"chunks": chunks, "rows": rows_total, "seconds": round(time.perf_counter() - started, 2)}
+    logger.info(f"Daily user stats backfilled: {summary}")
+    return summary
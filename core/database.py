@@ -1,12 +1,101 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import declarative_base, Session
 from contextlib import asynccontextmanager
 from config import get_settings
+from core.metrics import install_query_hooks
 
 Base = declarative_base()
 settings = get_settings()
-engine = create_async_engine(settings.DATABASE_URL, echo=False)
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+def _install_sqlite_pragmas(async_engine, read_only: bool = False):
+    """Навесить PRAGMA-профиль на каждое новое соединение SQLite"""
+    pragmas = [
+        f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}",
+        f"PRAGMA cache_size={-abs(int(settings.SQLITE_CACHE_SIZE_KB))}",
+        f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}",
+    ]
+    if read_only:
+        # Соединения пула чтения не могут случайно начать запись
+        pragmas.append("PRAGMA query_only=ON")
+    
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+def _install_sqlite_transactions(async_engine):
+    """Явный BEGIN IMMEDIATE для пула записи (рецепт SQLAlchemy для pysqlite)
+
+    Драйвер сам не шлет BEGIN перед SAVEPOINT: первый SAVEPOINT пачки
+    писателя становился внешней транзакцией, и каждый RELEASE коммитил (и
+    делал fsync) отдельно. С isolation_level=None транзакциями управляет
+    SQLAlchemy: одна на пачку, SAVEPOINT внутри нее. IMMEDIATE берет
+    блокировку записи сразу, а не на первом INSERT посреди транзакции.
+    """
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _disable_driver_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+    
+    @event.listens_for(async_engine.sync_engine, "begin")
+    def _begin_immediate(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+def _create_engine(pool_size: int, read_only: bool = False):
+    url = settings.DATABASE_URL
+    engine_kwargs = {"echo": False}
+    if make_url(url).database not in (None, "", ":memory:"):
+        engine_kwargs.update(pool_size=pool_size, pool_timeout=settings.DB_POOL_TIMEOUT)
+        if _is_sqlite(url):
+            engine_kwargs["max_overflow"] = 0
+    
+    async_engine = create_async_engine(url, **engine_kwargs)
+    if _is_sqlite(url):
+        _install_sqlite_pragmas(async_engine, read_only=read_only)
+        if not read_only:
+            _install_sqlite_transactions(async_engine)
+    install_query_hooks(async_engine)
+    return async_engine
+
+# Пул записи: для SQLite держим мало соединений, чтобы писатели не толкались за блокировку
+engine = _create_engine(settings.DB_WRITE_POOL_SIZE)
+# Пул чтения: в режиме WAL читатели не ждут писателя
+read_engine = _create_engine(settings.DB_READ_POOL_SIZE, read_only=True)
+
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+read_session = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
+# Отмечаем сессии, которые что-то писали: только им нужен commit/rollback
+@event.listens_for(Session, "after_flush")
+def _mark_flushed_writes(session, flush_context):
+    session.info["has_writes"] = True
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_dml_writes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["has_writes"] = True
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _reset_write_mark(session):
+    session.info.pop("has_writes", None)
+
+def session_has_writes(session: AsyncSession) -> bool:
+    """Есть ли в сессии несохраненные или незакоммиченные изменения"""
+    return bool(
+        session.info.get("has_writes")
+        or session.new or session.dirty or session.deleted
+    )
 
 @asynccontextmanager
 async def get_async_session():
@@ -14,13 +103,27 @@ async def get_async_session():
     async with async_session() as session:
         try:
             yield session
-            await session.commit()
+            # Чтение не требует COMMIT: соединение просто вернется в пул
+            if session_has_writes(session):
+                await session.commit()
         except Exception:
-            await session.rollback()
+            if session_has_writes(session):
+                await session.rollback()
             raise
         finally:
             await session.close()
 
+@asynccontextmanager
+async def get_read_session():
+    """Сессия из пула только для чтения (без commit)"""
+    async with read_session() as session:
+        yield session
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+
+async def dispose_engines():
+    """Закрыть оба пула соединений"""
+    await engine.dispose()
+    await read_engine.dispose()
@@ -0,0 +1,157 @@
+"""
+Индекс точных текстов кнопок и /команд: обработчик за один поиск в dict
+"""
+import logging
+import operator
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+from aiogram import BaseMiddleware, Dispatcher, Router
+from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.dispatcher.event.telegram import TelegramEventObserver
+from aiogram.filters import Command, StateFilter
+from aiogram.fsm.state import State
+from aiogram.types import Message, TelegramObject
+
+logger = logging.getLogger(__name__)
+
+IndexEntry = Tuple[TelegramEventObserver, HandlerObject]
+
+def _exact_text(handler: HandlerObject) -> Optional[str]:
+    """Текст, если единственный фильтр - F.text == "..." или Command("...")"""
+    if len(handler.filters or ()) != 1:
+        return None
+    filter_object = handler.filters[0]
+    callback = filter_object.callback
+
+    magic = filter_object.magic
+    operations = getattr(magic, "_operations", ()) if magic is not None else ()
+    if len(operations) == 2:
+        attribute, comparison = operations
+        if (getattr(attribute, "name", None) == "text"
+                and getattr(comparison, "comparator", None) is operator.eq
+                and isinstance(getattr(comparison, "right", None), str)):
+            return comparison.right
+
+    if isinstance(callback, Command) and len(callback.commands) == 1 and callback.prefix == "/":
+        command = callback.commands[0]
+        if isinstance(command, str):
+            return f"/{command}"
+    return None
+
+def _requires_state(handler: HandlerObject) -> bool:
+    """Обработчик сработает только в непустом состоянии FSM"""
+    for filter_object in handler.filters or ():
+        callback = filter_object.callback
+        if isinstance(callback, State) and callback.state not in (None, "*"):
+            return True
+        if isinstance(callback, StateFilter) and all(
+            isinstance(state, State) and state.state not in (None, "*") or
+            isinstance(state, str) and state != "*"
+            for state in callback.states
+        ):
+            return True
+    return False
+
+def _walk(router: Router) -> Iterator[Router]:
+    """Роутеры в порядке распространения события в aiogram"""
+    yield router
+    for sub_router in router.sub_routers:
+        yield from _walk(sub_router)
+
+class TextDispatchIndex:
+    """Снимок цепочки message-обработчиков: текст -> (observer, handler)
+
+    Индекс повторяет выбор aiogram для апдейтов без состояния FSM: перед
+    проиндексированным обработчиком могут стоять только другие точные тексты
+    и обработчики состояний (без состояния они не срабатывают). Первый
+    «непрозрачный» обработчик (catch-all, startswith, фильтр роутера)
+    останавливает индексацию - все, что после него, идет обычным путем.
+    """
+
+    def __init__(self, root: Router):
+        self.entries: Dict[str, IndexEntry] = {}
+        self.duplicates = []
+        self.stopped_at: Optional[str] = None
+        self._build(root)
+
+    def _build(self, root: Router):
+        for router in _walk(root):
+            observer = router.observers["message"]
+            if router is not root and (observer._handler.filters or len(observer.outer_middleware)):
+                self.stopped_at = f"router {router.name}"
+                return
+
+            for handler in observer.handlers:
+                text = _exact_text(handler)
+                if text is not None:
+                    if text in self.entries:
+                        # aiogram всегда выберет первый - второй недостижим
+                        first = self.entries[text][1].callback.__name__
+                        self.duplicates.append((text, first, handler.callback.__name__))
+                        logger.warning(
+                            f"Duplicate text handler {text!r}: {handler.callback.__name__} "
+                            f"is shadowed by {first}"
+                        )
+                        continue
+                    self.entries[text] = (observer, handler)
+                elif not _requires_state(handler):
+                    self.stopped_at = handler.callback.__name__
+                    return
+
+    def lookup(self, text: str) -> Optional[IndexEntry]:
+        return self.entries.get(text)
+
+class TextIndexMiddleware(BaseMiddleware):
+    """Outer middleware dp.message: прямой вызов обработчика по индексу
+
+    Работает только вне состояний FSM. Фильтры и inner middleware
+    обработчика выполняются так же, как при обычной маршрутизации; при
+    промахе или непрошедшем фильтре апдейт идет по цепочке как раньше.
+    """
+
+    def __init__(self, index: TextDispatchIndex):
+        self.index = index
+        self.hits = 0
+        self.misses = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        entry = None
+        if isinstance(event, Message) and event.text and data.get("raw_state") is None:
+            entry = self.index.lookup(event.text)
+        if entry is None:
+            self.misses += 1
+            return await handler(event, data)
+
+        observer, handler_object = entry
+        check_data = {**data, "handler": handler_object}
+        passed, filter_data = await handler_object.check(event, **check_data)
+        if not passed:
+            self.misses += 1
+            return await handler(event, data)
+
+        self.hits += 1
+        check_data.update(filter_data)
+        wrapped = observer.outer_middleware.wrap_middlewares(
+            observer._resolve_middlewares(), handler_object.call
+        )
+        try:
+            return await wrapped(event, check_data)
+        except SkipHandler:
+            # Обработчик отказался - отдаем апдейт обычной цепочке
+            return await handler(event, data)
+
+def install_text_index(dp: Dispatcher) -> TextDispatchIndex:
+    """Построить индекс после подключения всех роутеров и включить его"""
+    index = TextDispatchIndex(dp)
+    dp.message.outer_middleware(TextIndexMiddleware(index))
+    logger.info(
+        f"Text dispatch index: {len(index.entries)} entries, {len(index.duplicates)} duplicates"
+        + (f", stopped at {index.stopped_at}" if index.stopped_at else "")
+    )
+    return index
@@ -0,0 +1,264 @@
+"""
+Хранилище FSM в SQLite вместо MemoryStorage
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Mapping, Optional, Set
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import get_settings
+from core.database import read_session
+from core.writer import db_writer
+from models.fsm_state import FsmState
+
+logger = logging.getLogger(__name__)
+
+def storage_key_to_str(key: StorageKey) -> str:
+    """Компактный строковый ключ: пустые хвостовые части не пишем"""
+    parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+    if key.thread_id or key.business_connection_id:
+        parts.append(str(key.thread_id or ""))
+    if key.business_connection_id:
+        parts.append(key.business_connection_id)
+    parts.append(key.destiny)
+    return ":".join(parts)
+
+def _dumps(data: Dict[str, Any]) -> Optional[str]:
+    if not data:
+        return None
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+class _Entry:
+    """Состояние одного ключа в кэше"""
+    __slots__ = ("state", "data", "expires_at")
+
+    def __init__(self, state: Optional[str] = None, data: Optional[dict] = None, expires_at: int = 0):
+        self.state = state
+        self.data = data or {}
+        self.expires_at = expires_at
+
+    @property
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище с write-back кэшем
+
+    Процесс бота - единственный, кто пишет в ``fsm_states``, поэтому кэш
+    авторитетен: и найденные, и пустые ключи кэшируются (aiogram читает
+    состояние на каждом апдейте), и в БД идет только первый промах.
+    Изменения помечают ключ грязным; раз в ``FSM_FLUSH_INTERVAL_MS`` все
+    грязные ключи уходят одним заданием писателя, так что несколько
+    ``set_state``/``update_data`` за апдейт дают одну запись. Брошенные
+    диалоги истекают через ``FSM_TTL`` секунд после последнего изменения.
+    """
+
+    def __init__(self, session_factory=read_session, writer=db_writer, ttl: Optional[int] = None,
+                 flush_interval_ms: Optional[int] = None, cache_size: Optional[int] = None):
+        settings = get_settings()
+        self.session_factory = session_factory
+        self.writer = writer
+        self.ttl = ttl or settings.FSM_TTL
+        self.flush_interval = (flush_interval_ms or settings.FSM_FLUSH_INTERVAL_MS) / 1000
+        self.cache_size = cache_size or settings.FSM_CACHE_SIZE
+
+        self._cache: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._dirty: Set[str] = set()
+        # Ключи в незавершенной записи: не вытесняются до подтверждения писателя
+        self._writing: Counter = Counter()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._last_cleanup = time.time()
+
+        # Счетчики для мониторинга
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.expired_deleted = 0
+
+    # --- Кэш ---
+
+    async def _entry(self, key: StorageKey) -> _Entry:
+        str_key = storage_key_to_str(key)
+        entry = self._cache.get(str_key)
+        now = int(time.time())
+
+        if entry is not None:
+            self.hits += 1
+            self._cache.move_to_end(str_key)
+        else:
+            self.misses += 1
+            async with self.session_factory() as db:
+                row = (await db.execute(
+                    select(FsmState.state, FsmState.data, FsmState.expires_at).where(FsmState.key == str_key)
+                )).first()
+            entry = _Entry()
+            if row is not None:
+                entry = _Entry(row.state, json.loads(row.data) if row.data else {}, row.expires_at)
+            # Пока шел SELECT, ключ мог появиться в кэше
+            entry = self._cache.setdefault(str_key, entry)
+            self._evict()
+
+        if not entry.is_empty and entry.expires_at <= now:
+            entry.state, entry.data = None, {}
+            self._mark_dirty(str_key, entry)
+        return entry
+
+    def _evict(self):
+        """LRU-вытеснение чистых ключей сверх cache_size (грязные и записываемые не трогаем)"""
+        if len(self._cache) <= self.cache_size:
+            return
+        for str_key in list(self._cache):
+            if len(self._cache) <= self.cache_size:
+                break
+            if str_key not in self._dirty and str_key not in self._writing:
+                del self._cache[str_key]
+
+    def _mark_dirty(self, str_key: str, entry: _Entry):
+        entry.expires_at = int(time.time()) + self.ttl
+        self._dirty.add(str_key)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later(), name="fsm-storage-flush")
+
+    async def _flush_later(self):
+        # Ключи, испачканные во время записи, уходят следующим сбросом
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if not self._dirty:
+                break
+
+    # --- BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(storage_key_to_str(key), entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise TypeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        entry = await self._entry(key)
+        entry.data = data.copy()
+        self._mark_dirty(storage_key_to_str(key), entry)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._entry(key)).data.copy()
+
+    async def close(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        await self.flush()
+
+    # --- Запись ---
+
+    async def flush(self):
+        """Записать все грязные ключи одним заданием писателя"""
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        entries = {str_key: self._cache.get(str_key) for str_key in keys}
+
+        upserts: List[dict] = []
+        deletes: List[str] = []
+        for str_key, entry in entries.items():
+            if entry is None or entry.is_empty:
+                deletes.append(str_key)
+            else:
+                upserts.append({"key": str_key, "state": entry.state,
+                                "data": _dumps(entry.data), "expires_at": entry.expires_at})
+
+        cleanup_before = None
+        if time.time() - self._last_cleanup > 600:
+            cleanup_before = int(time.time())
+            self._last_cleanup = time.time()
+
+        self._writing.update(keys)
+        try:
+            expired = await self.writer.submit(
+                lambda db: self._write_job(db, upserts, deletes, cleanup_before)
+            )
+        except Exception as e:
+            # Вернем ключи в грязные: запишутся при следующем сбросе. Записи - обратно
+            # в кэш, иначе отсутствующий ключ при следующем сбросе станет DELETE
+            for str_key, entry in entries.items():
+                if entry is not None:
+                    self._cache.setdefault(str_key, entry)
+            self._dirty.update(keys)
+            logger.error(f"FSM storage flush failed: {e}")
+            return
+        finally:
+            self._writing.subtract(keys)
+            for str_key in keys:
+                if self._writing[str_key] <= 0:
+                    del self._writing[str_key]
+
+        self.flushes += 1
+        self.rows_written += len(upserts) + len(deletes)
+        self.expired_deleted += expired
+        # Пустые ключи остаются в кэше как отрицательный результат
+        self._evict()
+
+    @staticmethod
+    async def _write_job(db: AsyncSession, upserts: List[dict], deletes: List[str],
+                         cleanup_before: Optional[int]) -> int:
+        if upserts:
+            insert = postgresql_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+            statement = insert(FsmState.__table__)
+            statement = statement.on_conflict_do_update(
+                index_elements=[FsmState.key],
+                set_={
+                    "state": statement.excluded.state,
+                    "data": statement.excluded.data,
+                    "expires_at": statement.excluded.expires_at,
+                },
+            )
+            await db.execute(statement, upserts)
+        if deletes:
+            await db.execute(delete(FsmState).where(FsmState.key.in_(deletes)))
+
+        expired = 0
+        if cleanup_before is not None:
+            # Брошенные диалоги (индекс idx_fsm_states_expires_at)
+            result = await db.execute(delete(FsmState).where(FsmState.expires_at < cleanup_before))
+            expired = result.rowcount or 0
+        return expired
+
+    # --- Статистика ---
+
+    async def stats(self) -> dict:
+        async with self.session_factory() as db:
+            rows = (await db.execute(select(func.count()).select_from(FsmState))).scalar_one()
+        active = [entry for entry in self._cache.values() if not entry.is_empty]
+        return {
+            "rows": rows,
+            "cached_keys": len(self._cache),
+            "active_in_cache": len(active),
+            "dirty": len(self._dirty),
+            "writing": len(self._writing),
+            "cached_data_bytes": sum(len(_dumps(entry.data) or "") for entry in active),
+            "hits": self.hits,
+            "misses": self.misses,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "expired_deleted": self.expired_deleted,
+        }
+
+def create_fsm_storage() -> BaseStorage:
+    """Хранилище FSM по настройке FSM_STORAGE: sqlite (по умолчанию) или memory"""
+    if get_settings().FSM_STORAGE == "memory":
+        return MemoryStorage()
+    return SQLiteStorage()
@@ -0,0 +1,143 @@
+"""
+Битовые календари выполнений: день за O(1), суммы за период через popcount
+"""
+import logging
+import time
+from datetime import date, timedelta
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+from sqlalchemy import String, delete, select, type_coerce
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from models.habit import Habit
+from models.habit_calendar import HabitCalendar
+from models.habit_log_new import HabitLog
+
+logger = logging.getLogger(__name__)
+
+YEAR_BITS = 366
+YEAR_BYTES = (YEAR_BITS + 7) // 8  # 46
+
+def day_of_year(day: date) -> int:
+    """Номер бита дня: 0 - 1 января"""
+    return day.timetuple().tm_yday - 1
+
+class YearBitmap:
+    """Выполнения привычки за один год"""
+    __slots__ = ("year", "value")
+
+    def __init__(self, year: int, bits: Optional[bytes] = None):
+        self.year = year
+        self.value = int.from_bytes(bits, "little") if bits else 0
+
+    def to_bytes(self) -> bytes:
+        return self.value.to_bytes(YEAR_BYTES, "little")
+
+    def add(self, day: date):
+        self.value |= 1 << day_of_year(day)
+
+    def discard(self, day: date):
+        self.value &= ~(1 << day_of_year(day))
+
+    def __contains__(self, day: date) -> bool:
+        return day.year == self.year and bool(self.value >> day_of_year(day) & 1)
+
+    def count(self, start: Optional[date] = None, end: Optional[date] = None) -> int:
+        """Число выполнений в [start, end] внутри этого года"""
+        low = day_of_year(start) if start and start.year == self.year else 0
+        high = day_of_year(end) + 1 if end and end.year == self.year else YEAR_BITS
+        if low >= high:
+            return 0
+        return (self.value >> low & ((1 << (high - low)) - 1)).bit_count()
+
+    def days(self) -> Iterable[date]:
+        """Даты выполнений по порядку (для тепловой карты)"""
+        start = date(self.year, 1, 1)
+        value, bit = self.value, 0
+        while value:
+            if value & 1:
+                yield start + timedelta(days=bit)
+            value >>= 1
+            bit += 1
+
+async def load_year(db: AsyncSession, habit_id: int, year: int) -> YearBitmap:
+    """Весь год одной строкой"""
+    bits = await db.scalar(
+        select(HabitCalendar.bits).where(HabitCalendar.habit_id == habit_id, HabitCalendar.year == year)
+    )
+    return YearBitmap(year, bits)
+
+async def mark_completed(db: AsyncSession, habit_id: int, day: date):
+    """Отметить день в календаре (в транзакции вставки HabitLog)"""
+    row = await db.get(HabitCalendar, (habit_id, day.year))
+    bitmap = YearBitmap(day.year, row.bits if row else None)
+    bitmap.add(day)
+    if row is None:
+        db.add(HabitCalendar(habit_id=habit_id, year=day.year, bits=bitmap.to_bytes()))
+    else:
+        row.bits = bitmap.to_bytes()
+
+async def count_completions(db: AsyncSession, habit_id: int, start: date, end: date) -> int:
+    """Выполнений в [start, end]: по строке на каждый затронутый год"""
+    rows = (await db.execute(
+        select(HabitCalendar.year, HabitCalendar.bits).where(
+            HabitCalendar.habit_id == habit_id,
+            HabitCalendar.year.between(start.year, end.year),
+        )
+    )).all()
+    return sum(YearBitmap(row.year, row.bits).count(start, end) for row in rows)
+
+async def rebuild_calendars(engine: AsyncEngine, chunk_rows: int = 500_000,
+                            reader: Optional[AsyncEngine] = None) -> dict:
+    """Пересобрать все календари по habit_logs (таблица перезаписывается целиком)
+
+    Логи читаются через reader (по умолчанию engine), чтобы не держать
+    блокировку записи SQLite на время потокового чтения.
+    """
+    started = time.perf_counter()
+    reader = reader or engine
+    bitmaps: Dict[tuple, np.ndarray] = {}
+    rows_total = 0
+
+    async with reader.connect() as conn:
+        result = await conn.stream(
+            # Логи удаленных привычек (если остались) календаря не получают
+            select(HabitLog.habit_id, type_coerce(HabitLog.date, String))
+            .where(HabitLog.habit_id.in_(select(Habit.id)))
+            .execution_options(yield_per=chunk_rows)
+        )
+        async for partition in result.partitions(chunk_rows):
+            rows_total += len(partition)
+            ids, dates = zip(*partition)
+            ids = np.array(ids, dtype=np.int64)
+            days = np.array(dates, dtype="datetime64[D]")
+            year_starts = days.astype("datetime64[Y]")
+            years = year_starts.astype(np.int64) + 1970
+            bits = (days - year_starts.astype("datetime64[D]")).astype(np.int64)
+
+            # Битовая матрица на каждую пару (привычка, год) этого куска
+            keys, inverse = np.unique(np.stack([ids, years], axis=1), axis=0, return_inverse=True)
+            matrix = np.zeros((len(keys), YEAR_BYTES * 8), dtype=np.uint8)
+            matrix[inverse.ravel(), bits] = 1
+            packed = np.packbits(matrix, axis=1, bitorder="little")
+            for (habit_id, year), row in zip(keys.tolist(), packed):
+                existing = bitmaps.get((habit_id, year))
+                bitmaps[(habit_id, year)] = row if existing is None else existing | row
+
+    records = [
+        {"habit_id": habit_id, "year": year, "bits": row.tobytes()}
+        for (habit_id, year), row in bitmaps.items()
+    ]
+    async with engine.begin() as conn:
+        await conn.execute(delete(HabitCalendar))
+        for offset in range(0, len(records), 20_000):
+            await conn.execute(HabitCalendar.__table__.insert(), records[offset:offset + 20_000])
+
+    summary = {
+        "log_rows": rows_total,
+        "calendars": len(records),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    logger.info(f"Habit calendars rebuilt: {summary}")
+    return summary
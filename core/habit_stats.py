@@ -0,0 +1,300 @@
+"""
+Пересчет стриков и процента выполнения по habit_logs (NumPy, run-length)
+"""
+import logging
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, Optional
+
+import numpy as np
+from sqlalchemy import String, bindparam, select, type_coerce, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from core.scheduler import local_today
+from models.habit import Habit
+from models.habit_log_new import HabitLog
+from models.habit_stats import HabitStats
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Единица расписания, в которой считается стрик
+KIND_DAY = 0       # daily, custom: календарный день
+KIND_WEEKDAYS = 1  # только будни, выходные пропускаются
+KIND_WEEKENDS = 2  # только выходные
+KIND_WEEK = 3      # weekly: неделя ISO, выполнена при goal отметках
+
+RATE_WINDOWS = (7, 30, 90)
+
+# numpy считает дни от 1970-01-01, date.toordinal() - от 0001-01-01
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def schedule_params(frequency: Optional[str], goal: Optional[int]):
+    """(вид единицы, отметок на единицу, допустимый шаг между выполненными единицами)
+
+    custom пока не хранит дни недели, поэтому читаем его как «каждые goal дней»:
+    стрик не прерывается, пока между отметками не больше goal дней.
+    """
+    goal = goal or 1
+    if frequency == "weekdays":
+        return KIND_WEEKDAYS, 1, 1
+    if frequency == "weekends":
+        return KIND_WEEKENDS, 1, 1
+    if frequency == "weekly":
+        return KIND_WEEK, goal, 1
+    if frequency == "custom":
+        return KIND_DAY, 1, goal
+    return KIND_DAY, 1, 1
+
+def to_ordinals(dates) -> np.ndarray:
+    """Даты (date или 'YYYY-MM-DD') -> порядковые номера date.toordinal()"""
+    return np.array(dates, dtype="datetime64[D]").astype(np.int64) + _EPOCH_ORDINAL
+
+def is_scheduled(ordinals: np.ndarray, kinds: np.ndarray) -> np.ndarray:
+    weekday = (ordinals - 1) % 7  # 0001-01-01 - понедельник
+    return np.where(kinds == KIND_WEEKDAYS, weekday < 5, np.where(kinds == KIND_WEEKENDS, weekday >= 5, True))
+
+def unit_index(ordinals: np.ndarray, kinds: np.ndarray) -> np.ndarray:
+    """Номер единицы расписания: для дневных видов - число плановых дней до даты
+
+    У внеплановой даты номер совпадает со следующим плановым днем, поэтому
+    «жив ли стрик» для любого вида - это конец последней серии >= U(сегодня) - шаг.
+    """
+    days = ordinals - 1
+    weeks, weekday = np.divmod(days, 7)
+    return np.select(
+        [kinds == KIND_WEEKDAYS, kinds == KIND_WEEKENDS, kinds == KIND_WEEK],
+        [weeks * 5 + np.minimum(weekday, 5), weeks * 2 + np.maximum(weekday - 5, 0), weeks],
+        default=days,
+    )
+
+@dataclass
+class StatsArrays:
+    """Результат по всем привычкам, индекс - позиция привычки в meta"""
+    streak_current: np.ndarray
+    streak_best: np.ndarray
+    last_completed: np.ndarray  # ordinal, 0 - нет отметок
+    rates: Dict[int, np.ndarray]
+
+    @classmethod
+    def empty(cls, size: int) -> "StatsArrays":
+        return cls(
+            np.zeros(size, np.int64), np.zeros(size, np.int64), np.zeros(size, np.int64),
+            {window: np.zeros(size, np.float64) for window in RATE_WINDOWS},
+        )
+
+def compute_stats(log_habit: np.ndarray, log_ordinal: np.ndarray, kinds: np.ndarray, required: np.ndarray,
+                  gaps: np.ndarray, today, out: StatsArrays):
+    """Стрики и доли выполнения для логов, отсортированных по (привычка, дата)
+
+    log_habit - позиции привычек в kinds/required/gaps. Все привычки из
+    log_habit должны быть целиком в этом куске: результат пишется в out.
+    today - ordinal сегодняшнего дня, общий или по привычкам (пояс владельца).
+    """
+    if not len(log_habit):
+        return
+    today = np.broadcast_to(today, kinds.shape)
+
+    # Последняя отметка привычки, включая внеплановые
+    last_rows = np.flatnonzero(np.r_[log_habit[1:] != log_habit[:-1], True])
+    out.last_completed[log_habit[last_rows]] = log_ordinal[last_rows]
+
+    # Плановые отметки -> номера единиц; несколько отметок в одной единице (неделя) сворачиваем
+    row_kinds = kinds[log_habit]
+    planned = is_scheduled(log_ordinal, row_kinds)
+    habits = log_habit[planned]
+    units = unit_index(log_ordinal[planned], row_kinds[planned])
+    if not len(habits):
+        return
+    first = np.flatnonzero(np.r_[True, (habits[1:] != habits[:-1]) | (units[1:] != units[:-1])])
+    counts = np.diff(np.r_[first, len(habits)])
+    habits, units = habits[first], units[first]
+    done = counts >= required[habits]
+    habits, units = habits[done], units[done]
+    if not len(habits):
+        return
+
+    # Run-length: серия рвется на смене привычки или на шаге больше допустимого
+    run_start = np.flatnonzero(np.r_[True, (habits[1:] != habits[:-1]) | (np.diff(units) > gaps[habits[1:]])])
+    run_end = np.r_[run_start[1:] - 1, len(habits) - 1]
+    run_length = run_end - run_start + 1
+    run_habit = habits[run_start]
+
+    habit_first_run = np.flatnonzero(np.r_[True, run_habit[1:] != run_habit[:-1]])
+    run_owners = run_habit[habit_first_run]
+    out.streak_best[run_owners] = np.maximum.reduceat(run_length, habit_first_run)
+
+    # Текущий стрик - последняя серия, если она доходит до сегодня или до прошлой единицы
+    last_run = np.r_[habit_first_run[1:] - 1, len(run_habit) - 1]
+    current_unit = unit_index(today[run_owners], kinds[run_owners])
+    alive = units[run_end[last_run]] >= current_unit - gaps[run_owners]
+    out.streak_current[run_owners] = np.where(alive, run_length[last_run], 0)
+
+    # Доля выполненных единиц в окне [today - window + 1, today]
+    owner_kinds = kinds[run_owners]
+    high = unit_index(today[run_owners] + 1, owner_kinds)
+    owner_of_unit = np.repeat(np.arange(len(run_owners)), np.diff(np.r_[run_start[habit_first_run], len(habits)]))
+    for window, rates in out.rates.items():
+        # Номера единиц монотонны по дате, поэтому окно - это диапазон номеров
+        low = unit_index(today[run_owners] - window + 1, owner_kinds)
+        in_window = (units >= low[owner_of_unit]) & (units < high[owner_of_unit])
+        done_count = np.bincount(owner_of_unit[in_window], minlength=len(run_owners))
+        expected = np.maximum(np.ceil((high - low) / gaps[run_owners]), 1)
+        rates[run_owners] = np.minimum(done_count / expected, 1.0)
+
+async def recompute_habit_stats(engine: AsyncEngine, today: Optional[date] = None,
+                                chunk_rows: int = 500_000, write_batch: int = 20_000,
+                                reader: Optional[AsyncEngine] = None) -> dict:
+    """Пересчитать стрики всех привычек по habit_logs и записать в habits и habit_stats
+
+    Логи читаются потоком по (habit_id, date) - это порядок уникального индекса
+    uq_habit_date, без сортировки. Кусок обрабатывается целиком по привычкам:
+    хвост последней привычки переносится в следующий кусок.
+
+    Стрики по расписанию (недели, плановые дни) пишутся только в habit_stats.
+    В habits.streak_current - стрик по календарным дням, как его ведут
+    отметка выполнения и streak_rollover; «сегодня» берется в поясе владельца.
+
+    Команду лучше запускать при остановленном боте. Если бот работает, то
+    UPDATE применяется только к строкам habits, не изменившимся с момента
+    чтения. Остальные считаются в habits_skipped, их поправит следующий запуск.
+
+    Чтение идет через reader (по умолчанию engine): на SQLite пул записи
+    открывает транзакцию с BEGIN IMMEDIATE и держал бы блокировку записи
+    все время потокового чтения.
+    """
+    started = time.perf_counter()
+    now = time.time()
+    reader = reader or engine
+
+    async with reader.connect() as conn:
+        meta = (await conn.execute(
+            select(
+                Habit.id, Habit.frequency, Habit.goal, Habit.streak_current, Habit.last_completed_date,
+                User.timezone,
+            )
+            .outerjoin(User, User.id == Habit.user_id)
+            .order_by(Habit.id)
+        )).all()
+    habit_ids = np.array([row.id for row in meta], dtype=np.int64)
+    params = np.array([schedule_params(row.frequency, row.goal) for row in meta], dtype=np.int64).reshape(-1, 3)
+    kinds, required, gaps = params[:, 0], params[:, 1], params[:, 2]
+    daily_kinds, ones = np.full(len(meta), KIND_DAY, np.int64), np.ones(len(meta), np.int64)
+    if today is not None:
+        today_ordinal = today.toordinal()
+    else:
+        local_ordinals = {}
+        for row in meta:
+            if row.timezone not in local_ordinals:
+                local_ordinals[row.timezone] = local_today(row.timezone, now).toordinal()
+        today_ordinal = np.array([local_ordinals[row.timezone] for row in meta], dtype=np.int64)
+    out = StatsArrays.empty(len(meta))
+    live = StatsArrays.empty(len(meta))
+
+    rows_total = 0
+    carry_habits = np.empty(0, np.int64)
+    carry_dates = np.empty(0, np.int64)
+    async with reader.connect() as conn:
+        result = await conn.stream(
+            # Дату не разбираем в date построчно: numpy превращает 'YYYY-MM-DD' в массив сам
+            select(HabitLog.habit_id, type_coerce(HabitLog.date, String))
+            .order_by(HabitLog.habit_id, HabitLog.date)
+            .execution_options(yield_per=chunk_rows)
+        )
+        async for partition in result.partitions(chunk_rows):
+            rows_total += len(partition)
+            if not len(habit_ids):
+                continue
+            ids, dates = zip(*partition)
+            ids = np.array(ids, dtype=np.int64)
+            positions = np.searchsorted(habit_ids, ids)
+            ordinals = to_ordinals(dates)
+
+            # Логи удаленных привычек пропускаем
+            known = (positions < len(habit_ids)) & (habit_ids[np.minimum(positions, len(habit_ids) - 1)] == ids)
+            log_habit = np.concatenate([carry_habits, positions[known]])
+            log_ordinal = np.concatenate([carry_dates, ordinals[known]])
+            if not len(log_habit):
+                continue
+
+            split = np.searchsorted(log_habit, log_habit[-1])
+            compute_stats(log_habit[:split], log_ordinal[:split], kinds, required, gaps, today_ordinal, out)
+            compute_stats(log_habit[:split], log_ordinal[:split], daily_kinds, ones, ones, today_ordinal, live)
+            carry_habits, carry_dates = log_habit[split:], log_ordinal[split:]
+
+    compute_stats(carry_habits, carry_dates, kinds, required, gaps, today_ordinal, out)
+    compute_stats(carry_habits, carry_dates, daily_kinds, ones, ones, today_ordinal, live)
+    computed_at = time.perf_counter()
+
+    # В habits пишем только разошедшиеся строки, в тех же единицах, что и отметка выполнения
+    habit_updates = []
+    for position, row in enumerate(meta):
+        last = int(live.last_completed[position])
+        last_date = date.fromordinal(last) if last else None
+        current = int(live.streak_current[position])
+        if row.streak_current != current or row.last_completed_date != last_date:
+            habit_updates.append({
+                "habit_pk": row.id, "streak": current, "last_date": last_date,
+                "seen_streak": row.streak_current, "seen_last_date": row.last_completed_date,
+            })
+
+    stats_rows = [
+        {
+            "habit_id": row.id,
+            "streak_current": int(out.streak_current[position]),
+            "streak_best": int(out.streak_best[position]),
+            "completion_rate_7": round(float(out.rates[7][position]), 4),
+            "completion_rate_30": round(float(out.rates[30][position]), 4),
+            "completion_rate_90": round(float(out.rates[90][position]), 4),
+            "computed_for": today or date.fromtimestamp(now),
+        }
+        for position, row in enumerate(meta)
+    ]
+
+    habits_table = Habit.__table__
+    # Строку, которую после чтения успели изменить (отметка, сброс стрика), не трогаем
+    update_habit = (
+        update(habits_table)
+        .where(
+            habits_table.c.id == bindparam("habit_pk"),
+            habits_table.c.streak_current == bindparam("seen_streak"),
+            habits_table.c.last_completed_date.is_not_distinct_from(bindparam("seen_last_date")),
+        )
+        .values(streak_current=bindparam("streak"), last_completed_date=bindparam("last_date"))
+    )
+    habits_updated = 0
+    async with engine.begin() as conn:
+        insert = postgresql_insert if conn.dialect.name == "postgresql" else sqlite_insert
+        upsert = insert(HabitStats.__table__)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[HabitStats.habit_id],
+            set_={
+                column.name: upsert.excluded[column.name]
+                for column in HabitStats.__table__.columns if column.name != "habit_id"
+            },
+        )
+        for offset in range(0, len(habit_updates), write_batch):
+            batch = habit_updates[offset:offset + write_batch]
+            if conn.dialect.supports_sane_multi_rowcount:
+                habits_updated += (await conn.execute(update_habit, batch)).rowcount
+            else:
+                # asyncpg не считает строки в executemany - пропуски видны только построчно
+                for params in batch:
+                    habits_updated += (await conn.execute(update_habit, params)).rowcount
+        for offset in range(0, len(stats_rows), write_batch):
+            await conn.execute(upsert, stats_rows[offset:offset + write_batch])
+
+    finished = time.perf_counter()
+    summary = {
+        "habits": len(meta),
+        "log_rows": rows_total,
+        "habits_fixed": habits_updated,
+        "habits_skipped": len(habit_updates) - habits_updated,
+        "compute_s": round(computed_at - started, 2),
+        "write_s": round(finished - computed_at, 2),
+    }
+    logger.info(f"Habit stats recomputed: {summary}")
+    return summary
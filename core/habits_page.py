@@ -0,0 +1,113 @@
+"""
+Постраничный список привычек: keyset по (created_at, id) и сборка текста без конкатенаций
+"""
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Select, and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import get_settings
+from models.habit import Habit
+from utils.callbacks import HabitsPage
+
+NEXT = "n"
+PREV = "p"
+
+@dataclass(frozen=True)
+class HabitRow:
+    """Только те колонки, что нужны списку"""
+    id: int
+    name: str
+    streak_current: int
+    last_completed_date: Optional[date]
+    created_at: Optional[date]
+
+    @property
+    def cursor_day(self) -> int:
+        return self.created_at.toordinal() if self.created_at else 0
+
+@dataclass(frozen=True)
+class HabitsPageResult:
+    rows: List[HabitRow]
+    prev_page: Optional[HabitsPage]
+    next_page: Optional[HabitsPage]
+
+def _after(day: Optional[date], habit_id: int):
+    """(created_at, id) > (day, habit_id); NULL created_at в SQLite идет первым"""
+    if day is None:
+        return or_(Habit.created_at.is_not(None), and_(Habit.created_at.is_(None), Habit.id > habit_id))
+    return or_(Habit.created_at > day, and_(Habit.created_at == day, Habit.id > habit_id))
+
+def _before(day: Optional[date], habit_id: int):
+    """(created_at, id) < (day, habit_id)"""
+    if day is None:
+        return and_(Habit.created_at.is_(None), Habit.id < habit_id)
+    return or_(
+        Habit.created_at.is_(None),
+        Habit.created_at < day,
+        and_(Habit.created_at == day, Habit.id < habit_id),
+    )
+
+def habits_page_query(user_id: int, cursor: Optional[HabitsPage] = None, limit: int = 11) -> Select:
+    """Страница активных привычек по индексу idx_habits_user_active_created"""
+    query = select(
+        Habit.id, Habit.name, Habit.streak_current, Habit.last_completed_date, Habit.created_at
+    ).where(and_(Habit.user_id == user_id, Habit.is_active == True))
+
+    if cursor is None:
+        return query.order_by(Habit.created_at, Habit.id).limit(limit)
+
+    day = date.fromordinal(cursor.day) if cursor.day else None
+    if cursor.direction == PREV:
+        # Назад идем по убыванию, потом разворачиваем
+        return query.where(_before(day, cursor.habit_id)).order_by(
+            Habit.created_at.desc(), Habit.id.desc()
+        ).limit(limit)
+    return query.where(_after(day, cursor.habit_id)).order_by(Habit.created_at, Habit.id).limit(limit)
+
+async def load_habits_page(db: AsyncSession, user_id: int, cursor: Optional[HabitsPage] = None,
+                           page_size: Optional[int] = None) -> HabitsPageResult:
+    """Страница привычек и курсоры соседних страниц (лишняя строка говорит, есть ли еще)"""
+    page_size = page_size or get_settings().HABITS_PAGE_SIZE
+    result = await db.execute(habits_page_query(user_id, cursor, page_size + 1))
+    rows = [HabitRow(*row) for row in result]
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    backward = cursor is not None and cursor.direction == PREV
+    if backward:
+        rows.reverse()
+
+    if not rows:
+        return HabitsPageResult(rows, None, None)
+
+    # Курсор пришел со страницы, значит в обратную сторону привычки есть
+    has_prev = has_more if backward else cursor is not None
+    has_next = True if backward else has_more
+    first, last = rows[0], rows[-1]
+    return HabitsPageResult(
+        rows,
+        HabitsPage(PREV, first.cursor_day, first.id) if has_prev else None,
+        HabitsPage(NEXT, last.cursor_day, last.id) if has_next else None,
+    )
+
+def habit_status(row: HabitRow, today: date) -> Tuple[str, str]:
+    """Эмодзи и текст статуса выполнения"""
+    if row.last_completed_date == today:
+        return "✅", "выполнена сегодня"
+    if row.last_completed_date == today - timedelta(days=1):
+        return "🔄", "вчера выполнена"
+    return "⭕", f"пропуск {row.streak_current} дней"
+
+def render_habits_page(rows: List[HabitRow], today: Optional[date] = None) -> str:
+    """Текст страницы списка привычек"""
+    today = today or date.today()
+    lines = ["📊 <b>Твои привычки:</b>", ""]
+    for row in rows:
+        emoji, status = habit_status(row, today)
+        lines.append(f"{emoji} <b>{row.name}</b> ({status})")
+    lines.append("")
+    lines.append("💡 Нажми на привычку, чтобы отметить выполнение")
+    return "\n".join(lines)
@@ -0,0 +1,181 @@
+"""
+Гороскопы: кэш в памяти перед таблицей horoscope_cache и одна генерация на знак и день
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import and_, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.database import read_session
+from core.writer import db_writer
+from models.horoscope import HoroscopeCache
+
+logger = logging.getLogger(__name__)
+
+# Через таблицу, а не ORM: реестр core.database.Base не конфигурируется
+# (relationship Subscription.user ссылается на User из models.Base)
+horoscopes = HoroscopeCache.__table__
+
+# Код из callback_data -> (эмодзи, название); порядок - как на клавиатуре
+SIGNS: Dict[str, Tuple[str, str]] = {
+    "aries": ("♈", "Овен"), "taurus": ("♉", "Телец"), "gemini": ("♊", "Близнецы"),
+    "cancer": ("♋", "Рак"), "leo": ("♌", "Лев"), "virgo": ("♍", "Дева"),
+    "libra": ("♎", "Весы"), "scorpio": ("♏", "Скорпион"), "sagittarius": ("♐", "Стрелец"),
+    "capricorn": ("♑", "Козерог"), "aquarius": ("♒", "Водолей"), "pisces": ("♓", "Рыбы"),
+}
+
+MEMORY = "memory"
+DATABASE = "db"
+GENERATED = "llm"
+
+# Генерация текста для знака: (название знака) -> текст; ошибка - исключение
+Generator = Callable[[str], Awaitable[str]]
+
+@dataclass(frozen=True)
+class Horoscope:
+    sign: str
+    day: date
+    text: str
+    source: str  # memory, db или llm
+
+    @property
+    def generated(self) -> bool:
+        """Только генерация тратит AI-лимит пользователя"""
+        return self.source == GENERATED
+
+def cache_key(sign: str, day: date) -> Tuple[str, str]:
+    return sign, day.isoformat()
+
+def stored_query(sign: str, day: date):
+    """Текст знака на день точным поиском по uq_horoscope_sign_date"""
+    return select(horoscopes.c.content).where(and_(
+        horoscopes.c.zodiac_sign == sign, horoscopes.c.horoscope_date == day.isoformat()
+    ))
+
+class HoroscopeCacheService:
+    """Двухуровневый кэш гороскопов с single-flight
+
+    Первый уровень - dict в процессе (знаков 12, поэтому хранятся только
+    текущие дни), второй - horoscope_cache с уникальным индексом по
+    (знак, день). Промах обоих уровней запускает одну задачу на ключ: все
+    одновременные запросы этого знака ждут ее результат, LLM вызывается один
+    раз. Ошибка генерации не кэшируется, а ждавшие ее повторяют попытку
+    сами - лимит ведущего не должен отказывать остальным.
+    """
+
+    def __init__(self, session_factory=read_session, writer=db_writer):
+        self.session_factory = session_factory
+        self.writer = writer
+        self._memory: Dict[Tuple[str, str], str] = {}
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+
+        # Метрики
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.generated_total = 0
+        self.joined_total = 0
+        self.failures_total = 0
+
+    def peek(self, sign: str, day: date) -> Optional[str]:
+        """Текст из памяти без запросов"""
+        return self._memory.get(cache_key(sign, day))
+
+    def remember(self, sign: str, day: date, text: str):
+        # Старые дни больше не спросят; вчерашний оставляем - завтрашний готовится заранее
+        oldest = (day - timedelta(days=1)).isoformat()
+        stale = [key for key in self._memory if key[0] == sign and key[1] < oldest]
+        for key in stale:
+            del self._memory[key]
+        self._memory[cache_key(sign, day)] = text
+
+    async def get(self, sign: str, day: date, generate: Generator) -> Horoscope:
+        """Гороскоп знака на день: память, затем БД, затем одна генерация на всех"""
+        text = self.peek(sign, day)
+        if text is not None:
+            self.memory_hits += 1
+            return Horoscope(sign, day, text, MEMORY)
+
+        key = cache_key(sign, day)
+        task = self._inflight.get(key)
+        if task is not None:
+            self.joined_total += 1
+            try:
+                text, source = await asyncio.shield(task)
+            except Exception:
+                # Ведущий не смог (например, его лимит исчерпан) - пробуем со своим генератором
+                return await self._lead(key, sign, day, generate)
+            # Для присоединившихся это попадание, даже если текст только что сгенерирован
+            return Horoscope(sign, day, text, MEMORY if source == GENERATED else source)
+
+        return await self._lead(key, sign, day, generate)
+
+    async def _lead(self, key, sign: str, day: date, generate: Generator) -> Horoscope:
+        task = self._inflight.get(key)
+        if task is None or task.done():
+            # Отдельная задача: отмена ведущего обработчика не обрывает генерацию для остальных
+            task = asyncio.create_task(self._load(sign, day, generate), name=f"horoscope-{sign}")
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        text, source = await asyncio.shield(task)
+        return Horoscope(sign, day, text, source)
+
+    def _forget(self, key, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    async def _load(self, sign: str, day: date, generate: Generator) -> Tuple[str, str]:
+        text = await self.load_stored(sign, day)
+        if text is not None:
+            self.db_hits += 1
+            self.remember(sign, day, text)
+            return text, DATABASE
+
+        try:
+            text = await generate(SIGNS[sign][1])
+        except Exception:
+            self.failures_total += 1
+            raise
+        self.generated_total += 1
+
+        # Уже сгенерированный кем-то текст (другой процесс) не перезаписываем
+        text = await self.writer.submit(lambda db: self._store_job(db, sign, day, text))
+        self.remember(sign, day, text)
+        return text, GENERATED
+
+    async def load_stored(self, sign: str, day: date) -> Optional[str]:
+        """Второй уровень: один SELECT"""
+        async with self.session_factory() as db:
+            return await db.scalar(stored_query(sign, day))
+
+    @staticmethod
+    async def _store_job(db: AsyncSession, sign: str, day: date, text: str) -> str:
+        """Вставка с ON CONFLICT DO NOTHING; возвращает текст, который в итоге лежит в таблице"""
+        insert = postgresql_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+        inserted = await db.scalar(
+            insert(horoscopes)
+            .values(zodiac_sign=sign, horoscope_date=day.isoformat(), content=text)
+            .on_conflict_do_nothing(index_elements=["zodiac_sign", "horoscope_date"])
+            .returning(horoscopes.c.content)
+        )
+        if inserted is not None:
+            return inserted
+        return await db.scalar(stored_query(sign, day))
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._memory),
+            "in_flight": len(self._inflight),
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "generated": self.generated_total,
+            "joined": self.joined_total,
+            "failures": self.failures_total,
+        }
+
+horoscope_cache = HoroscopeCacheService()
@@ -0,0 +1,175 @@
+"""
+Предгенерация гороскопов: все знаки на завтра готовы до полуночи
+"""
+import asyncio
+import logging
+import random
+import time as time_module
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Optional, Set
+
+from config import get_settings
+from core.horoscope import SIGNS, Generator, horoscope_cache
+from core.metrics import Histogram
+from utils.llm_client import llm_client
+
+logger = logging.getLogger(__name__)
+
+# Ответ OpenRouter ждем до 30 с, повторы с backoff - до минут
+GENERATION_BUCKETS_MS = (250, 500, 1000, 2500, 5000, 10000, 20000, 30000, 60000, 120000)
+
+# Неудачный запуск повторяем не позже чем через 10 минут
+RETRY_INTERVAL = 600
+MAX_SLEEP = 3600
+
+class HoroscopePregenerator:
+    """Пакетная генерация всех знаков на следующий день
+
+    За lead_minutes до полуночи запускает по задаче на знак, не больше
+    concurrency одновременно, и кладет тексты в horoscope_cache: первый
+    запрос нового дня - попадание в память. Ошибка знака повторяется с
+    экспоненциальной задержкой и джиттером, слот при этом не освобождается,
+    чтобы не усиливать нагрузку на упавший API. Генерация идет через
+    single-flight кэша, поэтому совпавший по времени запрос пользователя не
+    вызовет LLM второй раз. При старте готовится и текущий день: уже
+    сохраненные тексты просто поднимаются из БД в память.
+    """
+
+    def __init__(self, cache=horoscope_cache, generate: Optional[Generator] = None,
+                 lead_minutes: Optional[int] = None, concurrency: Optional[int] = None,
+                 retries: Optional[int] = None, backoff: Optional[float] = None):
+        settings = get_settings()
+        self.cache = cache
+        self.generate = generate or llm_client.generate_daily_horoscope
+        self.lead = timedelta(minutes=lead_minutes if lead_minutes is not None else settings.HOROSCOPE_PREGEN_LEAD_MINUTES)
+        self.concurrency = concurrency or settings.HOROSCOPE_PREGEN_CONCURRENCY
+        self.retries = retries if retries is not None else settings.HOROSCOPE_PREGEN_RETRIES
+        self.backoff = backoff if backoff is not None else settings.HOROSCOPE_PREGEN_BACKOFF_SECONDS
+
+        self._done: Set[date] = set()
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.latency = Histogram(GENERATION_BUCKETS_MS)
+        self.last_latency_ms: Dict[str, float] = {}
+        self.last_day: Optional[date] = None
+        self.last_run_ms = 0.0
+        self.runs_total = 0
+        self.generated_total = 0
+        self.retries_total = 0
+        self.failed_signs_total = 0
+
+    def target_day(self, now: datetime) -> date:
+        """Завтра, если до полуночи меньше lead, иначе сегодня"""
+        return (now + self.lead).date()
+
+    def next_run(self, now: datetime) -> datetime:
+        """Момент, когда target_day сменится"""
+        return datetime.combine(self.target_day(now) + timedelta(days=1), time()) - self.lead
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="horoscope-pregen")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        logger.info(
+            f"Horoscope pregeneration started ({int(self.lead.total_seconds() // 60)} min before midnight, "
+            f"concurrency {self.concurrency})"
+        )
+        while True:
+            try:
+                complete = await self.run_due()
+            except Exception as e:
+                logger.error(f"Horoscope pregeneration failed: {e}", exc_info=True)
+                complete = False
+
+            now = datetime.now()
+            wake_in = (self.next_run(now) - now).total_seconds()
+            if not complete:
+                wake_in = min(wake_in, RETRY_INTERVAL)
+            await asyncio.sleep(min(max(wake_in, 1.0), MAX_SLEEP))
+
+    async def run_due(self, now: Optional[datetime] = None) -> bool:
+        """Подготовить сегодня и целевой день, если еще не готовы. True - все знаки на месте"""
+        now = now or datetime.now()
+        complete = True
+        for day in sorted({now.date(), self.target_day(now)}):
+            if day in self._done:
+                continue
+            if await self.run(day):
+                self._done.add(day)
+            else:
+                complete = False
+        self._done = {day for day in self._done if day >= now.date()}
+        return complete
+
+    async def run(self, day: date) -> bool:
+        """Все знаки на день day. True, если готовы все"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time_module.perf_counter()
+        results = await asyncio.gather(*(self._prepare(sign, day, semaphore) for sign in SIGNS))
+        elapsed_ms = (time_module.perf_counter() - started) * 1000
+
+        latencies = {sign: ms for sign, ms in zip(SIGNS, results) if ms is not None}
+        failed = [sign for sign in SIGNS if sign not in latencies]
+        self.runs_total += 1
+        self.failed_signs_total += len(failed)
+        self.last_day = day
+        self.last_latency_ms = latencies
+        self.last_run_ms = elapsed_ms
+
+        slowest = max(latencies, key=latencies.get, default=None)
+        logger.info(
+            f"Horoscopes for {day}: {len(latencies)}/{len(SIGNS)} ready in {elapsed_ms:.0f} ms"
+            + (f", slowest {slowest} {latencies[slowest]:.0f} ms" if slowest else "")
+            + (f", failed: {', '.join(failed)}" if failed else "")
+        )
+        return not failed
+
+    async def _prepare(self, sign: str, day: date, semaphore: asyncio.Semaphore) -> Optional[float]:
+        """Один знак с повторами. Возвращает задержку в мс или None, если попытки кончились"""
+        async with semaphore:
+            started = time_module.perf_counter()
+            for attempt in range(self.retries + 1):
+                try:
+                    horoscope = await self.cache.get(sign, day, self.generate)
+                except Exception as e:
+                    if attempt == self.retries:
+                        logger.error(f"Horoscope {sign} for {day} failed after {attempt + 1} attempts: {e}")
+                        return None
+                    self.retries_total += 1
+                    delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                    logger.warning(f"Horoscope {sign} for {day} failed ({e}), retry in {delay:.1f} s")
+                    await asyncio.sleep(delay)
+                    continue
+
+                elapsed_ms = (time_module.perf_counter() - started) * 1000
+                if horoscope.generated:
+                    self.generated_total += 1
+                    self.latency.observe(elapsed_ms)
+                logger.info(
+                    f"Horoscope {sign} for {day}: {horoscope.source} in {elapsed_ms:.0f} ms (attempt {attempt + 1})"
+                )
+                return elapsed_ms
+
+    def stats(self) -> dict:
+        slowest = max(self.last_latency_ms, key=self.last_latency_ms.get, default=None)
+        return {
+            "last_day": self.last_day.isoformat() if self.last_day else None,
+            "ready": len(self.last_latency_ms),
+            "last_run_ms": round(self.last_run_ms, 1),
+            "slowest": slowest,
+            "slowest_ms": round(self.last_latency_ms[slowest], 1) if slowest else 0.0,
+            "generated": self.generated_total,
+            "retries": self.retries_total,
+            "failed_signs": self.failed_signs_total,
+            "p95_ms": self.latency.percentile(95),
+        }
+
+horoscope_pregen = HoroscopePregenerator()
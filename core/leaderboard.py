@@ -0,0 +1,308 @@
+"""
+Рейтинг по XP: топ-K в памяти и гистограмма XP для места любого пользователя
+"""
+import asyncio
+import html
+import logging
+import time
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select
+
+from config import get_settings
+from core.database import read_session
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class LeaderboardEntry:
+    rank: int
+    user_id: int
+    name: str
+    xp: int
+
+@dataclass(frozen=True)
+class LeaderboardView:
+    """Топ, место пользователя и соседи вокруг него"""
+    top: List[LeaderboardEntry]
+    rank: int
+    xp: int
+    total_users: int
+    neighbors: List[LeaderboardEntry]
+
+def display_name(first_name: Optional[str], username: Optional[str], user_id: int) -> str:
+    return first_name or (f"@{username}" if username else f"Игрок #{user_id}")
+
+def _sort_key(xp: int, user_id: int) -> Tuple[int, int]:
+    """Порядок рейтинга: XP по убыванию, при равенстве - id по убыванию (как обход idx_users_xp назад)"""
+    return -xp, -user_id
+
+def top_query(limit: int):
+    """Первые limit пользователей обратным обходом idx_users_xp"""
+    return select(User.id, User.first_name, User.username, User.xp).where(User.xp.is_not(None)).order_by(
+        User.xp.desc(), User.id.desc()
+    ).limit(limit)
+
+def neighbors_query(user_id: int, xp: int, limit: int, above: bool):
+    """Соседи пользователя вне топа: limit строк выше или ниже по (xp, id)"""
+    query = select(User.id, User.first_name, User.username, User.xp)
+    if above:
+        return query.where(or_(User.xp > xp, and_(User.xp == xp, User.id > user_id))).order_by(
+            User.xp, User.id
+        ).limit(limit)
+    return query.where(or_(User.xp < xp, and_(User.xp == xp, User.id < user_id))).order_by(
+        User.xp.desc(), User.id.desc()
+    ).limit(limit)
+
+class XpCounts:
+    """Дерево Фенвика «XP -> число пользователей»: изменение и префиксная сумма за O(log max_xp)
+
+    Индекс - само значение XP. Размер растет удвоением при первом XP
+    больше текущего максимума (пересборка за O(размер), амортизированно редкая).
+    """
+
+    def __init__(self, histogram: Optional[Dict[int, int]] = None):
+        self._size = max(histogram or (0,)) + 1
+        self._build(histogram or {})
+
+    def _build(self, histogram: Dict[int, int]):
+        tree = [0] * (self._size + 1)
+        for xp, count in histogram.items():
+            tree[xp + 1] += count
+        for index in range(1, self._size + 1):
+            parent = index + (index & -index)
+            if parent <= self._size:
+                tree[parent] += tree[index]
+        self._tree = tree
+
+    def _counts(self) -> Dict[int, int]:
+        return {xp: count for xp in range(self._size) if (count := self.at_most(xp) - self.at_most(xp - 1))}
+
+    def add(self, xp: int, delta: int):
+        if xp >= self._size:
+            counts = self._counts()
+            self._size = max(xp + 1, self._size * 2)
+            self._build(counts)
+        index = xp + 1
+        while index <= self._size:
+            self._tree[index] += delta
+            index += index & -index
+
+    def at_most(self, xp: int) -> int:
+        """Число пользователей с XP <= xp"""
+        index = min(xp, self._size - 1) + 1
+        total = 0
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+class Leaderboard:
+    """Рейтинг без ORDER BY/COUNT по users на каждый запрос
+
+    Топ-K - отсортированный список ключей (-xp, -id) и имена его участников.
+    Место считается по дереву Фенвика над XP: 1 + число пользователей с
+    большим XP (равный XP - равное место). XP только растет, поэтому топ
+    остается точным: войти в него можно лишь через начисление, которое
+    проходит через record_xp. Все, что идет мимо (правки в БД, другие
+    процессы), подтягивается полной пересборкой раз в refresh_seconds.
+    Пользователи, зарегистрированные после загрузки (id больше
+    максимального), учитываются отдельно: их прежнего XP нет в гистограмме.
+    """
+
+    def __init__(self, session_factory=read_session, top_k: Optional[int] = None,
+                 refresh_seconds: Optional[float] = None):
+        settings = get_settings()
+        self.session_factory = session_factory
+        self.top_k = top_k or settings.LEADERBOARD_TOP_K
+        self.refresh_seconds = refresh_seconds if refresh_seconds is not None else settings.LEADERBOARD_REFRESH_SECONDS
+
+        self._top: List[Tuple[int, int]] = []
+        self._members: Dict[int, Tuple[str, int]] = {}  # user_id -> (имя, xp)
+        self._histogram: Dict[int, int] = {}
+        self._counts = XpCounts()
+        self._total = 0
+        self._max_loaded_id = 0
+        self._added: Dict[int, int] = {}  # user_id -> xp для пользователей новее загрузки
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+        # Метрики
+        self.loads_total = 0
+        self.last_load_ms = 0.0
+        self.updates_total = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    async def ensure_loaded(self):
+        """Загрузить или пересобрать, если снимок старше refresh_seconds"""
+        if self.loaded and time.monotonic() - self._loaded_at < self.refresh_seconds:
+            return
+        async with self._lock:
+            if self.loaded and time.monotonic() - self._loaded_at < self.refresh_seconds:
+                return
+            await self.load()
+
+    async def load(self):
+        """Гистограмма - один GROUP BY по покрывающему idx_users_xp, топ - LIMIT по нему же"""
+        started = time.perf_counter()
+        async with self.session_factory() as db:
+            histogram = dict((await db.execute(
+                select(func.coalesce(User.xp, 0), func.count()).group_by(func.coalesce(User.xp, 0))
+            )).all())
+            top_rows = (await db.execute(top_query(self.top_k))).all()
+            max_id = await db.scalar(select(func.max(User.id)))
+
+        self._histogram = histogram
+        self._counts = XpCounts(histogram)
+        self._total = sum(histogram.values())
+        self._max_loaded_id = max_id or 0
+        self._added = {}
+        self._top = sorted(_sort_key(row.xp, row.id) for row in top_rows)
+        self._members = {
+            row.id: (display_name(row.first_name, row.username, row.id), row.xp) for row in top_rows
+        }
+        self._loaded_at = time.monotonic()
+
+        self.loads_total += 1
+        self.last_load_ms = (time.perf_counter() - started) * 1000
+        logger.info(
+            f"Leaderboard loaded: {self._total} users, top {len(self._top)}, "
+            f"{len(self._histogram)} XP values in {self.last_load_ms:.1f} ms"
+        )
+
+    def _move(self, old_xp: Optional[int], new_xp: int):
+        if old_xp is not None and self._histogram.get(old_xp, 0) > 0:
+            self._histogram[old_xp] -= 1
+            if not self._histogram[old_xp]:
+                del self._histogram[old_xp]
+            self._counts.add(old_xp, -1)
+        else:
+            # Пользователь, которого не было при загрузке
+            self._total += 1
+        self._histogram[new_xp] = self._histogram.get(new_xp, 0) + 1
+        self._counts.add(new_xp, 1)
+
+    def _previous_xp(self, user_id: int, xp: int, gained: int) -> Optional[int]:
+        """XP пользователя в гистограмме до начисления; None - его там еще нет"""
+        member = self._members.get(user_id)
+        if member is not None:
+            return member[1]
+        if user_id > self._max_loaded_id:
+            return self._added.get(user_id)
+        return xp - gained
+
+    def record_xp(self, user_id: int, xp: int, gained: int, name: str):
+        """Учесть начисление после коммита: xp - новое значение, gained - прибавка"""
+        if not self.loaded:
+            return
+        self.updates_total += 1
+        member = self._members.get(user_id)
+        old_xp = self._previous_xp(user_id, xp, gained)
+        self._move(old_xp, xp)
+        if user_id > self._max_loaded_id:
+            self._added[user_id] = xp
+
+        key = _sort_key(xp, user_id)
+        if member is not None:
+            del self._top[bisect_left(self._top, _sort_key(old_xp, user_id))]
+        elif len(self._top) >= self.top_k and key > self._top[-1]:
+            return
+        insort(self._top, key)
+        self._members[user_id] = (name, xp)
+        if len(self._top) > self.top_k:
+            _, dropped = self._top.pop()
+            self._members.pop(-dropped, None)
+
+    def rank_of(self, xp: int) -> int:
+        """1 + число пользователей с большим XP: префиксная сумма дерева Фенвика"""
+        return 1 + self._total - self._counts.at_most(max(xp, 0))
+
+    def _entry(self, user_id: int, name: str, xp: int) -> LeaderboardEntry:
+        return LeaderboardEntry(self.rank_of(xp), user_id, name, xp)
+
+    def top(self, limit: int) -> List[LeaderboardEntry]:
+        entries = []
+        for _, negative_id in islice(self._top, limit):
+            name, xp = self._members[-negative_id]
+            entries.append(self._entry(-negative_id, name, xp))
+        return entries
+
+    async def view(self, user_id: int, xp: int, name: str, limit: Optional[int] = None,
+                   neighbors: Optional[int] = None) -> LeaderboardView:
+        """Топ limit, место и по neighbors соседей сверху и снизу"""
+        settings = get_settings()
+        limit = limit or settings.LEADERBOARD_SHOW
+        neighbors = neighbors if neighbors is not None else settings.LEADERBOARD_NEIGHBORS
+        await self.ensure_loaded()
+
+        member = self._members.get(user_id)
+        if member is not None:
+            xp = member[1]
+        position = bisect_left(self._top, _sort_key(xp, user_id))
+        whole_table = len(self._top) >= self._total
+        if member is not None and (position + neighbors < len(self._top) or whole_table):
+            # Соседи целиком в топе - без запросов
+            around = [
+                (-negative_id, *self._members[-negative_id])
+                for _, negative_id in self._top[max(position - neighbors, 0):position + neighbors + 1]
+            ]
+            nearby = [self._entry(member_id, member_name, member_xp) for member_id, member_name, member_xp in around]
+        else:
+            nearby = await self._load_neighbors(user_id, xp, name, neighbors)
+
+        return LeaderboardView(self.top(limit), self.rank_of(xp), xp, self._total, nearby)
+
+    async def _load_neighbors(self, user_id: int, xp: int, name: str, neighbors: int) -> List[LeaderboardEntry]:
+        """Два коротких диапазонных запроса по idx_users_xp вместо COUNT по всей таблице"""
+        async with self.session_factory() as db:
+            above = (await db.execute(neighbors_query(user_id, xp, neighbors, above=True))).all()
+            below = (await db.execute(neighbors_query(user_id, xp, neighbors, above=False))).all()
+        rows = [
+            (row.id, display_name(row.first_name, row.username, row.id), row.xp)
+            for row in (*reversed(above), *below)
+        ]
+        rows.insert(len(above), (user_id, name, xp))
+        return [self._entry(*row) for row in rows]
+
+    def stats(self) -> dict:
+        return {
+            "users": self._total,
+            "top": len(self._top),
+            "xp_values": len(self._histogram),
+            "loads": self.loads_total,
+            "updates": self.updates_total,
+            "last_load_ms": round(self.last_load_ms, 1),
+        }
+
+def render_leaderboard(view: LeaderboardView, user_id: int) -> str:
+    """Текст рейтинга: топ, затем соседи, если пользователь не виден в топе"""
+    lines = ["🏆 <b>Рейтинг по XP</b>", ""]
+    shown = set()
+    for entry in view.top:
+        shown.add(entry.user_id)
+        lines.append(_render_entry(entry, user_id))
+
+    if user_id not in shown and view.neighbors:
+        lines.append("…")
+        for entry in view.neighbors:
+            if entry.user_id not in shown:
+                lines.append(_render_entry(entry, user_id))
+
+    lines.append("")
+    lines.append(f"📍 Твое место: {view.rank} из {view.total_users} ({view.xp} XP)")
+    return "\n".join(lines)
+
+def _render_entry(entry: LeaderboardEntry, user_id: int) -> str:
+    name = html.escape(entry.name)
+    if entry.user_id == user_id:
+        name = f"<b>{name}</b>"
+    return f"{entry.rank}. {name} — {entry.xp} XP"
+
+leaderboard = Leaderboard()
@@ -0,0 +1,158 @@
+"""
+Метрики производительности: гистограммы задержек обработчиков и счетчики SQL
+"""
+import bisect
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы, мс
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами: O(1) память на метрику"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # последняя - +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, pct: float) -> float:
+        """Оценка перцентиля по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        rank = pct / 100 * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return self.buckets[index] if index < len(self.buckets) else self.max
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+@dataclass
+class UpdateStats:
+    """SQL-статистика одного апдейта"""
+    queries: int = 0
+    db_time: float = 0.0
+
+# Статистика текущего апдейта; SQL-хуки пишут в нее через contextvar
+current_update_stats: ContextVar[Optional[UpdateStats]] = ContextVar("current_update_stats", default=None)
+
+class MetricsRegistry:
+    """Все метрики процесса в одном месте"""
+
+    def __init__(self, recent_slow_size: int = 50):
+        self.handler_latency: Dict[str, Histogram] = {}
+        self.handler_queries: Dict[str, Histogram] = {}
+        self.queries_total = 0
+        self.db_time_total = 0.0
+        self.updates_total = 0
+        self.n_plus_one_total = 0
+        # Последние апдейты, похожие на N+1: (handler, queries, db_ms)
+        self.recent_n_plus_one = deque(maxlen=recent_slow_size)
+        self.started_at = time.time()
+
+    def observe_update(self, handler_name: str, latency_ms: float, stats: UpdateStats, query_threshold: int):
+        self.updates_total += 1
+        self.handler_latency.setdefault(handler_name, Histogram()).observe(latency_ms)
+        self.handler_queries.setdefault(handler_name, Histogram(QUERY_BUCKETS)).observe(stats.queries)
+
+        if stats.queries > query_threshold:
+            self.n_plus_one_total += 1
+            self.recent_n_plus_one.append((handler_name, stats.queries, round(stats.db_time * 1000, 1)))
+            logger.warning(
+                f"Possible N+1 in {handler_name}: {stats.queries} queries, "
+                f"{stats.db_time * 1000:.1f} ms in DB"
+            )
+
+    def top_handlers(self, limit: int = 10) -> List[tuple]:
+        """Обработчики, отсортированные по p95 задержки"""
+        rows = [
+            (name, hist.count, hist.percentile(50), hist.percentile(95), hist.percentile(99),
+             self.handler_queries[name].mean)
+            for name, hist in self.handler_latency.items()
+        ]
+        rows.sort(key=lambda row: row[3], reverse=True)
+        return rows[:limit]
+
+    def render_prometheus(self, extra: Optional[Dict[str, float]] = None) -> str:
+        """Текстовый формат Prometheus для /metrics"""
+        lines = [
+            "# TYPE milana_updates_total counter",
+            f"milana_updates_total {self.updates_total}",
+            "# TYPE milana_db_queries_total counter",
+            f"milana_db_queries_total {self.queries_total}",
+            "# TYPE milana_db_time_seconds_total counter",
+            f"milana_db_time_seconds_total {self.db_time_total:.6f}",
+            "# TYPE milana_n_plus_one_total counter",
+            f"milana_n_plus_one_total {self.n_plus_one_total}",
+            "# TYPE milana_handler_latency_ms histogram",
+        ]
+        for name, hist in sorted(self.handler_latency.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(hist.buckets, hist.counts):
+                cumulative += bucket_count
+                lines.append(f'milana_handler_latency_ms_bucket{{handler="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'milana_handler_latency_ms_bucket{{handler="{name}",le="+Inf"}} {hist.count}')
+            lines.append(f'milana_handler_latency_ms_sum{{handler="{name}"}} {hist.sum:.3f}')
+            lines.append(f'milana_handler_latency_ms_count{{handler="{name}"}} {hist.count}')
+        for key, value in (extra or {}).items():
+            lines.append(f"{key} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+def install_query_hooks(async_engine):
+    """Считать запросы и время в БД для движка (глобально и на текущий апдейт)"""
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(async_engine.sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+        metrics.queries_total += 1
+        metrics.db_time_total += elapsed
+
+        stats = current_update_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+
+async def start_metrics_server(host: str, port: int, extra_provider: Optional[Callable[[], Dict[str, float]]] = None):
+    """Локальный HTTP-эндпоинт /metrics. Возвращает runner для остановки"""
+    from aiohttp import web
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        extra = extra_provider() if extra_provider else None
+        return web.Response(text=metrics.render_prometheus(extra), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics endpoint: http://{host}:{port}/metrics")
+    return runner
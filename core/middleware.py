@@ -0,0 +1,116 @@
+"""
+Middleware бота
+"""
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import TelegramObject
+
+from config import get_settings
+from core.database import async_session, read_session, session_has_writes
+from core.metrics import UpdateStats, current_update_stats, metrics
+from core.user_locks import ShardedLocks, user_locks
+
+logger = logging.getLogger(__name__)
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Unit of work: не больше одной сессии БД на апдейт
+
+    Сессия передается в обработчик аргументом ``db``. По умолчанию она берется
+    из пула только для чтения; обработчики, которые пишут напрямую, помечаются
+    флагом ``flags={"db": "write"}``. Соединение берется из пула при первом
+    запросе, COMMIT выполняется только если сессия что-то писала, а чистое
+    чтение обходится без COMMIT/ROLLBACK.
+    """
+
+    def __init__(self, write_factory=async_session, read_factory=read_session):
+        self.write_factory = write_factory
+        self.read_factory = read_factory
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        # Вложенный вызов (например, повторная обработка) переиспользует сессию
+        if "db" in data:
+            return await handler(event, data)
+
+        factory = self.write_factory if get_flag(data, "db") == "write" else self.read_factory
+        session = factory()
+        data["db"] = session
+        try:
+            result = await handler(event, data)
+            if session_has_writes(session):
+                await session.commit()
+            return result
+        except Exception:
+            if session_has_writes(session):
+                await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+class MetricsMiddleware(BaseMiddleware):
+    """Задержка обработчика и число SQL-запросов апдейта
+
+    Регистрируется раньше DbSessionMiddleware, чтобы в замер попали и
+    получение сессии, и COMMIT. Апдейт, сделавший больше
+    ``PERF_QUERY_THRESHOLD`` запросов, помечается как вероятный N+1.
+    """
+
+    def __init__(self, query_threshold: Optional[int] = None):
+        self.query_threshold = query_threshold or get_settings().PERF_QUERY_THRESHOLD
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        callback = getattr(data.get("handler"), "callback", None)
+        handler_name = getattr(callback, "__name__", "unknown")
+
+        stats = UpdateStats()
+        token = current_update_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            latency_ms = (time.perf_counter() - started) * 1000
+            current_update_stats.reset(token)
+            metrics.observe_update(handler_name, latency_ms, stats, self.query_threshold)
+
+class UserLockMiddleware(BaseMiddleware):
+    """Апдейты одного пользователя обрабатываются по очереди
+
+    Регистрируется outer-middleware, чтобы под блокировку попали и фильтры.
+    Состояние FSM aiogram читает раньше (на уровне update), поэтому под
+    блокировкой оно перечитывается: фильтр по состоянию увидит результат
+    предыдущего апдейта этого пользователя.
+    """
+
+    def __init__(self, locks: Optional[ShardedLocks] = None):
+        self.locks = locks or user_locks
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        async with self.locks.hold(user.id) as locked:
+            if not locked:
+                logger.warning(f"User lock wait timed out for {user.id}, handling without lock")
+            state = data.get("state")
+            if state is not None:
+                data["raw_state"] = await state.get_state()
+            return await handler(event, data)
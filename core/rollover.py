@@ -0,0 +1,146 @@
+"""
+Ночной сброс прерванных стриков по часовым поясам пользователей
+"""
+import asyncio
+import logging
+import time as time_module
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import get_settings
+from core.database import read_session
+from core.scheduler import _zone
+from core.writer import db_writer
+from models.habit import Habit
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Пересматриваем список часовых поясов не реже раза в час (новые пользователи)
+MAX_SLEEP = 3600
+
+def rollover_statement(timezone: Optional[str], cutoff: date):
+    """Один UPDATE на часовой пояс: стрик прерван, если последнее выполнение раньше cutoff
+
+    Условие streak_current > 0 делает повторный запуск пустым.
+    """
+    users_in_zone = select(User.id).where(
+        User.timezone.is_(None) if timezone is None else User.timezone == timezone
+    )
+    return (
+        update(Habit)
+        .where(and_(
+            Habit.user_id.in_(users_in_zone),
+            Habit.streak_current > 0,
+            or_(Habit.last_completed_date.is_(None), Habit.last_completed_date < cutoff),
+        ))
+        .values(streak_current=0)
+        .execution_options(synchronize_session=False)
+    )
+
+class StreakRollover:
+    """Сброс стриков в ROLLOVER_HOUR по местному времени каждого часового пояса
+
+    Для каждого пояса помним последний обработанный «день сброса» (местная
+    дата момента now - ROLLOVER_HOUR). Если он сменился - пояс пора
+    обрабатывать: стрик прерван, если привычка не выполнена ни в этот день,
+    ни накануне (то же правило, что и при отметке выполнения). Выполнения
+    датируются тем же местным днем (local_today), так что правило сверяется
+    по одним часам, а не по часам сервера. При старте
+    день не известен ни для одного пояса, поэтому пропущенные, пока бот
+    был выключен, сбросы догоняются сразу.
+    """
+
+    def __init__(self, session_factory=read_session, writer=db_writer, hour: Optional[int] = None):
+        self.session_factory = session_factory
+        self.writer = writer
+        self.hour = hour if hour is not None else get_settings().STREAK_ROLLOVER_HOUR
+
+        self._last_day: Dict[Optional[str], date] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.runs_total = 0
+        self.rows_reset_total = 0
+        self.last_run_ms = 0.0
+
+    def rollover_day(self, timezone: Optional[str], now: float) -> date:
+        local = datetime.fromtimestamp(now, _zone(timezone))
+        return (local - timedelta(hours=self.hour)).date()
+
+    def next_boundary(self, timezone: Optional[str], now: float) -> float:
+        """Ближайший момент ROLLOVER_HOUR:00 по местному времени после now"""
+        zone = _zone(timezone)
+        day = self.rollover_day(timezone, now) + timedelta(days=1)
+        return datetime.combine(day, time(self.hour), tzinfo=zone).timestamp()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="streak-rollover")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _timezones(self) -> List[Optional[str]]:
+        async with self.session_factory() as db:
+            return list((await db.execute(select(User.timezone).distinct())).scalars())
+
+    async def _run(self):
+        logger.info(f"Streak rollover started (at {self.hour:02d}:00 local time)")
+        while True:
+            try:
+                timezones = await self.run_due()
+            except Exception as e:
+                logger.error(f"Streak rollover failed: {e}", exc_info=True)
+                timezones = list(self._last_day)
+
+            now = time_module.time()
+            wake_at = min((self.next_boundary(tz, now) for tz in timezones), default=now + MAX_SLEEP)
+            await asyncio.sleep(min(max(wake_at - now, 1.0), MAX_SLEEP))
+
+    async def run_due(self, now: Optional[float] = None) -> List[Optional[str]]:
+        """Обработать пояса, в которых наступил новый день сброса. Возвращает все пояса"""
+        now = now or time_module.time()
+        timezones = await self._timezones()
+        for timezone in timezones:
+            day = self.rollover_day(timezone, now)
+            if self._last_day.get(timezone) != day:
+                await self.run_timezone(timezone, day)
+                self._last_day[timezone] = day
+        return timezones
+
+    async def run_timezone(self, timezone: Optional[str], day: date) -> int:
+        """Сброс стриков одного пояса за день сброса day. Возвращает число строк"""
+        cutoff = day - timedelta(days=1)
+        started = time_module.perf_counter()
+        rows = await self.writer.submit(lambda db: self._reset_job(db, timezone, cutoff))
+        elapsed_ms = (time_module.perf_counter() - started) * 1000
+
+        self.runs_total += 1
+        self.rows_reset_total += rows
+        self.last_run_ms = elapsed_ms
+        logger.info(
+            f"Streak rollover {timezone or 'UTC'} for {day}: {rows} streaks reset in {elapsed_ms:.1f} ms"
+        )
+        return rows
+
+    @staticmethod
+    async def _reset_job(db: AsyncSession, timezone: Optional[str], cutoff: date) -> int:
+        result = await db.execute(rollover_statement(timezone, cutoff))
+        return result.rowcount or 0
+
+    def stats(self) -> dict:
+        return {
+            "timezones": len(self._last_day),
+            "runs": self.runs_total,
+            "rows_reset": self.rows_reset_total,
+            "last_run_ms": round(self.last_run_ms, 1),
+        }
+
+streak_rollover = StreakRollover()
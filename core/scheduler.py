@@ -0,0 +1,359 @@
+"""
+Планировщик напоминаний о привычках (Habit.reminder_time)
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time as time_module
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import and_, event, inspect, select
+from sqlalchemy.orm import Session
+
+from config import get_settings
+from core.database import read_session
+from models.habit import Habit
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Поля, изменение которых меняет расписание
+HABIT_SCHEDULE_FIELDS = ("reminder_time", "is_active", "name", "frequency", "last_completed_date", "user_id")
+USER_SCHEDULE_FIELDS = ("timezone", "notifications_enabled")
+
+@dataclass
+class Reminder:
+    """Напоминание одной привычки"""
+    habit_id: int
+    user_id: int
+    telegram_id: int
+    habit_name: str
+    reminder_time: time
+    tz: ZoneInfo
+    frequency: str = "daily"
+    completed_on: Optional[date] = None
+    fire_at: float = 0.0  # UTC, секунды epoch
+
+    def local_date(self, timestamp: float) -> date:
+        return datetime.fromtimestamp(timestamp, self.tz).date()
+
+    def next_fire_at(self, after: float) -> float:
+        """Ближайший момент строго после after в часовом поясе пользователя"""
+        day = self.local_date(after)
+        for _ in range(8):
+            if _runs_on(self.frequency, day):
+                fire_at = datetime.combine(day, self.reminder_time, tzinfo=self.tz).timestamp()
+                if fire_at > after:
+                    return fire_at
+            day += timedelta(days=1)
+        return after + 86400
+
+def _runs_on(frequency: str, day: date) -> bool:
+    if frequency == "weekdays":
+        return day.weekday() < 5
+    if frequency == "weekends":
+        return day.weekday() >= 5
+    return True
+
+_zones: Dict[str, ZoneInfo] = {}
+
+def _zone(name: Optional[str]) -> ZoneInfo:
+    """ZoneInfo с кэшем; неизвестный пояс считаем UTC"""
+    name = name or "UTC"
+    zone = _zones.get(name)
+    if zone is None:
+        try:
+            zone = ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            logger.warning(f"Unknown timezone {name!r}, using UTC")
+            zone = ZoneInfo("UTC")
+        _zones[name] = zone
+    return zone
+
+def local_today(timezone: Optional[str], now: Optional[float] = None) -> date:
+    """Сегодня в поясе пользователя: по этой дате пишутся выполнения и сбрасываются стрики"""
+    return datetime.fromtimestamp(now if now is not None else time_module.time(), _zone(timezone)).date()
+
+# Колонки одной строки расписания: привычка + часовой пояс владельца
+_REMINDER_COLUMNS = (
+    Habit.id, Habit.user_id, Habit.name, Habit.reminder_time, Habit.frequency, Habit.last_completed_date,
+    User.telegram_id, User.timezone,
+)
+
+def reminders_query():
+    """Все активные напоминания одним запросом (индекс idx_habits_active_reminder)"""
+    return (
+        select(*_REMINDER_COLUMNS)
+        .join(User, User.id == Habit.user_id)
+        .where(and_(
+            Habit.is_active == True,
+            Habit.reminder_time.is_not(None),
+            User.notifications_enabled == True,
+        ))
+    )
+
+ReminderCallback = Callable[[Reminder], Awaitable[None]]
+
+class ReminderScheduler:
+    """Min-heap напоминаний по UTC-времени срабатывания
+
+    Таблица читается целиком один раз при старте. Дальше расписание меняется
+    точечно: ORM-события после коммита сообщают id измененных привычек и
+    пользователей, и планировщик перечитывает только их. Устаревшие записи
+    кучи не удаляются, а пропускаются при извлечении (ленивое удаление).
+    """
+
+    def __init__(self, session_factory=read_session, send_concurrency: Optional[int] = None):
+        self.session_factory = session_factory
+        self.send_concurrency = send_concurrency or get_settings().REMINDER_SEND_CONCURRENCY
+        self.on_fire: Optional[ReminderCallback] = None
+
+        self._heap: List[tuple] = []
+        self._reminders: Dict[int, Reminder] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._pending_habits: Set[int] = set()
+        self._pending_users: Set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._sends: Set[asyncio.Task] = set()
+        self._send_slots: Optional[asyncio.Semaphore] = None
+
+        # Счетчики для мониторинга
+        self.fired_total = 0
+        self.skipped_total = 0
+        self.failed_total = 0
+        self.refreshes_total = 0
+        self.max_lag = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def __len__(self) -> int:
+        return len(self._reminders)
+
+    # --- Управление ---
+
+    async def start(self, on_fire: ReminderCallback):
+        """Загрузить расписание и запустить цикл в текущем event loop"""
+        if self.is_running:
+            return
+        self.on_fire = on_fire
+        self._wakeup = asyncio.Event()
+        self._send_slots = asyncio.Semaphore(self.send_concurrency)
+        await self.load()
+        self._task = asyncio.create_task(self._run(), name="reminder-scheduler")
+
+    async def stop(self):
+        if not self.is_running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._sends:
+            await asyncio.gather(*self._sends, return_exceptions=True)
+
+    async def load(self):
+        """Полная загрузка расписания (только при старте)"""
+        started = time_module.perf_counter()
+        async with self.session_factory() as db:
+            rows = (await db.execute(reminders_query())).all()
+
+        now = time_module.time()
+        self._reminders = {}
+        self._heap = []
+        for row in rows:
+            reminder = self._reminder_from_row(row, now)
+            self._reminders[reminder.habit_id] = reminder
+            self._heap.append((reminder.fire_at, next(self._seq), reminder.habit_id))
+        heapq.heapify(self._heap)
+        logger.info(f"Reminder scheduler loaded {len(rows)} reminders in {time_module.perf_counter() - started:.2f}s")
+
+    # --- Точечные изменения ---
+
+    def notify_changed(self, habit_ids: Iterable[int] = (), user_ids: Iterable[int] = ()):
+        """Перечитать указанные привычки/пользователей в цикле планировщика"""
+        if not self.is_running:
+            return
+        self._pending_habits.update(habit_ids)
+        self._pending_users.update(user_ids)
+        self._wakeup.set()
+
+    def schedule(self, reminder: Reminder, now: Optional[float] = None):
+        reminder.fire_at = reminder.next_fire_at(now or time_module.time())
+        self._reminders[reminder.habit_id] = reminder
+        heapq.heappush(self._heap, (reminder.fire_at, next(self._seq), reminder.habit_id))
+        self._wakeup.set()
+
+    def unschedule(self, habit_id: int):
+        # Запись в куче станет устаревшей и будет пропущена
+        self._reminders.pop(habit_id, None)
+
+    def _compact(self):
+        """Выбросить устаревшие записи, если их накопилось больше, чем живых"""
+        if len(self._heap) <= 2 * len(self._reminders) + 1024:
+            return
+        self._heap = [
+            entry for entry in self._heap
+            if (reminder := self._reminders.get(entry[2])) is not None and reminder.fire_at == entry[0]
+        ]
+        heapq.heapify(self._heap)
+
+    async def _refresh_pending(self):
+        """Перечитать измененные привычки: запрос по первичному ключу или user_id"""
+        habit_ids, self._pending_habits = self._pending_habits, set()
+        user_ids, self._pending_users = self._pending_users, set()
+
+        rows = []
+        async with self.session_factory() as db:
+            if habit_ids:
+                rows += (await db.execute(reminders_query().where(Habit.id.in_(habit_ids)))).all()
+            if user_ids:
+                rows += (await db.execute(reminders_query().where(Habit.user_id.in_(user_ids)))).all()
+
+        # Удаленные, выключенные и оставшиеся без времени напоминания
+        found = {row.id for row in rows}
+        stale = habit_ids - found
+        stale.update(
+            habit_id for habit_id, reminder in self._reminders.items()
+            if reminder.user_id in user_ids and habit_id not in found
+        )
+        for habit_id in stale:
+            self.unschedule(habit_id)
+
+        now = time_module.time()
+        for row in rows:
+            reminder = self._reminder_from_row(row, now)
+            current = self._reminders.get(reminder.habit_id)
+            self._reminders[reminder.habit_id] = reminder
+            # Время не изменилось - запись в куче остается актуальной
+            if current is None or current.fire_at != reminder.fire_at:
+                heapq.heappush(self._heap, (reminder.fire_at, next(self._seq), reminder.habit_id))
+                self._wakeup.set()
+
+        self._compact()
+        self.refreshes_total += 1
+
+    def _reminder_from_row(self, row, now: float) -> Reminder:
+        reminder = Reminder(
+            habit_id=row.id,
+            user_id=row.user_id,
+            telegram_id=row.telegram_id,
+            habit_name=row.name,
+            reminder_time=row.reminder_time,
+            tz=_zone(row.timezone),
+            frequency=row.frequency or "daily",
+            completed_on=row.last_completed_date,
+        )
+        reminder.fire_at = reminder.next_fire_at(now)
+        return reminder
+
+    # --- Цикл ---
+
+    async def _run(self):
+        logger.info("Reminder scheduler started")
+        while True:
+            if self._pending_habits or self._pending_users:
+                try:
+                    await self._refresh_pending()
+                except Exception as e:
+                    logger.error(f"Reminder refresh failed: {e}", exc_info=True)
+
+            now = time_module.time()
+            self._fire_due(now)
+
+            # Спим до ближайшего срабатывания или до изменения расписания
+            timeout = self._heap[0][0] - time_module.time() if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _fire_due(self, now: float):
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, _, habit_id = heapq.heappop(self._heap)
+            reminder = self._reminders.get(habit_id)
+            if reminder is None or reminder.fire_at != fire_at:
+                continue  # устаревшая запись
+
+            self.max_lag = max(self.max_lag, now - fire_at)
+            # Уже выполнена сегодня по местному времени - молчим, но планируем на завтра
+            if reminder.completed_on == reminder.local_date(fire_at):
+                self.skipped_total += 1
+            else:
+                self._dispatch(reminder)
+
+            reminder.fire_at = reminder.next_fire_at(fire_at)
+            heapq.heappush(self._heap, (reminder.fire_at, next(self._seq), habit_id))
+
+    def _dispatch(self, reminder: Reminder):
+        task = asyncio.create_task(self._send(reminder))
+        self._sends.add(task)
+        task.add_done_callback(self._sends.discard)
+
+    async def _send(self, reminder: Reminder):
+        async with self._send_slots:
+            try:
+                await self.on_fire(reminder)
+                self.fired_total += 1
+            except Exception as e:
+                self.failed_total += 1
+                logger.error(f"Reminder for habit {reminder.habit_id} failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "scheduled": len(self._reminders),
+            "heap_size": len(self._heap),
+            "fired": self.fired_total,
+            "skipped": self.skipped_total,
+            "failed": self.failed_total,
+            "refreshes": self.refreshes_total,
+            "max_lag_s": round(self.max_lag, 3),
+        }
+
+reminder_scheduler = ReminderScheduler()
+
+# Изменения привычек и настроек пользователей через ORM попадают в планировщик после commit
+def _changed(obj, fields) -> bool:
+    state = inspect(obj)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+def mark_habit_changed(session, habit_id: int):
+    """Для записей мимо flush (UPDATE ... RETURNING): перечитать привычку после commit"""
+    session.info.setdefault("changed_reminder_habit_ids", set()).add(habit_id)
+
+@event.listens_for(Session, "after_flush")
+def _collect_schedule_changes(session, flush_context):
+    habits = session.info.setdefault("changed_reminder_habit_ids", set())
+    users = session.info.setdefault("changed_reminder_user_ids", set())
+    for obj in session.new:
+        if isinstance(obj, Habit) and obj.reminder_time is not None:
+            habits.add(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, Habit) and _changed(obj, HABIT_SCHEDULE_FIELDS):
+            habits.add(obj.id)
+        elif isinstance(obj, User) and _changed(obj, USER_SCHEDULE_FIELDS):
+            users.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Habit):
+            habits.add(obj.id)
+
+@event.listens_for(Session, "after_commit")
+def _apply_schedule_changes(session):
+    habits = session.info.pop("changed_reminder_habit_ids", None)
+    users = session.info.pop("changed_reminder_user_ids", None)
+    if habits or users:
+        reminder_scheduler.notify_changed(habits or (), users or ())
+
+@event.listens_for(Session, "after_rollback")
+def _forget_schedule_changes(session):
+    session.info.pop("changed_reminder_habit_ids", None)
+    session.info.pop("changed_reminder_user_ids", None)
@@ -0,0 +1,200 @@
+"""
+Исходящие сообщения с учетом флуд-лимитов Telegram
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import get_settings
+from core.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: меньше - раньше
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Приоритет вызовов Bot API из текущей задачи; по умолчанию - ответ пользователю
+send_priority: ContextVar[int] = ContextVar("send_priority", default=PRIORITY_INTERACTIVE)
+
+@contextmanager
+def bulk_sending():
+    """Отправки внутри блока (напоминания, рассылки) уступают ответам пользователям"""
+    token = send_priority.set(PRIORITY_BULK)
+    try:
+        yield
+    finally:
+        send_priority.reset(token)
+
+def is_rate_limited(api_method: str) -> bool:
+    """Методы, которые Telegram считает исходящими сообщениями"""
+    return api_method.startswith(("send", "editMessage", "copyMessage", "forwardMessage"))
+
+class TokenBucket:
+    """Классическое ведро токенов: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self, now: Optional[float] = None) -> float:
+        """Сколько ждать до появления токена"""
+        now = now or time.monotonic()
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, now: Optional[float] = None):
+        self._refill(now or time.monotonic())
+        self.tokens -= 1
+
+class OutboundRateLimiter(BaseRequestMiddleware):
+    """Middleware сессии бота: глобальное ведро, темп по чатам и RetryAfter
+
+    Порядок для каждого исходящего сообщения: сначала резервируется слот в
+    чате (не чаще ``SEND_CHAT_RATE`` в секунду), затем запрос встает в общую
+    очередь с приоритетом, которую разбирает глобальное ведро
+    ``SEND_GLOBAL_RATE``. На RetryAfter отправки ставятся на паузу, а
+    глобальный темп временно снижается и затем плавно восстанавливается.
+    """
+
+    def __init__(self, global_rate: Optional[float] = None, chat_rate: Optional[float] = None,
+                 max_retries: Optional[int] = None):
+        settings = get_settings()
+        self.global_rate = global_rate or settings.SEND_GLOBAL_RATE
+        self.chat_interval = 1 / (chat_rate or settings.SEND_CHAT_RATE)
+        self.chat_burst_window = (max(1, settings.SEND_CHAT_BURST) - 1) * self.chat_interval
+        self.enabled = settings.SEND_RATE_LIMIT_ENABLED
+        self.max_retries = max_retries if max_retries is not None else settings.SEND_MAX_RETRIES
+
+        # Емкость 1: равномерный темп без всплеска, который Telegram счел бы флудом
+        self._bucket = TokenBucket(self.global_rate, 1)
+        self._chat_next: Dict[int, float] = {}
+        self._waiters: List[tuple] = []
+        self._seq = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._paused_until = 0.0
+
+        # Метрики: ожидание в очереди и полное время отправки, мс
+        self.queue_wait = Histogram()
+        self.send_latency = Histogram()
+        self.sent_total = 0
+        self.retry_after_total = 0
+        self.dropped_total = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    # --- Per-chat ---
+
+    async def _wait_chat_slot(self, chat_id):
+        """GCRA: каждый запрос бронирует следующий слот чата, допускается короткий всплеск"""
+        now = time.monotonic()
+        start = max(now - self.chat_burst_window, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = start + self.chat_interval
+        if len(self._chat_next) > 10000:
+            self._chat_next = {chat: at for chat, at in self._chat_next.items() if at > now}
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    # --- Глобальная очередь ---
+
+    async def _wait_global_slot(self, priority: int):
+        now = time.monotonic()
+        if not self._waiters and now >= self._paused_until and self._bucket.delay(now) == 0:
+            self._bucket.consume(now)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch(), name="outbound-rate-limiter")
+        await future
+
+    async def _dispatch(self):
+        """Выдавать токены ожидающим в порядке приоритета"""
+        while self._waiters:
+            now = time.monotonic()
+            wait = max(self._paused_until - now, self._bucket.delay(now))
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue  # отправитель отменен
+            self._bucket.consume()
+            future.set_result(None)
+
+    def _on_retry_after(self, retry_after: float):
+        """Флуд-контроль: пауза для всех и временное снижение темпа"""
+        self.retry_after_total += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        self._bucket.rate = max(1.0, self._bucket.rate * 0.8)
+
+    def _on_success(self):
+        # Аддитивное восстановление темпа после снижения
+        if self._bucket.rate < self.global_rate:
+            self._bucket.rate = min(self.global_rate, self._bucket.rate + 0.05)
+
+    # --- Middleware ---
+
+    async def __call__(self, make_request, bot, method):
+        if not self.enabled or not is_rate_limited(method.__api_method__):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        priority = send_priority.get()
+        started = time.monotonic()
+
+        for attempt in range(self.max_retries + 1):
+            if chat_id is not None:
+                await self._wait_chat_slot(chat_id)
+            await self._wait_global_slot(priority)
+            if attempt == 0:
+                self.queue_wait.observe((time.monotonic() - started) * 1000)
+
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self._on_retry_after(e.retry_after)
+                if chat_id is not None:
+                    self._chat_next[chat_id] = time.monotonic() + e.retry_after
+                logger.warning(f"Flood control on {method.__api_method__} (chat {chat_id}): retry in {e.retry_after}s")
+                if attempt == self.max_retries:
+                    self.dropped_total += 1
+                    raise
+                continue
+
+            self._on_success()
+            self.sent_total += 1
+            self.send_latency.observe((time.monotonic() - started) * 1000)
+            return response
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "sent": self.sent_total,
+            "retry_after": self.retry_after_total,
+            "dropped": self.dropped_total,
+            "current_rate": round(self._bucket.rate, 2),
+            "wait_p95_ms": self.queue_wait.percentile(95),
+            "send_p95_ms": self.send_latency.percentile(95),
+        }
+
+# Общий лимитер процесса: лимиты Telegram действуют на бота целиком
+outbound_limiter = OutboundRateLimiter()
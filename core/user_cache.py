@@ -0,0 +1,141 @@
+"""
+Кэш идентичности пользователей: telegram_id -> снимок строки users
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, time as dt_time
+from typing import Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from config import get_settings
+from models.user import User
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """Неизменяемый снимок пользователя, безопасный для шаринга между обработчиками"""
+    id: int
+    telegram_id: int
+    timezone: str
+    xp: int
+    level: int
+    notifications_enabled: bool
+    notification_time: Optional[dt_time]
+    daily_ai_requests: int
+    total_ai_requests: int
+    last_ai_request_date: Optional[date]
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserSnapshot":
+        return cls(
+            id=user.id,
+            telegram_id=user.telegram_id,
+            timezone=user.timezone or "UTC",
+            xp=user.xp or 0,
+            level=user.level or 1,
+            notifications_enabled=bool(user.notifications_enabled),
+            notification_time=user.notification_time,
+            daily_ai_requests=user.daily_ai_requests or 0,
+            total_ai_requests=user.total_ai_requests or 0,
+            last_ai_request_date=user.last_ai_request_date,
+        )
+
+class UserCache:
+    """Ограниченный LRU-кэш с TTL и счетчиками попаданий"""
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._items: "OrderedDict[int, tuple[float, UserSnapshot]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, telegram_id: int) -> Optional[UserSnapshot]:
+        item = self._items.get(telegram_id)
+        if item is None:
+            self.misses += 1
+            return None
+
+        expires_at, snapshot = item
+        if expires_at < time.monotonic():
+            del self._items[telegram_id]
+            self.misses += 1
+            return None
+
+        self._items.move_to_end(telegram_id)
+        self.hits += 1
+        return snapshot
+
+    def put(self, snapshot: UserSnapshot):
+        self._items[snapshot.telegram_id] = (time.monotonic() + self.ttl, snapshot)
+        self._items.move_to_end(snapshot.telegram_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, telegram_id: int):
+        if self._items.pop(telegram_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+_settings = get_settings()
+user_cache = UserCache(max_size=_settings.USER_CACHE_SIZE, ttl_seconds=_settings.USER_CACHE_TTL)
+
+async def get_user_by_telegram_id(db: AsyncSession, telegram_id: int) -> Optional[UserSnapshot]:
+    """Найти пользователя по telegram_id: сначала кэш, затем SELECT"""
+    snapshot = user_cache.get(telegram_id)
+    if snapshot is not None:
+        return snapshot
+
+    result = await db.execute(
+        select(User).where(User.telegram_id == telegram_id)
+    )
+    user = result.scalar_one_or_none()
+    if user is None:
+        return None
+
+    snapshot = UserSnapshot.from_user(user)
+    user_cache.put(snapshot)
+    return snapshot
+
+def mark_user_changed(session, telegram_id: int):
+    """Инвалидация для записей мимо flush (UPDATE ... RETURNING): сейчас и после commit"""
+    session.info.setdefault("changed_user_telegram_ids", set()).add(telegram_id)
+    user_cache.invalidate(telegram_id)
+
+# Инвалидация при любой записи в User через ORM: при flush и повторно после commit,
+# чтобы параллельный читатель не успел закэшировать незакоммиченное состояние
+@event.listens_for(Session, "after_flush")
+def _invalidate_flushed_users(session, flush_context):
+    changed = session.info.setdefault("changed_user_telegram_ids", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, User) and obj.telegram_id is not None:
+            changed.add(obj.telegram_id)
+            user_cache.invalidate(obj.telegram_id)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session):
+    for telegram_id in session.info.pop("changed_user_telegram_ids", ()):
+        user_cache.invalidate(telegram_id)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_users(session):
+    session.info.pop("changed_user_telegram_ids", None)
@@ -0,0 +1,81 @@
+"""
+Шардированные блокировки пользователей: апдейты одного пользователя по очереди, разных - параллельно
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from config import get_settings
+from core.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+class ShardedLocks:
+    """Фиксированный массив asyncio.Lock, ключ - id пользователя по модулю числа шардов
+
+    Память не растет с числом пользователей. Два пользователя изредка
+    попадают в один шард и ждут друг друга - это цена ограниченной памяти,
+    при тысяче шардов она незаметна.
+    """
+
+    def __init__(self, shards: Optional[int] = None, timeout: Optional[float] = None):
+        settings = get_settings()
+        self.shards = shards or settings.USER_LOCK_SHARDS
+        self.timeout = timeout if timeout is not None else settings.USER_LOCK_TIMEOUT
+        self._locks = [asyncio.Lock() for _ in range(self.shards)]
+
+        # Метрики
+        self.wait = Histogram()
+        self.acquired_total = 0
+        self.contended_total = 0
+        self.timeouts_total = 0
+
+    def shard(self, key: int) -> int:
+        return key % self.shards
+
+    @asynccontextmanager
+    async def hold(self, key: int) -> AsyncIterator[bool]:
+        """Удерживать шард ключа. Отдает False, если за timeout дождаться не удалось
+
+        По таймауту апдейт обрабатывается без блокировки: лучше рискнуть
+        гонкой, чем потерять апдейт из-за зависшего соседа по шарду.
+        """
+        lock = self._locks[self.shard(key)]
+        started = time.perf_counter()
+        if lock.locked():
+            self.contended_total += 1
+            try:
+                await asyncio.wait_for(lock.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts_total += 1
+                self.wait.observe((time.perf_counter() - started) * 1000)
+                yield False
+                return
+        else:
+            await lock.acquire()
+        self.wait.observe((time.perf_counter() - started) * 1000)
+        self.acquired_total += 1
+        try:
+            yield True
+        finally:
+            lock.release()
+
+    @property
+    def held(self) -> int:
+        return sum(lock.locked() for lock in self._locks)
+
+    def stats(self) -> dict:
+        return {
+            "shards": self.shards,
+            "held": self.held,
+            "acquired": self.acquired_total,
+            "contended": self.contended_total,
+            "timeouts": self.timeouts_total,
+            "wait_p95_ms": self.wait.percentile(95),
+            "wait_max_ms": round(self.wait.max, 1),
+        }
+
+# Общие для сообщений и callback-запросов: оба вида апдейтов пользователя идут по очереди
+user_locks = ShardedLocks()
@@ -0,0 +1,129 @@
+"""
+Режим webhook: aiohttp-сервер с ограниченной параллельной обработкой апдейтов
+"""
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from config import get_settings
+from core.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class WebhookServer:
+    """Принимает апдейты от Telegram и обрабатывает их пулом воркеров
+
+    Запрос подтверждается сразу после постановки апдейта в очередь, а работа
+    идет в фоне не более чем в ``concurrency`` задач. Если очередь
+    (``backlog``) заполнена, отвечаем 503: Telegram повторит доставку позже,
+    а память процесса не растет без ограничений.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, path: Optional[str] = None, secret: Optional[str] = None,
+                 concurrency: Optional[int] = None, backlog: Optional[int] = None):
+        settings = get_settings()
+        self.dp = dp
+        self.bot = bot
+        self.path = path or settings.WEBHOOK_PATH
+        self.secret = secret if secret is not None else settings.WEBHOOK_SECRET
+        self.concurrency = concurrency or settings.WEBHOOK_CONCURRENCY
+        self.backlog = backlog or settings.WEBHOOK_BACKLOG
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+
+        # Метрики
+        self.accepted_total = 0
+        self.rejected_total = 0
+        self.failed_total = 0
+        self.queue_wait = Histogram()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self, host: str, port: int) -> int:
+        """Запустить воркеры и HTTP-сервер. Возвращает фактический порт"""
+        self._queue = asyncio.Queue(maxsize=self.backlog)
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"webhook-worker-{index}")
+            for index in range(self.concurrency)
+        ]
+
+        app = web.Application()
+        app.router.add_post(self.path, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"Webhook server listening on {host}:{port}{self.path} ({self.concurrency} workers)")
+        return port
+
+    async def stop(self):
+        """Перестать принимать апдейты и дообработать очередь"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._queue is not None:
+            await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if self.secret and request.headers.get(SECRET_HEADER) != self.secret:
+            return web.Response(status=401)
+
+        update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        try:
+            self._queue.put_nowait((update, time.monotonic()))
+        except asyncio.QueueFull:
+            self.rejected_total += 1
+            return web.Response(status=503)
+
+        self.accepted_total += 1
+        return web.Response()
+
+    async def _worker(self):
+        while True:
+            update, received_at = await self._queue.get()
+            self.queue_wait.observe((time.monotonic() - received_at) * 1000)
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                self.failed_total += 1
+                logger.error(f"Update {update.update_id} failed: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "accepted": self.accepted_total,
+            "rejected": self.rejected_total,
+            "failed": self.failed_total,
+            "wait_p95_ms": self.queue_wait.percentile(95),
+        }
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> WebhookServer:
+    """Поднять сервер и зарегистрировать webhook в Telegram"""
+    settings = get_settings()
+    server = WebhookServer(dp, bot)
+    await server.start(settings.WEBHOOK_HOST, settings.WEBHOOK_PORT)
+    await bot.set_webhook(
+        url=settings.WEBHOOK_URL.rstrip("/") + server.path,
+        secret_token=settings.WEBHOOK_SECRET or None,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+    )
+    return server
@@ -0,0 +1,146 @@
+"""
+Единственный писатель в БД с групповым коммитом
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import get_settings
+from core.database import async_session
+from core.metrics import current_update_stats
+
+logger = logging.getLogger(__name__)
+
+# Задание на запись: корутина, получающая сессию писателя
+WriteJob = Callable[[AsyncSession], Awaitable[Any]]
+
+class DatabaseWriter:
+    """Применяет мутации из очереди пачками: одна транзакция и один fsync на пачку"""
+
+    def __init__(self, session_factory=async_session, batch_window_ms: Optional[int] = None,
+                 max_batch: Optional[int] = None, queue_size: Optional[int] = None):
+        settings = get_settings()
+        self.session_factory = session_factory
+        self.batch_window = (batch_window_ms if batch_window_ms is not None
+                             else settings.DB_WRITER_BATCH_WINDOW_MS) / 1000
+        self.max_batch = max_batch or settings.DB_WRITER_MAX_BATCH
+        self.queue_size = queue_size or settings.DB_WRITER_QUEUE_SIZE
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Счетчики для мониторинга
+        self.jobs_total = 0
+        self.batches_total = 0
+        self.failed_jobs = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Запустить корутину писателя в текущем event loop"""
+        if self.is_running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run(), name="db-writer")
+
+    async def stop(self):
+        """Дописать очередь и остановить писателя"""
+        if not self.is_running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, job: WriteJob) -> Any:
+        """Поставить задание в очередь и дождаться подтверждения коммита"""
+        if not self.is_running:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        # Запросы задания засчитываются апдейту, который его отправил
+        await self._queue.put((job, future, current_update_stats.get()))
+        return await future
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _collect_batch(self, first) -> Tuple[List[tuple], bool]:
+        """Собрать все задания, пришедшие в пределах окна группового коммита"""
+        batch = [first]
+        stopping = False
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_window
+
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            try:
+                if timeout <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+
+        return batch, stopping
+
+    async def _apply_batch(self, batch: List[tuple]):
+        """Выполнить пачку в одной транзакции, каждое задание в своем SAVEPOINT"""
+        results = []
+        async with self.session_factory() as session:
+            try:
+                for job, future, stats in batch:
+                    if future.cancelled():
+                        continue
+                    token = current_update_stats.set(stats)
+                    try:
+                        async with session.begin_nested():
+                            result = await job(session)
+                        results.append((future, result, None))
+                    except Exception as e:
+                        # Ошибка одного задания не откатывает остальные
+                        self.failed_jobs += 1
+                        results.append((future, None, e))
+                    finally:
+                        current_update_stats.reset(token)
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Group commit failed for {len(batch)} jobs: {e}", exc_info=True)
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+        # Подтверждаем вызывающим только после успешного коммита
+        for future, result, error in results:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        self.jobs_total += len(batch)
+        self.batches_total += 1
+
+    async def _run(self):
+        logger.info("DB writer started")
+        while True:
+            first = await self._queue.get()
+            if first is None:
+                break
+            batch, stopping = await self._collect_batch(first)
+            await self._apply_batch(batch)
+            if stopping:
+                break
+        logger.info(f"DB writer stopped: {self.jobs_total} jobs in {self.batches_total} batches")
+
+# Глобальный писатель, общий для всех обработчиков
+db_writer = DatabaseWriter()
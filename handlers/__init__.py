@@ -15,6 +15,8 @@ from .subscriptions import router as subscriptions_router
 from .news import router as news_router
 from .settings import router as settings_router
 
+from core.dispatch_index import install_text_index
+
 def register_all_handlers(dp):
     """Регистрирует все обработчики в диспетчере"""
     # Основные команды всегда включены
@@ -31,3 +33,6 @@ def register_all_handlers(dp):
         dp.include_router(news_router)
     if FEATURES.get("settings", False):
         dp.include_router(settings_router)
+    
+    # Индекс точных текстов строится по уже подключенным роутерам
+    install_text_index(dp)
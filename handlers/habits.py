@@ -1,3 +1,5 @@
+import logging
+
 from aiogram import Router, F, types
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -6,32 +8,27 @@ from sqlalchemy import select, and_
 from datetime import date, datetime
 
 from core.database import get_async_session
-from models.user import User
+from core.user_cache import get_user_by_telegram_id
 from models.habit import Habit, HabitRecord
+from utils.callbacks import HabitComplete, HabitConfirm, HabitDeleteAsk
 from utils.keyboards import get_habits_menu, get_habit_confirmation, get_cancel_keyboard, get_main_menu
 
 router = Router(name="habits")
+logger = logging.getLogger(__name__)
 
 class HabitStates(StatesGroup):
     adding_name = State()
     deleting = State()
 
-async def get_user_by_telegram_id(db: AsyncSession, telegram_id: int):
-    """Вспомогательная функция для поиска пользователя по telegram_id"""
-    result = await db.execute(
-        select(User).where(User.telegram_id == telegram_id)
-    )
-    return result.scalar_one_or_none()
-
 # Копируем точный текст из keyboards.py
 HABITS_BUTTON_TEXT = "📊 Трекер привычек"
 
 @router.message(F.text == HABITS_BUTTON_TEXT)
 async def show_habits_menu(message: types.Message):
     """Показать меню трекера привычек"""
-    print(f"🔍 DEBUG: Получено сообщение: '{message.text}'")
-    print(f"🔍 DEBUG: Ожидаем: '{HABITS_BUTTON_TEXT}'")
-    print(f"🔍 DEBUG: Совпадает: {message.text == HABITS_BUTTON_TEXT}")
+    logger.debug(f"Получено сообщение: '{message.text}'")
+    logger.debug(f"Ожидаем: '{HABITS_BUTTON_TEXT}'")
+    logger.debug(f"Совпадает: {message.text == HABITS_BUTTON_TEXT}")
     
     async with get_async_session() as db:
         user = await get_user_by_telegram_id(db, message.from_user.id)
@@ -134,10 +131,10 @@ async def process_habit_name(message: types.Message, state: FSMContext):
         
         await state.clear()
 
-@router.callback_query(F.data.startswith("habit_complete_"))
-async def show_habit_confirmation(callback: types.CallbackQuery):
+@router.callback_query(HabitComplete.filter())
+async def show_habit_confirmation(callback: types.CallbackQuery, payload: HabitComplete):
     """Показать подтверждение выполнения привычки"""
-    habit_id = int(callback.data.split("_")[-1])
+    habit_id = payload.habit_id
     
     async with get_async_session() as db:
         habit = await db.get(Habit, habit_id)
@@ -168,10 +165,10 @@ async def show_habit_confirmation(callback: types.CallbackQuery):
             reply_markup=get_habit_confirmation(habit_id, habit.name)
         )
 
-@router.callback_query(F.data.startswith("habit_confirm_"))
-async def confirm_habit_completion(callback: types.CallbackQuery):
+@router.callback_query(HabitConfirm.filter())
+async def confirm_habit_completion(callback: types.CallbackQuery, payload: HabitConfirm):
     """Подтвердить выполнение привычки"""
-    habit_id = int(callback.data.split("_")[-1])
+    habit_id = payload.habit_id
     
     async with get_async_session() as db:
         habit = await db.get(Habit, habit_id)
@@ -240,7 +237,7 @@ async def start_deleting_habit(callback: types.CallbackQuery, state: FSMContext)
             keyboard_buttons.append(
                 types.InlineKeyboardButton(
                     text=f"🗑️ {habit_name}",
-                    callback_data=f"delete_habit_{habit_id}"
+                    callback_data=HabitDeleteAsk(habit_id).pack()
                 )
             )
         
@@ -253,10 +250,10 @@ async def start_deleting_habit(callback: types.CallbackQuery, state: FSMContext)
         
         await callback.message.edit_text(text, reply_markup=keyboard)
 
-@router.callback_query(F.data.startswith("delete_habit_"))
-async def delete_habit(callback: types.CallbackQuery):
+@router.callback_query(HabitDeleteAsk.filter())
+async def delete_habit(callback: types.CallbackQuery, payload: HabitDeleteAsk):
     """Удалить привычку"""
-    habit_id = int(callback.data.split("_")[-1])
+    habit_id = payload.habit_id
     
     async with get_async_session() as db:
         habit = await db.get(Habit, habit_id)
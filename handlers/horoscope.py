@@ -1,11 +1,14 @@
+import logging
+
 from aiogram import Router, F, types
 
 router = Router(name="horoscope")
+logger = logging.getLogger(__name__)
 
 @router.message(F.text == "🔮 Гороскоп")
 async def show_horoscope_menu(message: types.Message):
     """Заглушка для гороскопа"""
-    print(f"🔍 DEBUG: Гороскоп - получено сообщение: '{message.text}'")
+    logger.debug(f"Гороскоп - получено сообщение: '{message.text}'")
     await message.answer(
         "🔮 <b>Гороскоп</b>\n\n"
         "Этот модуль в разработке...\n\n"
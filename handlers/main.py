@@ -1,3 +1,5 @@
+import logging
+
 from aiogram import Router, F, types
 from aiogram.filters import CommandStart, Command
 from aiogram.fsm.context import FSMContext
@@ -5,21 +7,20 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from core.database import get_async_session
+from core.user_cache import get_user_by_telegram_id
 from models.user import User
 from utils.keyboards import get_main_menu
 from utils.llm_client import llm_client
 
 router = Router()
+logger = logging.getLogger(__name__)
 
 @router.message(CommandStart())
 async def cmd_start(message: types.Message, state: FSMContext):
     """Обработчик команды /start"""
     async with get_async_session() as db:
         # Ищем пользователя по telegram_id
-        result = await db.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+        user = await get_user_by_telegram_id(db, message.from_user.id)
         
         # Если пользователя нет - создаем
         if not user:
@@ -52,7 +53,7 @@ async def cmd_start(message: types.Message, state: FSMContext):
 @router.message(Command("menu"))
 async def show_main_menu(message: types.Message):
     """Показать главное меню"""
-    print(f"🔍 DEBUG: Главное меню - получено сообщение: '{message.text}'")
+    logger.debug(f"Главное меню - получено сообщение: '{message.text}'")
     await message.answer(
         "🏠 <b>Главное меню:</b>\n\n"
         "Выбери нужный раздел:",
@@ -64,10 +65,7 @@ async def show_statistics(message: types.Message):
     """Показать статистику пользователя"""
     async with get_async_session() as db:
         # Ищем пользователя по telegram_id
-        result = await db.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+        user = await get_user_by_telegram_id(db, message.from_user.id)
         
         if not user:
             await message.answer("❌ Сначала начните с команды /start")
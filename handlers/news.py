@@ -1,11 +1,14 @@
+import logging
+
 from aiogram import Router, F, types
 
 router = Router(name="news")
+logger = logging.getLogger(__name__)
 
 @router.message(F.text == "📰 Новости")
 async def show_news_menu(message: types.Message):
     """Заглушка для новостей"""
-    print(f"🔍 DEBUG: Новости - получено сообщение: '{message.text}'")
+    logger.debug(f"Новости - получено сообщение: '{message.text}'")
     await message.answer(
         "📰 <b>Умный агрегатор новостей</b>\n\n"
         "Этот модуль в разработке...\n\n"
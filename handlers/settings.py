@@ -1,11 +1,14 @@
+import logging
+
 from aiogram import Router, F, types
 
 router = Router(name="settings")
+logger = logging.getLogger(__name__)
 
 @router.message(F.text == "⚙️ Настройки")
 async def show_settings_menu(message: types.Message):
     """Заглушка для настроек"""
-    print(f"🔍 DEBUG: Настройки - получено сообщение: '{message.text}'")
+    logger.debug(f"Настройки - получено сообщение: '{message.text}'")
     await message.answer(
         "⚙️ <b>Настройки</b>\n\n"
         "Этот модуль в разработке...\n\n"
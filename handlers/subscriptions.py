@@ -1,11 +1,14 @@
+import logging
+
 from aiogram import Router, F, types
 
 router = Router(name="subscriptions")
+logger = logging.getLogger(__name__)
 
 @router.message(F.text == "💳 Подписки")
 async def show_subscriptions_menu(message: types.Message):
     """Заглушка для подписок"""
-    print(f"🔍 DEBUG: Подписки - получено сообщение: '{message.text}'")
+    logger.debug(f"Подписки - получено сообщение: '{message.text}'")
     await message.answer(
         "💳 <b>Менеджер подписок</b>\n\n"
         "Этот модуль в разработке...\n\n"
@@ -2,8 +2,10 @@
 Упрощенная версия основного бота
 """
 import asyncio
+import html
 import os
 import logging
+import signal
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,19 +13,42 @@ os.environ['DATABASE_URL'] = 'sqlite+aiosqlite:///data/milana.db'
 
 from aiogram import Bot, Dispatcher, Router, F, types
 from aiogram.client.bot import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, and_, delete
 from datetime import date, datetime, timedelta
 
-from core.database import get_async_session, init_db
+from core.database import init_db, dispose_engines
+from config import get_settings
+from core.bot import create_dispatcher
+from core.metrics import metrics, start_metrics_server
+from core.scheduler import Reminder, local_today, reminder_scheduler
+from core.rollover import streak_rollover
+from core.sender import bulk_sending, outbound_limiter
+from core.webhook import run_webhook
+from core.fsm_storage import SQLiteStorage
+from core.dispatch_index import install_text_index
+from core.writer import db_writer
+from core.user_cache import get_user_by_telegram_id, user_cache
+from core.user_locks import user_locks
 from models.user import User
 from models.habit import Habit
+from models.habit_calendar import HabitCalendar
 from models.habit_log_new import HabitLog
+from models.habit_stats import HabitStats
+from core.completion import ALREADY_DONE, NOT_FOUND, apply_completion
+from core.counters import add_xp
+from core.daily_stats import HABIT_COMPLETION_XP, load_range, platform_summary, record_completion, summarize
+from core.habit_calendar import count_completions, mark_completed
+from core.leaderboard import display_name, leaderboard, render_leaderboard
+from core.horoscope import SIGNS, horoscope_cache
+from core.horoscope_pregen import horoscope_pregen
+from core.habits_page import HabitsPageResult, habit_status, load_habits_page, render_habits_page
+from utils.callbacks import HabitComplete, HabitDeleteAsk, HabitDeleteConfirm, HabitsPage, HoroscopeSign
 from utils.keyboards import (
     get_main_menu, 
     get_habits_menu, 
@@ -32,8 +57,12 @@ from utils.keyboards import (
     get_skip_cancel_keyboard,
     get_cancel_keyboard,
     get_habit_confirmation,
-    get_cancel_inline_keyboard
+    get_cancel_inline_keyboard,
+    get_habits_page_menu,
+    get_zodiac_signs,
+    keyboard_cache_info
 )
+from utils.llm_client import LLMError, llm_client
 from version import get_version, get_full_version
 
 # Настройка логирования
@@ -53,12 +82,6 @@ class HabitStates(StatesGroup):
     adding_color = State()
     confirming = State()
 
-async def get_user_by_telegram_id(db: AsyncSession, telegram_id: int):
-    result = await db.execute(
-        select(User).where(User.telegram_id == telegram_id)
-    )
-    return result.scalar_one_or_none()
-
 # Основные команды
 # Универсальный обработчик команды /cancel
 @router.message(F.text == "❌ Отмена")
@@ -84,37 +107,41 @@ async def cancel_command(message: types.Message, state: FSMContext):
         logger.error(f"Error in cancel_command: {e}")
         # Не отвечаем на ошибку, чтобы избежать падения бота
 
+async def _ensure_user_job(db: AsyncSession, telegram_id: int, username, first_name):
+    """Задание писателя: создать пользователя, если его еще нет"""
+    result = await db.execute(
+        select(User.id).where(User.telegram_id == telegram_id)
+    )
+    if result.scalar_one_or_none() is None:
+        db.add(User(
+            telegram_id=telegram_id,
+            username=username,
+            first_name=first_name
+        ))
+
 @router.message(F.text == "/start")
-async def start_cmd(message: types.Message, state: FSMContext):
-    async with get_async_session() as db:
-        result = await db.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
-        )
-        user = result.scalar_one_or_none()
-        
-        if not user:
-            user = User(
-                telegram_id=message.from_user.id,
-                username=message.from_user.username,
-                first_name=message.from_user.first_name
-            )
-            db.add(user)
-            await db.commit()
-        
-        await message.answer(
-            f"👋 Привет, {message.from_user.first_name}!\n\n"
-            "Я — твой личный AI-помощник Milana! 🤖\n\n"
-            "Что я умею:\n"
-            "📊 Отслеживать твои привычки\n"
-            "📰 Присылать краткие новости\n"
-            "🔮 Генерировать гороскопы\n"
-            "💳 Напоминать о подписках\n"
-            "⚙️ Настраивать уведомления\n\n"
-            "Бесплатный лимит: 5 AI-запросов в день 🎯\n\n"
-            "Выбери действие в меню ниже:",
-            reply_markup=get_main_menu()
-        )
-        await state.clear()
+async def start_cmd(message: types.Message, state: FSMContext, db: AsyncSession):
+    user = await get_user_by_telegram_id(db, message.from_user.id)
+    
+    if not user:
+        await db_writer.submit(lambda db: _ensure_user_job(
+            db, message.from_user.id, message.from_user.username, message.from_user.first_name
+        ))
+    
+    await message.answer(
+        f"👋 Привет, {message.from_user.first_name}!\n\n"
+        "Я — твой личный AI-помощник Milana! 🤖\n\n"
+        "Что я умею:\n"
+        "📊 Отслеживать твои привычки\n"
+        "📰 Присылать краткие новости\n"
+        "🔮 Генерировать гороскопы\n"
+        "💳 Напоминать о подписках\n"
+        "⚙️ Настраивать уведомления\n\n"
+        "Бесплатный лимит: 5 AI-запросов в день 🎯\n\n"
+        "Выбери действие в меню ниже:",
+        reply_markup=get_main_menu()
+    )
+    await state.clear()
 
 @router.message(F.text == "/help")
 async def help_cmd(message: types.Message):
@@ -139,76 +166,166 @@ async def version_cmd(message: types.Message):
         reply_markup=get_main_menu()
     )
 
+def _runtime_gauges() -> dict:
+    """Состояние писателя и кэша пользователей для /metrics и /perf"""
+    cache = user_cache.stats()
+    return {
+        "milana_db_writer_queue_depth": db_writer.queue_depth,
+        "milana_db_writer_jobs_total": db_writer.jobs_total,
+        "milana_db_writer_batches_total": db_writer.batches_total,
+        "milana_db_writer_failed_jobs_total": db_writer.failed_jobs,
+        "milana_user_cache_size": cache["size"],
+        "milana_user_cache_hits_total": cache["hits"],
+        "milana_user_cache_misses_total": cache["misses"],
+        "milana_reminders_scheduled": len(reminder_scheduler),
+        "milana_reminders_fired_total": reminder_scheduler.fired_total,
+        "milana_reminders_max_lag_seconds": reminder_scheduler.max_lag,
+        "milana_streak_rollover_rows_reset_total": streak_rollover.rows_reset_total,
+        "milana_streak_rollover_last_run_ms": streak_rollover.last_run_ms,
+        "milana_leaderboard_users": leaderboard.stats()["users"],
+        "milana_leaderboard_loads_total": leaderboard.loads_total,
+        "milana_leaderboard_last_load_ms": leaderboard.last_load_ms,
+        "milana_horoscope_memory_hits_total": horoscope_cache.memory_hits,
+        "milana_horoscope_db_hits_total": horoscope_cache.db_hits,
+        "milana_horoscope_generated_total": horoscope_cache.generated_total,
+        "milana_horoscope_failures_total": horoscope_cache.failures_total,
+        "milana_horoscope_pregen_generated_total": horoscope_pregen.generated_total,
+        "milana_horoscope_pregen_retries_total": horoscope_pregen.retries_total,
+        "milana_horoscope_pregen_failed_signs_total": horoscope_pregen.failed_signs_total,
+        "milana_horoscope_pregen_last_run_ms": horoscope_pregen.last_run_ms,
+        "milana_user_locks_held": user_locks.held,
+        "milana_user_lock_contended_total": user_locks.contended_total,
+        "milana_user_lock_timeouts_total": user_locks.timeouts_total,
+        "milana_user_lock_wait_p95_ms": user_locks.wait.percentile(95),
+        "milana_outbound_queue_depth": outbound_limiter.queue_depth,
+        "milana_outbound_sent_total": outbound_limiter.sent_total,
+        "milana_outbound_retry_after_total": outbound_limiter.retry_after_total,
+        "milana_outbound_dropped_total": outbound_limiter.dropped_total,
+        "milana_outbound_wait_p95_ms": outbound_limiter.queue_wait.percentile(95),
+        "milana_outbound_send_p95_ms": outbound_limiter.send_latency.percentile(95),
+    }
+
+@router.message(F.text == "/perf")
+async def perf_cmd(message: types.Message, db: AsyncSession, fsm_storage):
+    """Сводка производительности (только для администраторов)"""
+    if message.from_user.id not in get_settings().ADMIN_IDS:
+        return
+    
+    lines = [
+        "⚡ <b>Производительность</b>\n",
+        f"Апдейтов: {metrics.updates_total}",
+        f"SQL-запросов: {metrics.queries_total} ({metrics.db_time_total * 1000:.0f} мс в БД)",
+        f"Подозрений на N+1: {metrics.n_plus_one_total}\n",
+        "<b>Обработчики (p50 / p95 / p99, мс, SQL на апдейт):</b>",
+    ]
+    for name, count, p50, p95, p99, queries in metrics.top_handlers():
+        lines.append(f"• <code>{name}</code> ×{count}: {p50:g} / {p95:g} / {p99:g}, {queries:.1f}")
+    
+    if metrics.recent_n_plus_one:
+        lines.append("\n<b>Последние N+1:</b>")
+        for name, queries, db_ms in list(metrics.recent_n_plus_one)[-5:]:
+            lines.append(f"• <code>{name}</code>: {queries} запросов, {db_ms} мс")
+    
+    reminders = reminder_scheduler.stats()
+    lines.append(
+        f"\nНапоминаний: {reminders['scheduled']}, отправлено: {reminders['fired']}, "
+        f"макс. опоздание: {reminders['max_lag_s']} с"
+    )
+    rollover = streak_rollover.stats()
+    lines.append(
+        f"Сброс стриков: {rollover['runs']} запусков по {rollover['timezones']} поясам, "
+        f"сброшено {rollover['rows_reset']}, последний {rollover['last_run_ms']:g} мс"
+    )
+    
+    board = leaderboard.stats()
+    lines.append(
+        f"Рейтинг: {board['users']} пользователей, топ {board['top']}, значений XP: {board['xp_values']}, "
+        f"пересборок: {board['loads']} (последняя {board['last_load_ms']:g} мс), обновлений: {board['updates']}"
+    )
+    
+    gauges = _runtime_gauges()
+    lines.append(
+        f"Очередь писателя: {gauges['milana_db_writer_queue_depth']}, "
+        f"пачек: {gauges['milana_db_writer_batches_total']}, "
+        f"ошибок: {gauges['milana_db_writer_failed_jobs_total']}"
+    )
+    outbound = outbound_limiter.stats()
+    lines.append(
+        f"Исходящие: очередь {outbound['queue_depth']}, RetryAfter: {outbound['retry_after']}, "
+        f"ожидание p95: {outbound['wait_p95_ms']:g} мс, отправка p95: {outbound['send_p95_ms']:g} мс"
+    )
+    lines.append(f"Кэш пользователей: {user_cache.stats()['hit_rate']:.0%} попаданий")
+    horoscopes = horoscope_cache.stats()
+    lines.append(
+        f"Гороскопы: в памяти {horoscopes['cached']}, из памяти {horoscopes['memory_hits']}, "
+        f"из БД {horoscopes['db_hits']}, сгенерировано {horoscopes['generated']}, "
+        f"присоединились {horoscopes['joined']}, ошибок: {horoscopes['failures']}"
+    )
+    pregen = horoscope_pregen.stats()
+    if pregen["last_day"]:
+        lines.append(
+            f"Предгенерация на {pregen['last_day']}: {pregen['ready']}/{len(SIGNS)} знаков "
+            f"за {pregen['last_run_ms']:g} мс, самый долгий {pregen['slowest']} {pregen['slowest_ms']:g} мс, "
+            f"p95 генерации: {pregen['p95_ms']:g} мс, повторов: {pregen['retries']}"
+        )
+    locks = user_locks.stats()
+    lines.append(
+        f"Блокировки пользователей: занято {locks['held']} из {locks['shards']}, "
+        f"ожиданий: {locks['contended']}, таймаутов: {locks['timeouts']}, "
+        f"ожидание p95: {locks['wait_p95_ms']:g} мс, макс. {locks['wait_max_ms']:g} мс"
+    )
+    today = date.today()
+    week = await platform_summary(db, today - timedelta(days=6), today)
+    lines.append(
+        f"За 7 дней: {week['completions']} выполнений у {week['users']} пользователей, "
+        f"{week['xp_gained']} XP"
+    )
+    keyboards = keyboard_cache_info().values()
+    lines.append(
+        f"Кэш клавиатур: {sum(cache['hits'] for cache in keyboards)} попаданий, "
+        f"{sum(cache['currsize'] for cache in keyboards)} в кэше"
+    )
+    
+    if isinstance(fsm_storage, SQLiteStorage):
+        fsm = await fsm_storage.stats()
+        lines.append(
+            f"FSM: {fsm['rows']} строк, в кэше {fsm['cached_keys']} ключей "
+            f"({fsm['active_in_cache']} активных, {fsm['cached_data_bytes']} байт данных), "
+            f"сбросов: {fsm['flushes']}"
+        )
+    
+    await message.answer("\n".join(lines))
+
+def _habits_page_view(page: HabitsPageResult, today: date):
+    """Текст и клавиатура страницы списка привычек"""
+    buttons = tuple(
+        (row.id, f"{habit_status(row, today)[0]} {row.name} ({row.streak_current} дней)")
+        for row in page.rows
+    )
+    return render_habits_page(page.rows, today), get_habits_page_menu(buttons, page.prev_page, page.next_page)
+
 # Кнопки главного меню
 @router.message(F.text == "📊 Трекер привычек")
-async def habits_cmd(message: types.Message):
+async def habits_cmd(message: types.Message, db: AsyncSession):
     try:
-        logger.info(f"User {message.from_user.id} requested habits list")
+        user = await get_user_by_telegram_id(db, message.from_user.id)
+        if not user:
+            logger.warning(f"User {message.from_user.id} not found in database")
+            await message.answer("❌ Сначала начните с команды /start")
+            return
+        
+        page = await load_habits_page(db, user.id)
+        if not page.rows:
+            await message.answer(
+                "📊 У тебя пока нет привычек\n\n"
+                "Добавь первую привычку, чтобы начать отслеживать прогресс!",
+                reply_markup=get_habits_menu([])
+            )
+            return
+        
+        text, keyboard = _habits_page_view(page, local_today(user.timezone))
+        await message.answer(text, reply_markup=keyboard)
         
-        async with get_async_session() as db:
-            user = await get_user_by_telegram_id(db, message.from_user.id)
-            if not user:
-                logger.warning(f"User {message.from_user.id} not found in database")
-                await message.answer("❌ Сначала начните с команды /start")
-                return
-            
-            logger.info(f"Found user {user.id}, querying habits")
-            
-            query = select(Habit).where(
-                and_(Habit.user_id == user.id, Habit.is_active == True)
-            ).order_by(Habit.created_at)
-            
-            result = await db.execute(query)
-            habits = result.scalars().all()
-            
-            logger.info(f"Found {len(habits)} habits for user {user.id}")
-            
-            if not habits:
-                await message.answer(
-                    "📊 У тебя пока нет привычек\n\n"
-                    "Добавь первую привычку, чтобы начать отслеживать прогресс!",
-                    reply_markup=get_habits_menu()
-                )
-                return
-            
-            # Формируем сообщение со списком привычек
-            habits_text = "📊 <b>Твои привычки:</b>\n\n"
-            keyboard_buttons = []
-            
-            for habit in habits:
-                logger.info(f"Processing habit: {habit.name}, id: {habit.id}")
-                
-                # Определяем статус выполнения
-                today = date.today()
-                if habit.last_completed_date == today:
-                    status_emoji = "✅"
-                    status_text = "выполнена сегодня"
-                elif habit.last_completed_date == today - timedelta(days=1):
-                    status_emoji = "🔄"
-                    status_text = "вчера выполнена"
-                else:
-                    status_emoji = "⭕"
-                    status_text = f"пропуск {habit.streak_current} дней"
-                
-                habits_text += f"{status_emoji} <b>{habit.name}</b> ({status_text})\n"
-                keyboard_buttons.append([InlineKeyboardButton(
-                    text=f"{status_emoji} {habit.name} ({habit.streak_current} дней)",
-                    callback_data=f"habit_complete_{habit.id}"
-                )])
-            
-            habits_text += "\n💡 Нажми на привычку, чтобы отметить выполнение"
-            
-            # Создаем клавиатуру
-            builder = InlineKeyboardBuilder()
-            for button_row in keyboard_buttons:
-                builder.row(*button_row)
-            
-            # Добавляем кнопку добавления привычки
-            builder.row(InlineKeyboardButton(text="➕ Добавить привычку", callback_data="habit_add"))
-            
-            await message.answer(habits_text, reply_markup=builder.as_markup())
-            logger.info(f"Successfully sent habits list to user {message.from_user.id}")
-            
     except Exception as e:
         logger.error(f"Error in habits_cmd for user {message.from_user.id}: {e}", exc_info=True)
         await message.answer(
@@ -216,6 +333,31 @@ async def habits_cmd(message: types.Message):
             reply_markup=get_main_menu()
         )
 
+@router.callback_query(HabitsPage.filter())
+async def habits_page_cb(callback: types.CallbackQuery, db: AsyncSession, payload: HabitsPage):
+    """Переключение страницы списка привычек - правим то же сообщение"""
+    user = await get_user_by_telegram_id(db, callback.from_user.id)
+    if not user:
+        await callback.answer("❌ Сначала начните с команды /start", show_alert=True)
+        return
+    
+    page = await load_habits_page(db, user.id, payload)
+    if not page.rows:
+        # Привычки с той стороны курсора удалили - начинаем сначала
+        page = await load_habits_page(db, user.id)
+    await callback.answer()
+    if not page.rows:
+        await callback.message.edit_text("📊 У тебя пока нет привычек", reply_markup=get_habits_menu([]))
+        return
+    
+    text, keyboard = _habits_page_view(page, local_today(user.timezone))
+    try:
+        await callback.message.edit_text(text, reply_markup=keyboard)
+    except TelegramBadRequest as e:
+        # Двойное нажатие: страница не изменилась
+        if "message is not modified" not in str(e):
+            raise
+
 # Обработчики для добавления привычки
 @router.message(F.text == "➕ Добавить привычку")
 @router.callback_query(F.data == "habit_add")
@@ -475,235 +617,259 @@ async def add_habit_target_days(message: types.Message, state: FSMContext):
         reply_markup=get_habit_creation_confirmation()
     )
 
+async def _create_habit_job(db: AsyncSession, user_id: int, data: dict):
+    """Задание писателя: создать привычку"""
+    db.add(Habit(
+        user_id=user_id,
+        name=data['name'],
+        description=data.get('description'),
+        frequency=data['frequency'],
+        goal=data['goal'],
+        target_days=data['target_days'],
+        reminder_time=data.get('reminder_time'),
+        created_at=date.today()
+    ))
+
 @router.callback_query(F.data == "confirm_habit")
-async def confirm_habit(callback: types.CallbackQuery, state: FSMContext):
+async def confirm_habit(callback: types.CallbackQuery, state: FSMContext, db: AsyncSession):
     """Подтверждение создания привычки"""
     data = await state.get_data()
     
-    async with get_async_session() as db:
-        user = await get_user_by_telegram_id(db, callback.from_user.id)
-        if not user:
-            await callback.answer("❌ Пользователь не найден")
-            return
-        
-        # Создаем привычку
-        habit = Habit(
-            user_id=user.id,
-            name=data['name'],
-            description=data.get('description'),
-            frequency=data['frequency'],
-            goal=data['goal'],
-            target_days=data['target_days'],
-            created_at=date.today()
-        )
-        
-        db.add(habit)
-        await db.commit()
-        
-        await callback.answer("✅ Привычка создана!")
-        await callback.message.answer(
-            f"🎉 <b>Привычка создана!</b>\n\n"
-            f"🏷️ {data['name']}\n"
-            f"🎯 Цель: {data['goal']} раз в период на {data['target_days']} дней\n\n"
-            f"💡 Не забывай отмечать выполнение каждый день!",
-            reply_markup=get_main_menu()
-        )
+    user = await get_user_by_telegram_id(db, callback.from_user.id)
+    if not user:
+        await callback.answer("❌ Пользователь не найден")
+        return
+    
+    await db_writer.submit(lambda db: _create_habit_job(db, user.id, data))
+    
+    await callback.answer("✅ Привычка создана!")
+    await callback.message.answer(
+        f"🎉 <b>Привычка создана!</b>\n\n"
+        f"🏷️ {data['name']}\n"
+        f"🎯 Цель: {data['goal']} раз в период на {data['target_days']} дней\n\n"
+        f"💡 Не забывай отмечать выполнение каждый день!",
+        reply_markup=get_main_menu()
+    )
     
     await state.clear()
 
-@router.callback_query(F.data.startswith("habit_complete_"))
-async def complete_habit(callback: types.CallbackQuery, state: FSMContext):
+async def _complete_habit_job(db: AsyncSession, user_id: int, habit_id: int, today: date) -> dict:
+    """Задание писателя: отметить выполнение привычки и начислить XP
+
+    today - дата в поясе пользователя: по ней же сбрасывает стрики streak_rollover
+    """
+    
+    # INSERT ... ON CONFLICT DO NOTHING и условный UPDATE стрика: двойное нажатие - пустая вставка
+    completion = await apply_completion(db, user_id, habit_id, today)
+    if completion.status == NOT_FOUND:
+        return {"status": "not_found"}
+    if completion.status == ALREADY_DONE:
+        return {"status": "already_done", "name": completion.name, "streak": completion.streak}
+    
+    # Битовый календарь - в той же транзакции, что и лог
+    await mark_completed(db, habit_id, today)
+    
+    # Прогресс недельной цели - popcount по календарю вместо сканирования логов
+    week_done = None
+    if completion.frequency == "weekly":
+        week_done = await count_completions(db, habit_id, today - timedelta(days=today.weekday()), today)
+    
+    # Начисляем XP одним UPDATE ... RETURNING (в той же транзакции, что и лог)
+    gained = await add_xp(db, user_id, HABIT_COMPLETION_XP)
+    
+    # Дневной итог для статистики - upsert вместо пересчета по логам
+    await record_completion(db, user_id, today, HABIT_COMPLETION_XP)
+    
+    return {"status": "done", "name": completion.name, "streak": completion.streak, "xp": gained.xp,
+            "level": gained.level, "leveled_up": gained.leveled_up, "week_done": week_done, "goal": completion.goal}
+
+@router.callback_query(HabitComplete.filter())
+async def complete_habit(callback: types.CallbackQuery, state: FSMContext, db: AsyncSession, payload: HabitComplete):
     """Отметка выполнения привычки"""
-    habit_id = int(callback.data.split("_")[2])
+    habit_id = payload.habit_id
     await callback.answer()
     
-    async with get_async_session() as db:
-        user = await get_user_by_telegram_id(db, callback.from_user.id)
-        if not user:
-            await callback.message.answer("❌ Пользователь не найден")
-            return
-        
-        # Получаем привычку
-        habit = await db.get(Habit, habit_id)
-        if not habit or habit.user_id != user.id:
-            await callback.message.answer("❌ Привычка не найдена")
-            return
-        
-        from datetime import date
-        today = date.today()
-        
-        # Проверяем, не выполнена ли уже сегодня
-        if habit.last_completed_date == today:
-            await callback.message.answer(
-                f"✅ <b>Привычка уже выполнена сегодня!</b>\n\n"
-                f"🏷️ {habit.name}\n"
-                f"🔥 Стрик: {habit.streak_current} дней\n\n"
-                f"💡 Отличная работа! Завтра продолжим!",
-                reply_markup=get_main_menu()
-            )
-            return
-        
-        # Обновляем стрик
-        if habit.last_completed_date == today - timedelta(days=1):
-            # Вчера было выполнено - увеличиваем стрик
-            habit.streak_current += 1
-        else:
-            # Пропуск - сбрасываем стрик
-            habit.streak_current = 1
-        
-        # Обновляем дату выполнения
-        habit.last_completed_date = today
-        
-        # Добавляем запись в лог
-        habit_log = HabitLog(
-            habit_id=habit.id,
-            user_id=user.id,
-            completed_at=datetime.now(),
-            date=today
+    user = await get_user_by_telegram_id(db, callback.from_user.id)
+    if not user:
+        await callback.message.answer("❌ Пользователь не найден")
+        return
+    
+    today = local_today(user.timezone)
+    result = await db_writer.submit(
+        lambda db: _complete_habit_job(db, user.id, habit_id, today)
+    )
+    
+    if result["status"] == "not_found":
+        await callback.message.answer("❌ Привычка не найдена")
+        return
+    
+    if result["status"] == "done":
+        # Начисление уже закоммичено - обновляем топ и гистограмму без запросов
+        leaderboard.record_xp(
+            user.id, result["xp"], HABIT_COMPLETION_XP,
+            display_name(callback.from_user.first_name, callback.from_user.username, user.id)
         )
-        
-        db.add(habit_log)
-        await db.commit()
-        
-        # Начисляем XP пользователю
-        user.xp += 10
-        await db.commit()
-        
-        # Определяем уровень
-        if user.xp >= 500:
-            level = "👑 Мастер"
-        elif user.xp >= 100:
-            level = "💪 Профи"
-        else:
-            level = "🌱 Новичок"
-        
+    
+    if result["status"] == "already_done":
         await callback.message.answer(
-            f"🎉 <b>Привычка выполнена!</b>\n\n"
-            f"🏷️ {habit.name}\n"
-            f"🔥 Стрик: {habit.streak_current} дней подряд\n"
-            f"💰 +10 XP earned!\n"
-            f"🎯 Твой уровень: {level}\n\n"
-            f"💡 Отличная работа! Продолжай в том же духе!",
+            f"✅ <b>Привычка уже выполнена сегодня!</b>\n\n"
+            f"🏷️ {result['name']}\n"
+            f"🔥 Стрик: {result['streak']} дней\n\n"
+            f"💡 Отличная работа! Завтра продолжим!",
             reply_markup=get_main_menu()
         )
+        return
+    
+    # Определяем уровень
+    if result["xp"] >= 500:
+        level = "👑 Мастер"
+    elif result["xp"] >= 100:
+        level = "💪 Профи"
+    else:
+        level = "🌱 Новичок"
+    
+    week_line = ""
+    if result["week_done"] is not None:
+        week_line = f"📅 На этой неделе: {result['week_done']} из {result['goal']}\n"
+    if result["leveled_up"]:
+        week_line += f"⬆️ Новый уровень: {result['level']}!\n"
+    
+    await callback.message.answer(
+        f"🎉 <b>Привычка выполнена!</b>\n\n"
+        f"🏷️ {result['name']}\n"
+        f"🔥 Стрик: {result['streak']} дней подряд\n"
+        f"{week_line}"
+        f"💰 +10 XP earned!\n"
+        f"🎯 Твой уровень: {level}\n\n"
+        f"💡 Отличная работа! Продолжай в том же духе!",
+        reply_markup=get_main_menu()
+    )
 
 @router.callback_query(F.data == "habit_delete")
-async def delete_habit_start(callback: types.CallbackQuery, state: FSMContext):
+async def delete_habit_start(callback: types.CallbackQuery, state: FSMContext, db: AsyncSession):
     """Начало процесса удаления привычки"""
     await callback.answer()
     
-    async with get_async_session() as db:
-        user = await get_user_by_telegram_id(db, callback.from_user.id)
-        if not user:
-            await callback.message.answer("❌ Пользователь не найден")
-            return
-        
-        # Получаем активные привычки
-        query = select(
-            Habit.id, 
-            Habit.name, 
-            Habit.streak_current
-        ).where(
-            and_(Habit.user_id == user.id, Habit.is_active == True)
-        ).order_by(Habit.created_at)
-        
-        result = await db.execute(query)
-        habits = result.all()
-        
-        if not habits:
-            await callback.message.answer(
-                "📊 У тебя пока нет привычек для удаления",
-                reply_markup=get_main_menu()
-            )
-            return
-        
-        # Создаем клавиатуру с привычками для удаления
-        builder = InlineKeyboardBuilder()
-        for habit_id, habit_name, streak in habits:
-            builder.row(
-                InlineKeyboardButton(
-                    text=f"🗑️ {habit_name} ({streak} дней)",
-                    callback_data=f"delete_habit_{habit_id}"
-                )
-            )
-        
-        builder.row(InlineKeyboardButton(text="❌ Отмена", callback_data="cancel"))
-        
+    user = await get_user_by_telegram_id(db, callback.from_user.id)
+    if not user:
+        await callback.message.answer("❌ Пользователь не найден")
+        return
+    
+    # Получаем активные привычки
+    query = select(
+        Habit.id, 
+        Habit.name, 
+        Habit.streak_current
+    ).where(
+        and_(Habit.user_id == user.id, Habit.is_active == True)
+    ).order_by(Habit.created_at)
+    
+    result = await db.execute(query)
+    habits = result.all()
+    
+    if not habits:
         await callback.message.answer(
-            "🗑️ <b>Удаление привычки</b>\n\n"
-            "Выбери привычку для удаления:",
-            reply_markup=builder.as_markup()
+            "📊 У тебя пока нет привычек для удаления",
+            reply_markup=get_main_menu()
         )
-
-@router.callback_query(F.data.startswith("delete_habit_"))
-async def delete_habit_confirm(callback: types.CallbackQuery, state: FSMContext):
-    """Подтверждение удаления привычки"""
-    habit_id = int(callback.data.split("_")[2])
-    await callback.answer()
+        return
     
-    async with get_async_session() as db:
-        user = await get_user_by_telegram_id(db, callback.from_user.id)
-        if not user:
-            await callback.message.answer("❌ Пользователь не найден")
-            return
-        
-        # Получаем информацию о привычке
-        habit = await db.get(Habit, habit_id)
-        if not habit or habit.user_id != user.id:
-            await callback.message.answer("❌ Привычка не найдена")
-            return
-        
-        # Создаем клавиатуру подтверждения
-        builder = InlineKeyboardBuilder()
+    # Создаем клавиатуру с привычками для удаления
+    builder = InlineKeyboardBuilder()
+    for habit_id, habit_name, streak in habits:
         builder.row(
             InlineKeyboardButton(
-                text="🗑️ Удалить",
-                callback_data=f"confirm_delete_{habit_id}"
-            ),
-            InlineKeyboardButton(
-                text="❌ Отмена",
-                callback_data="cancel"
+                text=f"🗑️ {habit_name} ({streak} дней)",
+                callback_data=HabitDeleteAsk(habit_id).pack()
             )
         )
-        
-        await callback.message.answer(
-            f"⚠️ <b>Точно удалить привычку?</b>\n\n"
-            f"🏷️ <b>{habit.name}</b>\n"
-            f"� <b>Стрик: {habit.streak_current} дней</b>\n\n"
-            f"❗️ <i>Это действие нельзя отменить!</i>",
-            reply_markup=builder.as_markup()
+    
+    builder.row(InlineKeyboardButton(text="❌ Отмена", callback_data="cancel"))
+    
+    await callback.message.answer(
+        "🗑️ <b>Удаление привычки</b>\n\n"
+        "Выбери привычку для удаления:",
+        reply_markup=builder.as_markup()
+    )
+
+@router.callback_query(HabitDeleteAsk.filter())
+async def delete_habit_confirm(callback: types.CallbackQuery, state: FSMContext, db: AsyncSession, payload: HabitDeleteAsk):
+    """Подтверждение удаления привычки"""
+    habit_id = payload.habit_id
+    await callback.answer()
+    
+    user = await get_user_by_telegram_id(db, callback.from_user.id)
+    if not user:
+        await callback.message.answer("❌ Пользователь не найден")
+        return
+    
+    # Получаем информацию о привычке
+    habit = await db.get(Habit, habit_id)
+    if not habit or habit.user_id != user.id:
+        await callback.message.answer("❌ Привычка не найдена")
+        return
+    
+    # Создаем клавиатуру подтверждения
+    builder = InlineKeyboardBuilder()
+    builder.row(
+        InlineKeyboardButton(
+            text="🗑️ Удалить",
+            callback_data=HabitDeleteConfirm(habit_id).pack()
+        ),
+        InlineKeyboardButton(
+            text="❌ Отмена",
+            callback_data="cancel"
         )
+    )
+    
+    await callback.message.answer(
+        f"⚠️ <b>Точно удалить привычку?</b>\n\n"
+        f"🏷️ <b>{habit.name}</b>\n"
+        f"� <b>Стрик: {habit.streak_current} дней</b>\n\n"
+        f"❗️ <i>Это действие нельзя отменить!</i>",
+        reply_markup=builder.as_markup()
+    )
+
+async def _delete_habit_job(db: AsyncSession, user_id: int, habit_id: int) -> dict:
+    """Задание писателя: жесткое удаление привычки"""
+    # Получаем привычку
+    habit = await db.get(Habit, habit_id)
+    if not habit or habit.user_id != user_id:
+        return {"status": "not_found"}
+    
+    habit_name = habit.name
+    
+    # Жесткое удаление из БД (внешние ключи в SQLite не включены - зависимые строки чистим сами)
+    await db.delete(habit)
+    for table in (HabitLog, HabitStats, HabitCalendar):
+        await db.execute(delete(table).where(table.habit_id == habit_id))
+    return {"status": "deleted", "name": habit_name}
 
-@router.callback_query(F.data.startswith("confirm_delete_"))
-async def delete_habit_execute(callback: types.CallbackQuery, state: FSMContext):
+@router.callback_query(HabitDeleteConfirm.filter())
+async def delete_habit_execute(callback: types.CallbackQuery, state: FSMContext, db: AsyncSession, payload: HabitDeleteConfirm):
     """Выполнение удаления привычки"""
-    habit_id = int(callback.data.split("_")[2])
+    habit_id = payload.habit_id
     await callback.answer()
     
-    async with get_async_session() as db:
-        user = await get_user_by_telegram_id(db, callback.from_user.id)
-        if not user:
-            await callback.message.answer("❌ Пользователь не найден")
-            return
-        
-        # Получаем привычку
-        habit = await db.get(Habit, habit_id)
-        if not habit or habit.user_id != user.id:
-            await callback.message.answer("❌ Привычка не найдена")
-            return
-        
-        habit_name = habit.name
-        
-        # Жесткое удаление из БД
-        await db.delete(habit)
-        await db.commit()
-        
-        await callback.message.answer(
-            f"🗑️ <b>Привычка удалена навсегда</b>\n\n"
-            f"🏷️ {habit_name}\n\n"
-            f"💡 Ты всегда можешь создать новую привычку с тем же названием",
-            reply_markup=get_main_menu()
-        )
+    user = await get_user_by_telegram_id(db, callback.from_user.id)
+    if not user:
+        await callback.message.answer("❌ Пользователь не найден")
+        return
+    
+    result = await db_writer.submit(
+        lambda db: _delete_habit_job(db, user.id, habit_id)
+    )
+    
+    if result["status"] == "not_found":
+        await callback.message.answer("❌ Привычка не найдена")
+        return
+    
+    await callback.message.answer(
+        f"🗑️ <b>Привычка удалена навсегда</b>\n\n"
+        f"🏷️ {result['name']}\n\n"
+        f"💡 Ты всегда можешь создать новую привычку с тем же названием",
+        reply_markup=get_main_menu()
+    )
 
 @router.callback_query(F.data == "cancel_habit")
 async def cancel_habit(callback: types.CallbackQuery, state: FSMContext):
@@ -769,12 +935,34 @@ async def news_cmd(message: types.Message):
 async def horoscope_cmd(message: types.Message):
     await message.answer(
         "🔮 <b>Гороскоп</b>\n\n"
-        "Этот модуль в разработке...\n\n"
-        "Скоро здесь будет:\n"
-        "• Ежедневные AI-гороскопы\n"
-        "• Персональные предсказания\n"
-        "• Совместимость знаков",
-        reply_markup=get_main_menu()
+        "Выбери свой знак зодиака:",
+        reply_markup=get_zodiac_signs()
+    )
+
+@router.callback_query(HoroscopeSign.filter())
+async def horoscope_sign_cb(callback: types.CallbackQuery, db: AsyncSession, payload: HoroscopeSign):
+    """Гороскоп на сегодня: один текст на знак и день для всех, лимит тратит только генерация"""
+    await callback.answer()
+    if payload.sign not in SIGNS:
+        return
+    
+    user = await get_user_by_telegram_id(db, callback.from_user.id)
+    if not user:
+        await callback.message.answer("❌ Пользователь не найден. Используй /start")
+        return
+    
+    async def generate(sign_name: str) -> str:
+        return await llm_client.generate_horoscope_text(sign_name, user.id, db)
+    
+    emoji, name = SIGNS[payload.sign]
+    try:
+        horoscope = await horoscope_cache.get(payload.sign, date.today(), generate)
+    except LLMError as e:
+        await callback.message.answer(f"⚠️ {e.message}")
+        return
+    
+    await callback.message.answer(
+        f"{emoji} <b>{name}</b> — {date.today():%d.%m.%Y}\n\n{html.escape(horoscope.text)}"
     )
 
 @router.message(F.text == "💳 Подписки")
@@ -801,25 +989,68 @@ async def settings_cmd(message: types.Message):
     )
 
 @router.message(F.text == "📈 Статистика")
-async def stats_cmd(message: types.Message):
-    async with get_async_session() as db:
-        result = await db.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
-        )
-        user = result.scalar_one_or_none()
-        
-        if not user:
-            await message.answer("❌ Сначала начните с команды /start")
-            return
-        
-        stats_text = (
-            f"📊 Твоя статистика:\n\n"
-            f"🤖 AI-статистика:\n"
-            f"🔹 Сегодня использовано: {user.daily_ai_requests}/5 запросов\n"
-            f"🔹 Всего запросов: {user.total_ai_requests}"
+async def stats_cmd(message: types.Message, db: AsyncSession):
+    user = await get_user_by_telegram_id(db, message.from_user.id)
+    
+    if not user:
+        await message.answer("❌ Сначала начните с команды /start")
+        return
+    
+    # Итоги за период - не больше 30 строк из daily_user_stats вместо сканирования логов
+    today = local_today(user.timezone)
+    days = await load_range(db, user.id, today - timedelta(days=29), today)
+    week = summarize(days, today - timedelta(days=6), today)
+    month = summarize(days, today - timedelta(days=29), today)
+    best_day = f"{month.best_day[0].strftime('%d.%m')} ({month.best_day[1]})" if month.best_day else "—"
+    await leaderboard.ensure_loaded()
+    
+    stats_text = (
+        f"📊 Твоя статистика:\n\n"
+        f"✅ Привычки:\n"
+        f"🔹 За 7 дней: {week.completions} выполнений ({week.completion_rate:.0%})\n"
+        f"🔹 За 30 дней: {month.completions} выполнений, {month.active_days} активных дней\n"
+        f"🔹 Лучший день: {best_day}\n"
+        f"🔹 XP за 30 дней: {month.xp_gained}\n"
+        f"🏆 Место в рейтинге: {leaderboard.rank_of(user.xp)} (/top)\n\n"
+        f"🤖 AI-статистика:\n"
+        f"🔹 Сегодня использовано: {user.daily_ai_requests}/5 запросов\n"
+        f"🔹 Всего запросов: {user.total_ai_requests}"
+    )
+    
+    await message.answer(stats_text, reply_markup=get_main_menu())
+
+@router.message(F.text == "/top")
+async def leaderboard_cmd(message: types.Message, db: AsyncSession):
+    """Рейтинг по XP: топ, место пользователя и соседи"""
+    user = await get_user_by_telegram_id(db, message.from_user.id)
+    if not user:
+        await message.answer("❌ Сначала начните с команды /start")
+        return
+    
+    name = display_name(message.from_user.first_name, message.from_user.username, user.id)
+    view = await leaderboard.view(user.id, user.xp, name)
+    await message.answer(render_leaderboard(view, user.id), reply_markup=get_main_menu())
+
+async def send_habit_reminder(bot: Bot, reminder: Reminder):
+    """Отправить напоминание о привычке с кнопкой отметки"""
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text="✅ Выполнено", callback_data=HabitComplete(reminder.habit_id).pack()))
+    # Массовая отправка: ответы пользователям проходят лимитер раньше
+    with bulk_sending():
+        await bot.send_message(
+            reminder.telegram_id,
+            f"⏰ Напоминание: <b>{reminder.habit_name}</b>\n\nНе забудь отметить выполнение сегодня!",
+            reply_markup=builder.as_markup()
         )
-        
-        await message.answer(stats_text, reply_markup=get_main_menu())
+
+def build_dispatcher() -> Dispatcher:
+    """Диспетчер со всеми middleware и роутерами (используется и в бенчмарках)"""
+    dp = create_dispatcher()
+    dp.include_router(router)
+    
+    # Точные тексты кнопок и /команды - одним поиском в dict (строится после всех роутеров)
+    install_text_index(dp)
+    return dp
 
 async def main():
     print(f"🤖 Milana AI v{get_version()} запускается...")
@@ -833,16 +1064,71 @@ async def main():
         token=os.getenv('BOT_TOKEN'),
         default=DefaultBotProperties(parse_mode="HTML")
     )
+    # Глобальный и per-chat темп исходящих сообщений, обработка RetryAfter
+    bot.session.middleware(outbound_limiter)
     
-    dp = Dispatcher(storage=MemoryStorage())
-    dp.include_router(router)
+    dp = build_dispatcher()
     
+    # Все мутации идут через единственного писателя с групповым коммитом
+    db_writer.start()
+    
+    # Рейтинг: топ и гистограмма XP читаются один раз, дальше обновляются при начислениях
+    await leaderboard.load()
+    
+    # Напоминания: расписание загружается один раз и дальше меняется точечно
+    settings = get_settings()
+    if settings.REMINDERS_ENABLED:
+        await reminder_scheduler.start(lambda reminder: send_habit_reminder(bot, reminder))
+    
+    # Прерванные стрики сбрасываются одним UPDATE на часовой пояс в STREAK_ROLLOVER_HOUR
+    if settings.STREAK_ROLLOVER_ENABLED:
+        streak_rollover.start()
+    
+    # Гороскопы на завтра генерируются до полуночи, запросы пользователей - чтение из кэша
+    if settings.HOROSCOPE_PREGEN_ENABLED and settings.OPENROUTER_API_KEY:
+        horoscope_pregen.start()
+    
+    # Локальный эндпоинт /metrics (METRICS_PORT=0 - выключен)
+    metrics_runner = None
+    if settings.METRICS_PORT:
+        metrics_runner = await start_metrics_server(settings.METRICS_HOST, settings.METRICS_PORT, _runtime_gauges)
+    
+    webhook_server = None
     try:
         print(f"🚀 Milana AI v{get_version()} запущен и готов к работе!")
-        await dp.start_polling(bot)
+        if settings.BOT_MODE == "webhook":
+            webhook_server = await run_webhook(dp, bot)
+            # Как и start_polling, по SIGINT/SIGTERM выходим в штатную остановку
+            stop_event = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for signal_number in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(signal_number, stop_event.set)
+            try:
+                await stop_event.wait()
+            finally:
+                for signal_number in (signal.SIGINT, signal.SIGTERM):
+                    loop.remove_signal_handler(signal_number)
+        else:
+            # getUpdates не работает, пока зарегистрирован webhook
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
     except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        # По SIGINT/SIGTERM оба режима просто возвращаются - чистим в любом случае
         print("\n🛑 Бот останавливается...")
+        if webhook_server is not None:
+            await webhook_server.stop()
+        # Досбросить FSM до остановки писателя
+        await dp.storage.close()
+        await reminder_scheduler.stop()
+        await streak_rollover.stop()
+        await horoscope_pregen.stop()
         await bot.session.close()
+        await db_writer.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await dispose_engines()
         print("✅ Бот корректно остановлен")
 
 if __name__ == "__main__":
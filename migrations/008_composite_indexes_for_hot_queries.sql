@@ -0,0 +1,22 @@
+-- Миграция 008: Составные индексы под горячие запросы трекера привычек
+-- Список привычек: WHERE user_id = ? AND is_active = ? ORDER BY created_at (id - rowid, уже в индексе)
+CREATE INDEX IF NOT EXISTS idx_habits_user_active_created ON habits(user_id, is_active, created_at);
+
+-- Логи по пользователю за период: WHERE user_id = ? AND date BETWEEN ? AND ?
+CREATE INDEX IF NOT EXISTS idx_habit_logs_user_date ON habit_logs(user_id, date);
+
+-- Логи по привычке и дню обслуживает уникальный индекс UNIQUE(habit_id, date)
+
+-- Удаляем избыточные индексы
+-- is_active почти всегда TRUE: низкая селективность, планировщику он только мешает
+DROP INDEX IF EXISTS idx_habits_active;
+-- Префикс idx_habits_user_active_created
+DROP INDEX IF EXISTS idx_habits_user_id;
+-- Дубликат idx_habit_logs_user_id, оба - префикс idx_habit_logs_user_date
+DROP INDEX IF EXISTS idx_habit_logs_user_id_fk;
+DROP INDEX IF EXISTS idx_habit_logs_user_id;
+-- Префикс уникального индекса (habit_id, date)
+DROP INDEX IF EXISTS idx_habit_logs_habit_id;
+
+-- Обновляем статистику для планировщика
+ANALYZE;
@@ -0,0 +1,6 @@
+-- Миграция 009: Индекс для загрузки расписания напоминаний
+-- Планировщик при старте: WHERE is_active = ? AND reminder_time IS NOT NULL
+-- (привычек без напоминания большинство - они не читаются вовсе)
+CREATE INDEX IF NOT EXISTS idx_habits_active_reminder ON habits(is_active, reminder_time);
+
+ANALYZE;
@@ -0,0 +1,10 @@
+-- Миграция 010: Хранилище FSM (вместо MemoryStorage)
+CREATE TABLE IF NOT EXISTS fsm_states (
+    key VARCHAR(128) PRIMARY KEY,
+    state VARCHAR(64),
+    data TEXT,
+    expires_at INTEGER NOT NULL
+);
+
+-- Очистка брошенных диалогов: DELETE ... WHERE expires_at < ?
+CREATE INDEX IF NOT EXISTS idx_fsm_states_expires_at ON fsm_states(expires_at);
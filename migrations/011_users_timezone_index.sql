@@ -0,0 +1,6 @@
+-- Миграция 011: Индекс по часовому поясу пользователей
+-- Ночной сброс стриков: SELECT DISTINCT timezone FROM users и
+-- UPDATE habits ... WHERE user_id IN (SELECT id FROM users WHERE timezone = ?)
+CREATE INDEX IF NOT EXISTS ix_users_timezone ON users(timezone);
+
+ANALYZE;
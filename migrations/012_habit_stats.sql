@@ -0,0 +1,11 @@
+-- Миграция 012: Статистика привычек, пересчитанная по habit_logs
+-- Заполняется командой: python run_migration.py recompute-stats
+CREATE TABLE IF NOT EXISTS habit_stats (
+    habit_id INTEGER PRIMARY KEY REFERENCES habits(id) ON DELETE CASCADE,
+    streak_current INTEGER NOT NULL DEFAULT 0,
+    streak_best INTEGER NOT NULL DEFAULT 0,
+    completion_rate_7 FLOAT NOT NULL DEFAULT 0,
+    completion_rate_30 FLOAT NOT NULL DEFAULT 0,
+    completion_rate_90 FLOAT NOT NULL DEFAULT 0,
+    computed_for DATE NOT NULL
+);
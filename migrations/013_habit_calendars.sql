@@ -0,0 +1,8 @@
+-- Миграция 013: Битовые календари выполнений (46 байт на привычку и год)
+-- Заполнение по существующим логам: python run_migration.py rebuild-calendars
+CREATE TABLE IF NOT EXISTS habit_calendars (
+    habit_id INTEGER NOT NULL REFERENCES habits(id) ON DELETE CASCADE,
+    year INTEGER NOT NULL,
+    bits BLOB NOT NULL,
+    PRIMARY KEY (habit_id, year)
+);
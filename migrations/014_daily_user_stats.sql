@@ -0,0 +1,13 @@
+-- Миграция 014: Дневные итоги пользователей для статистики
+-- Заполнение по существующим логам: python run_migration.py backfill-daily-stats
+CREATE TABLE IF NOT EXISTS daily_user_stats (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    completions INTEGER NOT NULL DEFAULT 0,
+    active_habits INTEGER NOT NULL DEFAULT 0,
+    xp_gained INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, date)
+);
+
+-- Отчеты по всем пользователям: WHERE date BETWEEN ? AND ?
+CREATE INDEX IF NOT EXISTS idx_daily_user_stats_date ON daily_user_stats(date);
@@ -0,0 +1,16 @@
+-- Миграция 015: Кэш гороскопов - один текст на знак и день
+CREATE TABLE IF NOT EXISTS horoscope_cache (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    zodiac_sign VARCHAR(20) NOT NULL,
+    horoscope_date VARCHAR(10) NOT NULL,
+    content TEXT NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Дубли мешают уникальному индексу: оставляем последний текст
+DELETE FROM horoscope_cache WHERE id NOT IN (
+    SELECT MAX(id) FROM horoscope_cache GROUP BY zodiac_sign, horoscope_date
+);
+
+-- Поиск по (знак, день) и ON CONFLICT DO NOTHING при записи
+CREATE UNIQUE INDEX IF NOT EXISTS uq_horoscope_sign_date ON horoscope_cache(zodiac_sign, horoscope_date);
@@ -9,6 +9,10 @@ from .habit_log_new import HabitLog
 from .subscription import Subscription
 from .horoscope import HoroscopeCache
 from .news import NewsDigest, NewsSource
+from .fsm_state import FsmState
+from .habit_stats import HabitStats
+from .habit_calendar import HabitCalendar
+from .daily_user_stats import DailyUserStats
 
 __all__ = [
     "Base",
@@ -18,5 +22,9 @@ __all__ = [
     "Subscription",
     "HoroscopeCache",
     "NewsDigest",
-    "NewsSource"
+    "NewsSource",
+    "FsmState",
+    "HabitStats",
+    "HabitCalendar",
+    "DailyUserStats"
 ]
@@ -0,0 +1,27 @@
+"""
+Дневные итоги пользователя (rollup для статистики)
+"""
+from sqlalchemy import Column, Integer, Date, ForeignKey, Index
+from models import Base
+
+class DailyUserStats(Base):
+    """Выполнения, активные привычки и XP пользователя за день
+
+    Обновляется инкрементально при отметке выполнения; пересборка по
+    habit_logs: python run_migration.py backfill-daily-stats
+    """
+    __tablename__ = "daily_user_stats"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    completions = Column(Integer, nullable=False, default=0, comment="Отметок выполнения за день")
+    active_habits = Column(Integer, nullable=False, default=0, comment="Активных привычек на момент последней отметки")
+    xp_gained = Column(Integer, nullable=False, default=0, comment="XP, полученный за день")
+    
+    __table_args__ = (
+        # Отчеты по всем пользователям за период
+        Index("idx_daily_user_stats_date", "date"),
+    )
+    
+    def __repr__(self):
+        return f"<DailyUserStats(user_id={self.user_id}, date={self.date}, completions={self.completions})>"
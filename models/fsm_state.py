@@ -0,0 +1,23 @@
+"""
+Состояние FSM (aiogram) для SQLite-хранилища
+"""
+from sqlalchemy import Column, Integer, String, Text, Index
+from models import Base
+
+class FsmState(Base):
+    """Состояние и данные диалога одного пользователя в одном чате"""
+    __tablename__ = "fsm_states"
+    
+    # bot_id:chat_id:user_id[:thread_id[:business_connection_id]]:destiny
+    key = Column(String(128), primary_key=True)
+    state = Column(String(64), comment="Имя состояния, например HabitStates:adding_name")
+    data = Column(Text, comment="Данные диалога, компактный JSON")
+    expires_at = Column(Integer, nullable=False, comment="Unix-время истечения (TTL брошенных диалогов)")
+    
+    __table_args__ = (
+        # Удаление истекших записей одним диапазонным запросом
+        Index("idx_fsm_states_expires_at", "expires_at"),
+    )
+    
+    def __repr__(self):
+        return f"<FsmState(key='{self.key}', state='{self.state}')>"
@@ -2,7 +2,7 @@
 Модель привычек для трекера
 """
 from datetime import date, time
-from sqlalchemy import Column, Integer, String, Boolean, Text, Date, Time, ForeignKey, CheckConstraint
+from sqlalchemy import Column, Integer, String, Boolean, Text, Date, Time, ForeignKey, CheckConstraint, Index
 from sqlalchemy.orm import relationship
 from models import Base
 
@@ -72,6 +72,10 @@ class Habit(Base):
             "color IN ('blue', 'green', 'red', 'yellow', 'purple', 'orange')",
             name="check_color"
         ),
+        # Список активных привычек пользователя (миграция 008)
+        Index("idx_habits_user_active_created", "user_id", "is_active", "created_at"),
+        # Загрузка расписания напоминаний (миграция 009)
+        Index("idx_habits_active_reminder", "is_active", "reminder_time"),
     )
     
     def __repr__(self):
@@ -0,0 +1,20 @@
+"""
+Календарь выполнений привычки: битовая карта на год
+"""
+from sqlalchemy import Column, Integer, LargeBinary, ForeignKey
+from models import Base
+
+class HabitCalendar(Base):
+    """366 бит (46 байт) на привычку и год: бит N - день года N + 1
+
+    Производные данные: источник истины - habit_logs, пересборка командой
+    python run_migration.py rebuild-calendars
+    """
+    __tablename__ = "habit_calendars"
+    
+    habit_id = Column(Integer, ForeignKey("habits.id", ondelete="CASCADE"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    bits = Column(LargeBinary(46), nullable=False, comment="Little-endian битовая карта дней года")
+    
+    def __repr__(self):
+        return f"<HabitCalendar(habit_id={self.habit_id}, year={self.year})>"
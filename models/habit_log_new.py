@@ -2,7 +2,7 @@
 Модель логов выполнений привычек
 """
 from datetime import datetime, date
-from sqlalchemy import Column, Integer, Date, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, Date, DateTime, ForeignKey, UniqueConstraint, Index
 from models import Base
 
 class HabitLog(Base):
@@ -22,6 +22,8 @@ class HabitLog(Base):
     # Уникальный индекс - защита от дублей
     __table_args__ = (
         UniqueConstraint('habit_id', 'date', name='uq_habit_date'),
+        # Логи пользователя за период (миграция 008)
+        Index('idx_habit_logs_user_date', 'user_id', 'date'),
     )
     
     def __repr__(self):
@@ -0,0 +1,20 @@
+"""
+Пересчитанная статистика привычек (стрики и процент выполнения)
+"""
+from sqlalchemy import Column, Integer, Float, Date, ForeignKey
+from models import Base
+
+class HabitStats(Base):
+    """Стрики и процент выполнения, пересчитанные по habit_logs"""
+    __tablename__ = "habit_stats"
+    
+    habit_id = Column(Integer, ForeignKey("habits.id", ondelete="CASCADE"), primary_key=True)
+    streak_current = Column(Integer, nullable=False, default=0, comment="Текущий стрик в единицах расписания")
+    streak_best = Column(Integer, nullable=False, default=0, comment="Лучший стрик за всю историю")
+    completion_rate_7 = Column(Float, nullable=False, default=0.0, comment="Доля выполненных плановых единиц за 7 дней")
+    completion_rate_30 = Column(Float, nullable=False, default=0.0, comment="То же за 30 дней")
+    completion_rate_90 = Column(Float, nullable=False, default=0.0, comment="То же за 90 дней")
+    computed_for = Column(Date, nullable=False, comment="Дата, на которую посчитано")
+    
+    def __repr__(self):
+        return f"<HabitStats(habit_id={self.habit_id}, current={self.streak_current}, best={self.streak_best})>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index
 from sqlalchemy.sql import func
 from core.database import Base
 from datetime import date
@@ -13,5 +13,10 @@ class HoroscopeCache(Base):
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
+    __table_args__ = (
+        # Один текст на знак и день (миграция 015)
+        Index("uq_horoscope_sign_date", "zodiac_sign", "horoscope_date", unique=True),
+    )
+    
     def __repr__(self):
         return f"<HoroscopeCache(sign={self.zodiac_sign}, date={self.horoscope_date})>"
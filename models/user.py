@@ -1,8 +1,19 @@
-from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, Time
+from sqlalchemy import Column, Integer, String, DateTime, Date, Boolean, Time, Index, case
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from models import Base
 
+# Уровень: 100 XP на уровень, не выше 50
+XP_PER_LEVEL = 100
+MAX_LEVEL = 50
+
+def level_for(xp: int) -> int:
+    return min(xp // XP_PER_LEVEL + 1, MAX_LEVEL)
+
+def level_expression(xp):
+    """level_for в SQL (// компилируется в целочисленное деление диалекта)"""
+    return case((xp >= (MAX_LEVEL - 1) * XP_PER_LEVEL, MAX_LEVEL), else_=xp // XP_PER_LEVEL + 1)
+
 class User(Base):
     __tablename__ = "users"
     
@@ -10,7 +21,7 @@ class User(Base):
     telegram_id = Column(Integer, unique=True, index=True, nullable=False)
     username = Column(String(50), nullable=True)
     first_name = Column(String(100), nullable=True)
-    timezone = Column(String(50), default="UTC")  # Часовой пояс пользователя
+    timezone = Column(String(50), default="UTC", index=True)  # Часовой пояс пользователя
     notifications_enabled = Column(Boolean, default=True)
     
     # AI лимиты и статистика
@@ -29,6 +40,11 @@ class User(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    __table_args__ = (
+        # Рейтинг по XP (миграция 003)
+        Index("idx_users_xp", "xp"),
+    )
+    
     # Убираем relationship чтобы избежать циклического импорта
     # habits = relationship("Habit", back_populates="user", cascade="all, delete-orphan")
     # subscriptions = relationship("Subscription", back_populates="user", cascade="all, delete-orphan")
@@ -48,20 +64,21 @@ class User(Base):
         else:
             return "🌟"
     
-    def add_xp(self, amount: int) -> bool:
-        """Добавить опыт, проверить повышение уровня"""
-        self.xp += amount
-        self.total_habits_completed += 1
-        
-        # Проверка повышения уровня (простая формула: 100 XP за уровень)
-        new_level = min(self.xp // 100 + 1, 50)  # макс 50 уровень
-        leveled_up = new_level > self.level
-        self.level = new_level
-        
-        return leveled_up
+    def add_xp(self, amount: int):
+        """Добавить опыт SQL-выражениями: при flush это UPDATE users SET xp = xp + :amount
+
+        Параллельные начисления не теряются; после flush атрибуты истекают
+        (в AsyncSession - await db.refresh(user)). Если нужен результат сразу
+        (уровень, повышение) - core.counters.add_xp.
+        """
+        cls = type(self)
+        new_xp = func.coalesce(cls.xp, 0) + amount
+        self.xp = new_xp
+        self.total_habits_completed = func.coalesce(cls.total_habits_completed, 0) + 1
+        self.level = level_expression(new_xp)
     
     def get_xp_to_next_level(self) -> int:
         """XP до следующего уровня"""
-        if self.level >= 50:
+        if self.level >= MAX_LEVEL:
             return 0
-        return (self.level * 100) - self.xp
+        return (self.level * XP_PER_LEVEL) - self.xp
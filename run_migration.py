@@ -1,15 +1,18 @@
 """
 Скрипт для выполнения миграций БД
 """
+import argparse
 import asyncio
 import os
+import sys
+from datetime import date, timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
 os.environ['DATABASE_URL'] = 'sqlite+aiosqlite:///data/milana.db'
 
-from sqlalchemy import text
-from core.database import engine, get_async_session
+from sqlalchemy import text, select, and_
+from core.database import engine, read_engine, get_async_session
 
 async def run_migration(migration_file: str):
     """Выполнить миграцию из SQL файла"""
@@ -75,7 +78,15 @@ async def run_all_migrations():
         "004_add_user_id_to_habit_logs.sql",
         "005_add_target_days_to_habits.sql",
         "006_add_last_completed_date_to_habits.sql",
-        "007_update_frequency_constraints.sql"
+        "007_update_frequency_constraints.sql",
+        "008_composite_indexes_for_hot_queries.sql",
+        "009_reminder_schedule_index.sql",
+        "010_fsm_states.sql",
+        "011_users_timezone_index.sql",
+        "012_habit_stats.sql",
+        "013_habit_calendars.sql",
+        "014_daily_user_stats.sql",
+        "015_horoscope_cache_unique.sql"
     ]
     
     applied_count = 0
@@ -97,5 +108,124 @@ async def run_all_migrations():
     
     print(f"🎉 Применено миграций: {applied_count}")
 
+def get_hot_queries():
+    """Горячие запросы из main.py в том виде, в каком их строит ORM"""
+    from models.user import User
+    from models.habit import Habit
+    from models.habit_log_new import HabitLog
+    from core.scheduler import reminders_query
+    from core.habits_page import habits_page_query
+    from core.rollover import rollover_statement
+    from core.daily_stats import range_query
+    from core.leaderboard import neighbors_query, top_query
+    from core.horoscope import stored_query
+    from utils.callbacks import HabitsPage
+    
+    today = date.today()
+    active_habits = and_(Habit.user_id == 1, Habit.is_active == True)
+    
+    return {
+        "user_by_telegram_id": select(User).where(User.telegram_id == 1),
+        "habits_page_first": habits_page_query(1),
+        "habits_page_next": habits_page_query(1, HabitsPage("n", today.toordinal(), 1)),
+        "habits_page_prev": habits_page_query(1, HabitsPage("p", today.toordinal(), 1)),
+        "habits_delete_list": select(Habit.id, Habit.name, Habit.streak_current).where(
+            active_habits
+        ).order_by(Habit.created_at),
+        "habit_by_id": select(Habit).where(Habit.id == 1),
+        "habit_log_by_day": select(HabitLog.id).where(
+            and_(HabitLog.habit_id == 1, HabitLog.date == today)
+        ),
+        "user_logs_by_period": select(HabitLog.habit_id, HabitLog.date).where(
+            and_(HabitLog.user_id == 1, HabitLog.date >= today - timedelta(days=30))
+        ),
+        "leaderboard_top": top_query(100),
+        "leaderboard_above": neighbors_query(1, 100, 2, above=True),
+        "leaderboard_below": neighbors_query(1, 100, 2, above=False),
+        "horoscope_by_sign_date": stored_query("aries", today),
+        "daily_stats_range": range_query(1, today - timedelta(days=29), today),
+        "reminders_load": reminders_query(),
+        "reminders_refresh_user": reminders_query().where(Habit.user_id.in_([1, 2])),
+        "streak_rollover": rollover_statement("Europe/Moscow", today - timedelta(days=1)),
+    }
+
+async def explain_hot_queries() -> bool:
+    """EXPLAIN QUERY PLAN для горячих запросов. False, если есть полный скан таблицы"""
+    print("🔍 Проверка планов горячих запросов...")
+    
+    ok = True
+    async with engine.connect() as conn:
+        for name, query in get_hot_queries().items():
+            sql = str(query.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+            result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")
+            details = [row[-1] for row in result]
+            
+            # SEARCH - поиск по индексу, SCAN - полный проход по таблице или индексу
+            full_scans = [d for d in details if d.startswith("SCAN") and "CONSTANT ROW" not in d]
+            temp_sorts = [d for d in details if "TEMP B-TREE" in d]
+            
+            status = "❌" if full_scans else ("⚠️ " if temp_sorts else "✅")
+            print(f"{status} {name}")
+            for detail in details:
+                print(f"     {detail}")
+            
+            if full_scans:
+                ok = False
+    
+    print("🎉 Все горячие запросы используют индексы" if ok else "❌ Найдены полные сканы таблиц")
+    return ok
+
+async def recompute_stats():
+    """Пересчитать стрики и процент выполнения всех привычек по habit_logs"""
+    from core.habit_stats import recompute_habit_stats
+    
+    print("🔄 Пересчет стриков по habit_logs...")
+    summary = await recompute_habit_stats(engine, reader=read_engine)
+    print(
+        f"✅ Привычек: {summary['habits']}, логов: {summary['log_rows']}, "
+        f"исправлено стриков: {summary['habits_fixed']}, "
+        f"пропущено измененных во время пересчета: {summary['habits_skipped']} "
+        f"(расчет {summary['compute_s']} с, запись {summary['write_s']} с)"
+    )
+
+async def rebuild_calendars_cmd():
+    """Пересобрать битовые календари выполнений по habit_logs"""
+    from core.habit_calendar import rebuild_calendars
+    
+    print("🔄 Пересборка календарей выполнений...")
+    summary = await rebuild_calendars(engine, reader=read_engine)
+    print(f"✅ Логов: {summary['log_rows']}, календарей: {summary['calendars']} ({summary['seconds']} с)")
+
+async def backfill_daily_stats_cmd():
+    """Пересобрать дневные итоги пользователей по habit_logs"""
+    from core.daily_stats import backfill_daily_stats
+    
+    print("🔄 Пересборка daily_user_stats...")
+    summary = await backfill_daily_stats(engine)
+    print(f"✅ Кусков: {summary['chunks']}, строк: {summary['rows']} ({summary['seconds']} с)")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Миграции и обслуживание БД")
+    parser.add_argument(
+        "command", nargs="?", default="migrate", choices=["migrate", "explain", "recompute-stats", "rebuild-calendars",
+                                                    "backfill-daily-stats"],
+        help="migrate - применить миграции, explain - проверить планы горячих запросов, "
+             "recompute-stats - пересчитать стрики и процент выполнения по habit_logs, "
+             "rebuild-calendars - пересобрать битовые календари по habit_logs, "
+             "backfill-daily-stats - пересобрать daily_user_stats по habit_logs"
+    )
+    args = parser.parse_args()
+    
+    if args.command == "explain":
+        sys.exit(0 if asyncio.run(explain_hot_queries()) else 1)
+    if args.command == "recompute-stats":
+        asyncio.run(recompute_stats())
+        sys.exit(0)
+    if args.command == "rebuild-calendars":
+        asyncio.run(rebuild_calendars_cmd())
+        sys.exit(0)
+    if args.command == "backfill-daily-stats":
+        asyncio.run(backfill_daily_stats_cmd())
+        sys.exit(0)
+    
     asyncio.run(run_all_migrations())
@@ -0,0 +1,202 @@
+"""
+Компактный callback_data: короткие опкоды, id в base36 и типизированные payload'ы
+
+Формат: ``<opcode>:<поле>[:<поле>...]``, например ``hc:2n9c`` вместо
+``habit_complete_123456``. Разбор - один проход по префиксному дереву на
+апдейт (CallbackPayloadMiddleware), обработчики получают готовый объект
+аргументом ``payload`` и фильтруются по его типу без работы со строками.
+Старые форматы (``habit_complete_{id}`` и т.п.) из уже отправленных
+сообщений разбираются тем же деревом.
+"""
+import string
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, ClassVar, Dict, Optional, Tuple, Type, get_type_hints
+
+from aiogram import BaseMiddleware
+from aiogram.filters import BaseFilter
+from aiogram.types import CallbackQuery, TelegramObject
+
+SEPARATOR = ":"
+# Лимит Telegram на callback_data
+MAX_CALLBACK_BYTES = 64
+
+_DIGITS = string.digits + string.ascii_lowercase
+
+def to_base36(value: int) -> str:
+    if value < 0:
+        return "-" + to_base36(-value)
+    if value < 36:
+        return _DIGITS[value]
+    chars = []
+    while value:
+        value, remainder = divmod(value, 36)
+        chars.append(_DIGITS[remainder])
+    return "".join(reversed(chars))
+
+def from_base36(text: str) -> int:
+    return int(text, 36)
+
+# --- Префиксное дерево ---
+
+_TERMINAL = ""  # ключ узла с payload-классом (символов нулевой длины в data не бывает)
+
+class _PrefixTrie:
+    """Самый длинный зарегистрированный префикс строки за один проход"""
+
+    def __init__(self):
+        self.root: Dict[str, Any] = {}
+
+    def insert(self, prefix: str, value: Any):
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        if _TERMINAL in node:
+            raise ValueError(f"Callback prefix {prefix!r} is already registered")
+        node[_TERMINAL] = value
+
+    def longest_match(self, text: str) -> Optional[Tuple[int, Any]]:
+        node = self.root
+        match = None
+        for index, char in enumerate(text):
+            node = node.get(char)
+            if node is None:
+                break
+            if _TERMINAL in node:
+                match = (index + 1, node[_TERMINAL])
+        return match
+
+_trie = _PrefixTrie()
+
+# --- Payload'ы ---
+
+class CallbackPayload:
+    """База для payload'ов: подкласс объявляет opcode и, при необходимости, старый префикс"""
+
+    __opcode__: ClassVar[str]
+    __legacy_prefix__: ClassVar[Optional[str]] = None
+
+    def __init_subclass__(cls, opcode: str, legacy_prefix: Optional[str] = None, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.__opcode__ = opcode
+        cls.__legacy_prefix__ = legacy_prefix
+        _trie.insert(opcode + SEPARATOR, (cls, False))
+        if legacy_prefix:
+            _trie.insert(legacy_prefix, (cls, True))
+
+    @classmethod
+    def _field_types(cls) -> Tuple[Tuple[str, type], ...]:
+        cached = cls.__dict__.get("_cached_field_types")
+        if cached is None:
+            hints = get_type_hints(cls)
+            cached = tuple((field.name, hints[field.name]) for field in fields(cls))
+            cls._cached_field_types = cached
+        return cached
+
+    def pack(self) -> str:
+        parts = [self.__opcode__]
+        for name, field_type in self._field_types():
+            value = getattr(self, name)
+            if field_type is int:
+                parts.append(to_base36(value))
+            else:
+                value = str(value)
+                if SEPARATOR in value:
+                    raise ValueError(f"{type(self).__name__}.{name} must not contain {SEPARATOR!r}")
+                parts.append(value)
+        data = SEPARATOR.join(parts)
+        if len(data.encode()) > MAX_CALLBACK_BYTES:
+            raise ValueError(f"Callback data is longer than {MAX_CALLBACK_BYTES} bytes: {data!r}")
+        return data
+
+    @classmethod
+    def _unpack(cls, body: str, legacy: bool):
+        field_types = cls._field_types()
+        # Старый формат - одно поле после префикса, числа в десятичной записи
+        values = [body] if legacy else body.split(SEPARATOR)
+        if len(values) != len(field_types):
+            return None
+        kwargs = {}
+        for (name, field_type), value in zip(field_types, values):
+            if field_type is int:
+                try:
+                    kwargs[name] = int(value) if legacy else from_base36(value)
+                except ValueError:
+                    return None
+            else:
+                kwargs[name] = value
+        return cls(**kwargs)
+
+    @classmethod
+    def filter(cls) -> "PayloadFilter":
+        return PayloadFilter(cls)
+
+@dataclass(frozen=True)
+class HabitComplete(CallbackPayload, opcode="hc", legacy_prefix="habit_complete_"):
+    habit_id: int
+
+@dataclass(frozen=True)
+class HabitConfirm(CallbackPayload, opcode="hk", legacy_prefix="habit_confirm_"):
+    habit_id: int
+
+@dataclass(frozen=True)
+class HabitDeleteAsk(CallbackPayload, opcode="hd", legacy_prefix="delete_habit_"):
+    habit_id: int
+
+@dataclass(frozen=True)
+class HabitDeleteConfirm(CallbackPayload, opcode="hx", legacy_prefix="confirm_delete_"):
+    habit_id: int
+
+@dataclass(frozen=True)
+class HabitsPage(CallbackPayload, opcode="hp"):
+    """Курсор списка привычек: direction "n" - после (day, habit_id), "p" - до"""
+    direction: str
+    day: int  # created_at.toordinal(), 0 - дата не задана
+    habit_id: int
+
+@dataclass(frozen=True)
+class HoroscopeSign(CallbackPayload, opcode="zs", legacy_prefix="horoscope_"):
+    sign: str
+
+@dataclass(frozen=True)
+class SubscriptionInfo(CallbackPayload, opcode="si", legacy_prefix="subscription_info_"):
+    subscription_id: int
+
+@dataclass(frozen=True)
+class NewsCategory(CallbackPayload, opcode="nc", legacy_prefix="news_category_"):
+    category: str
+
+@lru_cache(maxsize=4096)
+def decode_callback(data: Optional[str]) -> Optional[CallbackPayload]:
+    """Разобрать callback_data; None для простых литералов вроде "habit_add" """
+    if not data:
+        return None
+    match = _trie.longest_match(data)
+    if match is None:
+        return None
+    length, (payload_class, legacy) = match
+    return payload_class._unpack(data[length:], legacy)
+
+# --- Интеграция с aiogram ---
+
+class PayloadFilter(BaseFilter):
+    """Проверка типа уже разобранного payload'а"""
+
+    def __init__(self, payload_class: Type[CallbackPayload]):
+        self.payload_class = payload_class
+
+    async def __call__(self, callback: CallbackQuery, payload: Optional[CallbackPayload] = None) -> bool:
+        return type(payload) is self.payload_class
+
+class CallbackPayloadMiddleware(BaseMiddleware):
+    """Outer middleware dp.callback_query: разбор callback_data один раз на апдейт"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        data["payload"] = decode_callback(event.data) if isinstance(event, CallbackQuery) else None
+        return await handler(event, data)
+
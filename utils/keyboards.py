@@ -1,10 +1,70 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from typing import List, Optional
+from functools import lru_cache, wraps
+from typing import List, Optional, TypeVar
+from pydantic import ConfigDict
+from utils.callbacks import HabitComplete, HabitConfirm, HabitsPage, HoroscopeSign, NewsCategory, SubscriptionInfo
+
+# Статические клавиатуры строятся один раз при импорте, динамические кэшируются
+# по входным данным, и один экземпляр уходит во все ответы. Разметка aiogram
+# изменяема (MutableTelegramObject), поэтому перед кэшированием она замораживается
+# (freeze): присваивание полей и правка строк кнопок бросают исключение.
+KEYBOARD_CACHE_SIZE = 1024
+
+class _FrozenList(list):
+    """list только для чтения: aiogram сериализует строки кнопок, только если это list"""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Shared keyboard rows are read-only")
+
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+
+    def __reduce__(self):
+        # copy/deepcopy/pickle дают обычный изменяемый list
+        return list, (list(self),)
+
+class FrozenInlineKeyboardButton(InlineKeyboardButton):
+    model_config = ConfigDict(frozen=True)
+
+class FrozenKeyboardButton(KeyboardButton):
+    model_config = ConfigDict(frozen=True)
+
+class FrozenInlineKeyboardMarkup(InlineKeyboardMarkup):
+    model_config = ConfigDict(frozen=True)
+
+class FrozenReplyKeyboardMarkup(ReplyKeyboardMarkup):
+    model_config = ConfigDict(frozen=True)
+
+for _model in (FrozenInlineKeyboardButton, FrozenKeyboardButton, FrozenInlineKeyboardMarkup, FrozenReplyKeyboardMarkup):
+    _model.model_rebuild()
+
+_FROZEN = {
+    InlineKeyboardButton: FrozenInlineKeyboardButton,
+    KeyboardButton: FrozenKeyboardButton,
+    InlineKeyboardMarkup: FrozenInlineKeyboardMarkup,
+    ReplyKeyboardMarkup: FrozenReplyKeyboardMarkup,
+}
+
+Markup = TypeVar("Markup", InlineKeyboardMarkup, ReplyKeyboardMarkup)
+
+def freeze(markup: Markup) -> Markup:
+    """Неизменяемая копия разметки (один раз при сборке, поэтому без валидации)"""
+    field = "inline_keyboard" if isinstance(markup, InlineKeyboardMarkup) else "keyboard"
+    rows = _FrozenList(
+        _FrozenList(_FROZEN[type(button)].model_construct(**dict(button)) for button in row)
+        for row in getattr(markup, field)
+    )
+    return _FROZEN[type(markup)].model_construct(**{**dict(markup), field: rows})
+
+def _frozen(build):
+    @wraps(build)
+    def wrapper(*args, **kwargs):
+        return freeze(build(*args, **kwargs))
+    return wrapper
 
 # Главное меню
-def get_main_menu() -> ReplyKeyboardMarkup:
-    """Главное меню бота"""
+def _build_main_menu() -> ReplyKeyboardMarkup:
     keyboard = ReplyKeyboardMarkup(
         keyboard=[
             [
@@ -25,29 +85,60 @@ def get_main_menu() -> ReplyKeyboardMarkup:
     )
     return keyboard
 
+_MAIN_MENU = freeze(_build_main_menu())
+
+def get_main_menu() -> ReplyKeyboardMarkup:
+    """Главное меню бота"""
+    return _MAIN_MENU
+
 # Клавиатуры для трекера привычек
+_HABITS_MENU_ACTIONS = (
+    InlineKeyboardButton(text="➕ Добавить привычку", callback_data="habit_add"),
+    InlineKeyboardButton(text="🗑️ Удалить привычку", callback_data="habit_delete")
+)
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+@_frozen
+def _habits_menu(habits: tuple) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    
+    for habit_id, habit_name, streak in habits:
+        builder.row(
+            InlineKeyboardButton(
+                text=f"✅ {habit_name} ({streak} дней)",
+                callback_data=HabitComplete(habit_id).pack()
+            )
+        )
+    
+    builder.row(*_HABITS_MENU_ACTIONS)
+    return builder.as_markup()
+
 def get_habits_menu(habits: List[tuple]) -> InlineKeyboardMarkup:
     """Меню управления привычками"""
+    return _habits_menu(tuple(tuple(habit) for habit in habits or ()))
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+@_frozen
+def get_habits_page_menu(buttons: tuple, prev_page: Optional[HabitsPage] = None,
+                         next_page: Optional[HabitsPage] = None) -> InlineKeyboardMarkup:
+    """Страница списка привычек: buttons - ((habit_id, текст), ...) и навигация по курсорам"""
     builder = InlineKeyboardBuilder()
     
-    if habits:
-        for habit_id, habit_name, streak in habits:
-            builder.row(
-                InlineKeyboardButton(
-                    text=f"✅ {habit_name} ({streak} дней)",
-                    callback_data=f"habit_complete_{habit_id}"
-                )
-            )
+    for habit_id, text in buttons:
+        builder.row(InlineKeyboardButton(text=text, callback_data=HabitComplete(habit_id).pack()))
     
-    builder.row(
-        InlineKeyboardButton(text="➕ Добавить привычку", callback_data="habit_add"),
-        InlineKeyboardButton(text="🗑️ Удалить привычку", callback_data="habit_delete")
-    )
+    navigation = []
+    if prev_page is not None:
+        navigation.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=prev_page.pack()))
+    if next_page is not None:
+        navigation.append(InlineKeyboardButton(text="Дальше ➡️", callback_data=next_page.pack()))
+    if navigation:
+        builder.row(*navigation)
     
+    builder.row(_HABITS_MENU_ACTIONS[0])
     return builder.as_markup()
 
-def get_habit_creation_confirmation() -> InlineKeyboardMarkup:
-    """Подтверждение создания привычки"""
+def _build_habit_creation_confirmation() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.row(
         InlineKeyboardButton(text="✅ Создать", callback_data="confirm_habit"),
@@ -55,8 +146,13 @@ def get_habit_creation_confirmation() -> InlineKeyboardMarkup:
     )
     return builder.as_markup()
 
-def get_frequency_keyboard() -> ReplyKeyboardMarkup:
-    """Клавиатура для выбора частоты привычки"""
+_HABIT_CREATION_CONFIRMATION = freeze(_build_habit_creation_confirmation())
+
+def get_habit_creation_confirmation() -> InlineKeyboardMarkup:
+    """Подтверждение создания привычки"""
+    return _HABIT_CREATION_CONFIRMATION
+
+def _build_frequency_keyboard() -> ReplyKeyboardMarkup:
     keyboard = ReplyKeyboardMarkup(
         keyboard=[
             [
@@ -77,8 +173,13 @@ def get_frequency_keyboard() -> ReplyKeyboardMarkup:
     )
     return keyboard
 
-def get_skip_cancel_keyboard() -> ReplyKeyboardMarkup:
-    """Клавиатура для пропуска или отмены"""
+_FREQUENCY_KEYBOARD = freeze(_build_frequency_keyboard())
+
+def get_frequency_keyboard() -> ReplyKeyboardMarkup:
+    """Клавиатура для выбора частоты привычки"""
+    return _FREQUENCY_KEYBOARD
+
+def _build_skip_cancel_keyboard() -> ReplyKeyboardMarkup:
     keyboard = ReplyKeyboardMarkup(
         keyboard=[
             [
@@ -91,8 +192,13 @@ def get_skip_cancel_keyboard() -> ReplyKeyboardMarkup:
     )
     return keyboard
 
-def get_cancel_keyboard() -> ReplyKeyboardMarkup:
-    """Клавиатура для отмены действия"""
+_SKIP_CANCEL_KEYBOARD = freeze(_build_skip_cancel_keyboard())
+
+def get_skip_cancel_keyboard() -> ReplyKeyboardMarkup:
+    """Клавиатура для пропуска или отмены"""
+    return _SKIP_CANCEL_KEYBOARD
+
+def _build_cancel_keyboard() -> ReplyKeyboardMarkup:
     keyboard = ReplyKeyboardMarkup(
         keyboard=[[KeyboardButton(text="❌ Отмена")]],
         resize_keyboard=True,
@@ -100,21 +206,28 @@ def get_cancel_keyboard() -> ReplyKeyboardMarkup:
     )
     return keyboard
 
+_CANCEL_KEYBOARD = freeze(_build_cancel_keyboard())
+
+def get_cancel_keyboard() -> ReplyKeyboardMarkup:
+    """Клавиатура для отмены действия"""
+    return _CANCEL_KEYBOARD
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+@_frozen
 def get_habit_confirmation(habit_id: int, habit_name: str) -> InlineKeyboardMarkup:
     """Подтверждение выполнения привычки"""
     builder = InlineKeyboardBuilder()
     builder.row(
         InlineKeyboardButton(
             text=f"✅ Я сделал(а) это!",
-            callback_data=f"habit_confirm_{habit_id}"
+            callback_data=HabitConfirm(habit_id).pack()
         )
     )
     builder.row(InlineKeyboardButton(text="❌ Отмена", callback_data="habits_menu"))
     return builder.as_markup()
 
 # Клавиатуры для гороскопа
-def get_zodiac_signs() -> InlineKeyboardMarkup:
-    """Выбор знака зодиака"""
+def _build_zodiac_signs() -> InlineKeyboardMarkup:
     zodiac_signs = [
         ("♈ Овен", "aries"), ("♉ Телец", "taurus"), ("♊ Близнецы", "gemini"),
         ("♋ Рак", "cancer"), ("♌ Лев", "leo"), ("♍ Дева", "virgo"),
@@ -129,27 +242,33 @@ def get_zodiac_signs() -> InlineKeyboardMarkup:
         row_buttons = []
         for sign_text, sign_callback in zodiac_signs[i:i+2]:
             row_buttons.append(
-                InlineKeyboardButton(text=sign_text, callback_data=f"horoscope_{sign_callback}")
+                InlineKeyboardButton(text=sign_text, callback_data=HoroscopeSign(sign_callback).pack())
             )
         builder.row(*row_buttons)
     
     builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data="main_menu"))
     return builder.as_markup()
 
+_ZODIAC_SIGNS = freeze(_build_zodiac_signs())
+
+def get_zodiac_signs() -> InlineKeyboardMarkup:
+    """Выбор знака зодиака"""
+    return _ZODIAC_SIGNS
+
 # Клавиатуры для подписок
-def get_subscriptions_menu(subscriptions: List[tuple]) -> InlineKeyboardMarkup:
-    """Меню управления подписками"""
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+@_frozen
+def _subscriptions_menu(subscriptions: tuple) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     
-    if subscriptions:
-        for sub_id, name, price, days_left in subscriptions:
-            status_emoji = "🟢" if days_left > 0 else "🔴"
-            builder.row(
-                InlineKeyboardButton(
-                    text=f"{status_emoji} {name} - {price}₽ ({days_left} дней)",
-                    callback_data=f"subscription_info_{sub_id}"
-                )
+    for sub_id, name, price, days_left in subscriptions:
+        status_emoji = "🟢" if days_left > 0 else "🔴"
+        builder.row(
+            InlineKeyboardButton(
+                text=f"{status_emoji} {name} - {price}₽ ({days_left} дней)",
+                callback_data=SubscriptionInfo(sub_id).pack()
             )
+        )
     
     builder.row(
         InlineKeyboardButton(text="➕ Добавить подписку", callback_data="subscription_add"),
@@ -158,9 +277,12 @@ def get_subscriptions_menu(subscriptions: List[tuple]) -> InlineKeyboardMarkup:
     
     return builder.as_markup()
 
+def get_subscriptions_menu(subscriptions: List[tuple]) -> InlineKeyboardMarkup:
+    """Меню управления подписками"""
+    return _subscriptions_menu(tuple(tuple(subscription) for subscription in subscriptions or ()))
+
 # Клавиатуры для новостей
-def get_news_categories() -> InlineKeyboardMarkup:
-    """Выбор категории новостей"""
+def _build_news_categories() -> InlineKeyboardMarkup:
     categories = [
         ("💻 IT", "it"),
         ("₿ Криптовалюты", "crypto"), 
@@ -175,20 +297,27 @@ def get_news_categories() -> InlineKeyboardMarkup:
         builder.row(
             InlineKeyboardButton(
                 text=category_text,
-                callback_data=f"news_category_{category_callback}"
+                callback_data=NewsCategory(category_callback).pack()
             )
         )
     
     builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data="main_menu"))
     return builder.as_markup()
 
+_NEWS_CATEGORIES = freeze(_build_news_categories())
+
+def get_news_categories() -> InlineKeyboardMarkup:
+    """Выбор категории новостей"""
+    return _NEWS_CATEGORIES
+
 # Клавиатуры для настроек
-def get_settings_menu(user_settings: dict) -> InlineKeyboardMarkup:
-    """Меню настроек"""
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+@_frozen
+def _settings_menu(notifications: bool, notif_time: str, timezone: str) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     
     # Уведомления
-    notif_status = "🔔 Вкл" if user_settings.get("notifications", True) else "🔕 Выкл"
+    notif_status = "🔔 Вкл" if notifications else "🔕 Выкл"
     builder.row(
         InlineKeyboardButton(
             text=f"Уведомления: {notif_status}",
@@ -197,7 +326,6 @@ def get_settings_menu(user_settings: dict) -> InlineKeyboardMarkup:
     )
     
     # Время уведомлений
-    notif_time = user_settings.get("notification_time", "09:00")
     builder.row(
         InlineKeyboardButton(
             text=f"⏰ Время уведомлений: {notif_time}",
@@ -206,7 +334,6 @@ def get_settings_menu(user_settings: dict) -> InlineKeyboardMarkup:
     )
     
     # Часовой пояс
-    timezone = user_settings.get("timezone", "UTC")
     builder.row(
         InlineKeyboardButton(
             text=f"🌍 Часовой пояс: {timezone}",
@@ -217,7 +344,17 @@ def get_settings_menu(user_settings: dict) -> InlineKeyboardMarkup:
     builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data="main_menu"))
     return builder.as_markup()
 
+def get_settings_menu(user_settings: dict) -> InlineKeyboardMarkup:
+    """Меню настроек"""
+    return _settings_menu(
+        bool(user_settings.get("notifications", True)),
+        str(user_settings.get("notification_time", "09:00")),
+        str(user_settings.get("timezone", "UTC"))
+    )
+
 # Универсальная клавиатура подтверждения
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+@_frozen
 def get_confirmation_keyboard(action: str, item_id: Optional[int] = None) -> InlineKeyboardMarkup:
     """Универсальная клавиатура для подтверждения действий"""
     builder = InlineKeyboardBuilder()
@@ -234,8 +371,25 @@ def get_confirmation_keyboard(action: str, item_id: Optional[int] = None) -> Inl
     return builder.as_markup()
 
 # Клавиатура отмены действия
-def get_cancel_inline_keyboard() -> InlineKeyboardMarkup:
-    """Inline клавиатура для отмены действия"""
+def _build_cancel_inline_keyboard() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.row(InlineKeyboardButton(text="❌ Отмена", callback_data="cancel"))
-    return builder.as_markup()
\ No newline at end of file
+    return builder.as_markup()
+
+_CANCEL_INLINE_KEYBOARD = freeze(_build_cancel_inline_keyboard())
+
+def get_cancel_inline_keyboard() -> InlineKeyboardMarkup:
+    """Inline клавиатура для отмены действия"""
+    return _CANCEL_INLINE_KEYBOARD
+
+def keyboard_cache_info() -> dict:
+    """Статистика кэшей динамических клавиатур (для /perf)"""
+    caches = {
+        "habits_menu": _habits_menu,
+        "habits_page": get_habits_page_menu,
+        "habit_confirmation": get_habit_confirmation,
+        "subscriptions_menu": _subscriptions_menu,
+        "settings_menu": _settings_menu,
+        "confirmation": get_confirmation_keyboard,
+    }
+    return {name: cache.cache_info()._asdict() for name, cache in caches.items()}
@@ -6,6 +6,14 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from config import get_settings
 import json
 
+class LLMError(Exception):
+    """Ответ OpenRouter без текста: code - error из chat_completion"""
+
+    def __init__(self, code: str, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
 class OpenRouterClient:
     def __init__(self):
         self.settings = get_settings()
@@ -22,32 +30,25 @@ class OpenRouterClient:
             await self.session.close()
 
     async def check_daily_limit(self, user_id: int, db: AsyncSession) -> tuple[bool, int]:
-        """Проверяет дневной лимит AI-запросов пользователя"""
+        """Проверяет дневной лимит AI-запросов пользователя (только чтение)"""
         from models.user import User
         
         user = await db.get(User, user_id)
         if not user:
             return False, 0
         
-        today = date.today()
-        if user.last_ai_request_date != today:
-            user.daily_ai_requests = 0
-            user.last_ai_request_date = today
-        
+        # Счетчик прошлого дня считаем нулевым; сам сброс делает increment_usage
         daily_limit = 5  # Бесплатный лимит
-        requests_used = user.daily_ai_requests
+        requests_used = user.daily_ai_requests if user.last_ai_request_date == date.today() else 0
         
         return requests_used < daily_limit, daily_limit - requests_used
 
-    async def increment_usage(self, user_id: int, db: AsyncSession):
-        """Увеличивает счетчик использованных AI-запросов"""
-        from models.user import User
+    async def increment_usage(self, user_id: int, db: AsyncSession) -> Optional[int]:
+        """Увеличивает счетчик AI-запросов одним UPDATE через писателя, возвращает запросы за сегодня"""
+        from core.counters import increment_ai_usage
+        from core.writer import db_writer
         
-        user = await db.get(User, user_id)
-        if user:
-            user.daily_ai_requests += 1
-            user.total_ai_requests += 1
-            await db.commit()
+        return await db_writer.submit(lambda write_db: increment_ai_usage(write_db, user_id))
 
     async def chat_completion(
         self, 
@@ -69,6 +70,19 @@ class OpenRouterClient:
                 "remaining": remaining
             }
 
+        result = await self.request_completion(messages, model, temperature)
+        if "error" not in result:
+            # Увеличиваем счетчик использования
+            await self.increment_usage(user_id, db)
+        return result
+
+    async def request_completion(
+        self,
+        messages: list[dict],
+        model: Optional[str] = None,
+        temperature: float = 0.7
+    ) -> Dict[str, Any]:
+        """Запрос к OpenRouter без лимитов пользователя (фоновые задачи бота)"""
         headers = {
             "Authorization": f"Bearer {self.settings.OPENROUTER_API_KEY}",
             "Content-Type": "application/json",
@@ -93,10 +107,7 @@ class OpenRouterClient:
             ) as response:
                 
                 if response.status == 200:
-                    result = await response.json()
-                    # Увеличиваем счетчик использования
-                    await self.increment_usage(user_id, db)
-                    return result
+                    return await response.json()
                 else:
                     error_text = await response.text()
                     return {
@@ -116,28 +127,44 @@ class OpenRouterClient:
                 "message": f"Неизвестная ошибка: {str(e)}"
             }
 
-    async def generate_horoscope(self, zodiac_sign: str, user_id: int, db: AsyncSession) -> str:
-        """Генерирует гороскоп для знака зодиака"""
-        
+    @staticmethod
+    def _horoscope_messages(zodiac_sign: str) -> list[dict]:
         prompt = f"""Напиши смешной, но мотивирующий гороскоп для знака {zodiac_sign} на сегодня. 
         Гороскоп должен быть коротким (2-3 предложения), позитивным и немного юмористическим.
         Используй эмодзи для настроения."""
         
-        messages = [
+        return [
             {"role": "system", "content": "Ты астролог с отличным чувством юмора."},
             {"role": "user", "content": prompt}
         ]
-        
-        result = await self.chat_completion(messages, user_id, db)
-        
+
+    async def generate_horoscope_text(self, zodiac_sign: str, user_id: int, db: AsyncSession) -> str:
+        """Генерирует гороскоп; при ошибке или исчерпанном лимите - LLMError (текст ошибки не кэшируется)"""
+        result = await self.chat_completion(self._horoscope_messages(zodiac_sign), user_id, db)
+        return self._horoscope_content(result)
+
+    async def generate_daily_horoscope(self, zodiac_sign: str) -> str:
+        """Гороскоп для предгенерации: общий для всех, поэтому без лимита пользователя"""
+        result = await self.request_completion(self._horoscope_messages(zodiac_sign))
+        return self._horoscope_content(result)
+
+    @staticmethod
+    def _horoscope_content(result: Dict[str, Any]) -> str:
         if "error" in result:
-            return f"⚠️ {result['message']}"
+            raise LLMError(result["error"], result["message"])
         
         try:
             content = result["choices"][0]["message"]["content"]
             return content.strip()
         except (KeyError, IndexError):
-            return "⚠️ Не удалось сгенерировать гороскоп. Попробуйте позже."
+            raise LLMError("bad_response", "Не удалось сгенерировать гороскоп. Попробуйте позже.")
+
+    async def generate_horoscope(self, zodiac_sign: str, user_id: int, db: AsyncSession) -> str:
+        """Генерирует гороскоп для знака зодиака"""
+        try:
+            return await self.generate_horoscope_text(zodiac_sign, user_id, db)
+        except LLMError as e:
+            return f"⚠️ {e.message}"
 
     async def summarize_news(self, news_text: str, user_id: int, db: AsyncSession) -> str:
         """Создает краткую выжимку из новостей"""